@@ -0,0 +1,247 @@
+"""
+Índice de autocompletado en memoria por empresa (tenant).
+
+Cada empresa tiene un trie de prefijos por tipo de entidad (users, clients,
+projects). El índice se carga de forma perezosa desde MongoDB la primera vez
+que se consulta una empresa y luego se mantiene sincronizado desde los
+endpoints de creación/edición/eliminación. Como cada worker tiene su propia
+copia, esos endpoints suben la versión `autocomplete` de la empresa (ver
+cache_versions.py) y los demás workers recargan el índice de esa empresa en
+su siguiente consulta. Además se recarga completo después de `ttl_seconds`
+para absorber escrituras hechas por scripts.
+"""
+import asyncio
+import heapq
+import re
+import time
+import unicodedata
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from cache_versions import AUTOCOMPLETE, CacheVersions, VersionedCompanies
+
+ENTITY_TYPES = ("users", "clients", "projects")
+
+# Campos que se indexan por tipo de entidad
+_SEARCH_FIELDS = {
+    "users": ("name", "full_name", "email"),
+    "clients": ("name", "company_name", "email"),
+    "projects": ("name", "client_name"),
+}
+
+# Proyección mínima usada al cargar cada colección
+_LOAD_PROJECTIONS = {
+    "users": {"_id": 0, "id": 1, "name": 1, "full_name": 1, "email": 1, "role": 1, "status": 1},
+    "clients": {"_id": 0, "id": 1, "name": 1, "company_name": 1, "email": 1, "status": 1},
+    "projects": {"_id": 0, "id": 1, "name": 1, "client_name": 1, "client_id": 1, "assigned_users": 1, "status": 1},
+}
+
+_TOKEN_RE = re.compile(r"[^\w]+")
+
+
+def normalize(text: Any) -> str:
+    """Lowercase and strip accents so 'Gestión' matches 'gestion'"""
+    if not text:
+        return ""
+    decomposed = unicodedata.normalize("NFKD", str(text))
+    return "".join(c for c in decomposed if not unicodedata.combining(c)).lower().strip()
+
+
+def tokenize(text: Any) -> List[str]:
+    return [t for t in _TOKEN_RE.split(normalize(text)) if t]
+
+
+class PrefixTrie:
+    """Trie where every node keeps the ids of all entries below it"""
+
+    __slots__ = ("root",)
+
+    def __init__(self):
+        self.root: Dict[str, Any] = {"ids": set(), "children": {}}
+
+    def insert(self, key: str, entry_id: str):
+        node = self.root
+        for char in key:
+            node = node["children"].setdefault(char, {"ids": set(), "children": {}})
+            node["ids"].add(entry_id)
+
+    def remove(self, key: str, entry_id: str):
+        path = []
+        node = self.root
+        for char in key:
+            child = node["children"].get(char)
+            if child is None:
+                return
+            path.append((node, char, child))
+            node = child
+        # Limpiar de abajo hacia arriba, podando nodos vacíos
+        for parent, char, child in reversed(path):
+            child["ids"].discard(entry_id)
+            if not child["ids"] and not child["children"]:
+                del parent["children"][char]
+
+    def search(self, prefix: str) -> set:
+        node = self.root
+        for char in prefix:
+            node = node["children"].get(char)
+            if node is None:
+                return set()
+        return node["ids"]
+
+
+class TenantIndex:
+    """Tries and entries for a single company"""
+
+    def __init__(self):
+        self.entries: Dict[str, Dict[str, dict]] = {kind: {} for kind in ENTITY_TYPES}
+        self.tries: Dict[str, PrefixTrie] = {kind: PrefixTrie() for kind in ENTITY_TYPES}
+        self.keys: Dict[str, Dict[str, set]] = {kind: {} for kind in ENTITY_TYPES}
+        self.loaded_at = time.monotonic()
+
+    def upsert(self, kind: str, doc: dict):
+        entry_id = doc.get("id")
+        if not entry_id:
+            return
+        self.remove(kind, entry_id)
+
+        keys = set()
+        for field in _SEARCH_FIELDS[kind]:
+            value = doc.get(field)
+            if not value:
+                continue
+            if field == "email":
+                value = str(value).split("@")[0]
+            keys.update(tokenize(value))
+
+        trie = self.tries[kind]
+        for key in keys:
+            trie.insert(key, entry_id)
+        self.keys[kind][entry_id] = keys
+        self.entries[kind][entry_id] = doc
+
+    def remove(self, kind: str, entry_id: str):
+        keys = self.keys[kind].pop(entry_id, None)
+        if keys is None:
+            return
+        trie = self.tries[kind]
+        for key in keys:
+            trie.remove(key, entry_id)
+        self.entries[kind].pop(entry_id, None)
+
+    def search(self, kind: str, tokens: List[str]) -> set:
+        trie = self.tries[kind]
+        # Cada palabra de la consulta debe ser prefijo de alguna palabra del registro
+        result = None
+        for token in sorted(tokens, key=len, reverse=True):
+            ids = trie.search(token)
+            result = set(ids) if result is None else result & ids
+            if not result:
+                return set()
+        return result or set()
+
+
+def _label(kind: str, doc: dict) -> str:
+    if kind == "users":
+        return doc.get("name") or doc.get("full_name") or doc.get("email") or ""
+    return doc.get("name") or ""
+
+
+def _sublabel(kind: str, doc: dict) -> Optional[str]:
+    if kind == "users":
+        return doc.get("email")
+    if kind == "clients":
+        return doc.get("company_name") or doc.get("email")
+    return doc.get("client_name")
+
+
+class AutocompleteIndex:
+    """Per-tenant prefix index for users, clients and projects"""
+
+    def __init__(self, ttl_seconds: int = 300, versions: Optional[CacheVersions] = None):
+        self.ttl_seconds = ttl_seconds
+        self._tenants: Dict[str, TenantIndex] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._versions = VersionedCompanies(versions, AUTOCOMPLETE)
+
+    def _is_fresh(self, company_id: str) -> bool:
+        tenant = self._tenants.get(company_id)
+        return tenant is not None and time.monotonic() - tenant.loaded_at < self.ttl_seconds
+
+    async def ensure_loaded(self, db, company_id: str):
+        if not await self._versions.check(db, company_id):
+            self._tenants.pop(company_id, None)
+        if self._is_fresh(company_id):
+            return
+        lock = self._locks.setdefault(company_id, asyncio.Lock())
+        async with lock:
+            if self._is_fresh(company_id):
+                return
+            collections = (db.users, db.clients, db.projects)
+            results = await asyncio.gather(*[
+                collection.find({"company_id": company_id}, _LOAD_PROJECTIONS[kind]).to_list(None)
+                for kind, collection in zip(ENTITY_TYPES, collections)
+            ])
+            tenant = TenantIndex()
+            for kind, docs in zip(ENTITY_TYPES, results):
+                for doc in docs:
+                    tenant.upsert(kind, doc)
+            self._tenants[company_id] = tenant
+
+    def upsert(self, company_id: Optional[str], kind: str, doc: dict):
+        """Apply a write to a loaded tenant; unloaded tenants pick it up on first load"""
+        tenant = self._tenants.get(company_id) if company_id else None
+        if tenant is None:
+            return
+        projection = _LOAD_PROJECTIONS[kind]
+        tenant.upsert(kind, {k: v for k, v in doc.items() if k in projection and k != "_id"})
+
+    def remove(self, company_id: Optional[str], kind: str, entry_id: str):
+        tenant = self._tenants.get(company_id) if company_id else None
+        if tenant is not None:
+            tenant.remove(kind, entry_id)
+
+    def entries(self, company_id: str, kind: str) -> Iterable[dict]:
+        tenant = self._tenants.get(company_id)
+        return tenant.entries[kind].values() if tenant is not None else ()
+
+    def invalidate(self, company_id: Optional[str] = None):
+        if company_id is None:
+            self._tenants.clear()
+        else:
+            self._tenants.pop(company_id, None)
+
+    def search(
+        self,
+        company_id: str,
+        query: str,
+        kinds: Iterable[str] = ENTITY_TYPES,
+        limit: int = 10,
+        allow: Optional[Callable[[str, dict], bool]] = None
+    ) -> Dict[str, List[dict]]:
+        """Return the top `limit` matches per kind, prefix matches on the full label first"""
+        tenant = self._tenants.get(company_id)
+        tokens = tokenize(query)
+        normalized_query = normalize(query)
+        results: Dict[str, List[dict]] = {}
+
+        for kind in kinds:
+            if kind not in ENTITY_TYPES:
+                continue
+            if tenant is None or not tokens:
+                results[kind] = []
+                continue
+
+            entries = tenant.entries[kind]
+            candidates = (entries[i] for i in tenant.search(kind, tokens))
+            if allow is not None:
+                candidates = (doc for doc in candidates if allow(kind, doc))
+
+            def rank(doc, kind=kind):
+                label = normalize(_label(kind, doc))
+                return (not label.startswith(normalized_query), label)
+
+            results[kind] = [
+                {"id": doc["id"], "type": kind[:-1], "label": _label(kind, doc), "sublabel": _sublabel(kind, doc)}
+                for doc in heapq.nsmallest(limit, candidates, key=rank)
+            ]
+
+        return results
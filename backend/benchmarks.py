@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmarks de los helpers más usados del backend multitenant.
+
+Cada benchmark se calibra para que una ronda dure al menos --min-time
+segundos, se repite --rounds veces y se reporta el tiempo por operación
+(mínimo, mediana, desviación) y ops/s. La comparación contra un baseline usa
+la mediana.
+
+Uso:
+    python benchmarks.py                                   # correr todo
+    python benchmarks.py -k jwt -k progress                # filtrar por nombre
+    python benchmarks.py --save benchmarks_baseline.json   # guardar baseline
+    python benchmarks.py --baseline benchmarks_baseline.json --max-regression 15
+    python benchmarks.py -k records --memory               # + memoria por 10k tareas
+
+Sale con código 1 si algún benchmark es más lento que el baseline en más de
+--max-regression por ciento. Los baselines solo son comparables en la misma
+máquina y versión de Python.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+ROOT_DIR = Path(__file__).parent
+sys.path.insert(0, str(ROOT_DIR))
+
+# Importar el servidor no abre conexiones: Motor conecta de forma perezosa
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "pactum_benchmarks")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+import jwt  # noqa: E402
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+
+import server_multitenant as server  # noqa: E402
+from records import TaskRecord, dumps_records  # noqa: E402
+
+BENCHMARKS: Dict[str, Callable[[], Callable[[], object]]] = {}
+
+
+def benchmark(name: str):
+    """Register a setup function that returns the callable to time"""
+    def decorator(setup):
+        BENCHMARKS[name] = setup
+        return setup
+    return decorator
+
+
+def _tasks(count: int, users: List[dict], rng: random.Random) -> List[dict]:
+    statuses = ["backlog", "todo", "in_progress", "review", "done"]
+    return [
+        {"id": f"task-{i}", "title": f"Tarea {i}", "status": rng.choice(statuses),
+         "assigned_to": rng.choice(users)["id"] if rng.random() < 0.9 else None}
+        for i in range(count)
+    ]
+
+
+# ===================== AUTH =====================
+
+@benchmark("auth.create_token")
+def bench_create_token():
+    return lambda: server.create_token("user-id", "user@example.com", "TEAM_MEMBER", "company-id")
+
+
+@benchmark("auth.jwt_decode")
+def bench_jwt_decode():
+    token = server.create_token("user-id", "user@example.com", "TEAM_MEMBER", "company-id")
+    return lambda: jwt.decode(token, server.JWT_SECRET, algorithms=[server.JWT_ALGORITHM])
+
+
+@benchmark("auth.verify_password")
+def bench_verify_password():
+    hashed = server.hash_password("Benchmark2026!")
+    return lambda: server.verify_password("Benchmark2026!", hashed)
+
+
+# ===================== TASKS =====================
+
+@benchmark("tasks.compute_project_progress[1000]")
+def bench_project_progress():
+    tasks = _tasks(1000, [{"id": "u"}], random.Random(1))
+    return lambda: server.compute_project_progress(tasks)
+
+
+@benchmark("tasks.enrich_assignee_names[1000x50]")
+def bench_enrich_assignee_names():
+    rng = random.Random(2)
+    users = [{"id": f"user-{i}", "name": f"Usuario {i}"} for i in range(50)]
+    tasks = _tasks(1000, users, rng)
+    return lambda: server.enrich_assignee_names(tasks, users)
+
+
+# ===================== RECORDS =====================
+
+def _task_docs(count: int, rng: random.Random) -> List[dict]:
+    """Task documents as Motor returns them for GET /tasks (every field set)"""
+    statuses = ["backlog", "todo", "in_progress", "review", "done"]
+    created = datetime(2026, 1, 1, tzinfo=timezone.utc).isoformat()
+    return [
+        {"id": f"task-{i:06d}", "project_id": f"project-{i % 20}", "title": f"Tarea {i}: revisar entregable",
+         "description": "Descripción de la tarea con algo de detalle " * 2, "status": rng.choice(statuses),
+         "priority": rng.choice(["low", "medium", "high"]), "assigned_to": f"user-{rng.randrange(50)}",
+         "assigned_to_name": f"Usuario {rng.randrange(50)}", "estimated_hours": rng.randint(1, 40),
+         "estimated_minutes": 0, "actual_hours": 0, "due_date": "2026-03-01", "tags": ["backend", "api"],
+         "technical_notes": None, "attachments": [], "task_group_id": None,
+         "created_by": "user-0", "created_at": created, "updated_at": created}
+        for i in range(count)
+    ]
+
+
+@benchmark("records.tasks_encode_dicts[1000]")
+def bench_tasks_encode_dicts():
+    # Lo que hacía FastAPI con la lista de dicts: jsonable_encoder + JSONResponse.render
+    tasks = _task_docs(1000, random.Random(6))
+    return lambda: json.dumps(jsonable_encoder(tasks), ensure_ascii=False, allow_nan=False,
+                              indent=None, separators=(",", ":")).encode("utf-8")
+
+
+@benchmark("records.tasks_decode_encode[1000]")
+def bench_tasks_decode_encode():
+    tasks = _task_docs(1000, random.Random(6))
+    return lambda: dumps_records(TaskRecord.from_docs(tasks))
+
+
+@benchmark("records.tasks_decode[1000]")
+def bench_tasks_decode():
+    tasks = _task_docs(1000, random.Random(6))
+    return lambda: TaskRecord.from_docs(tasks)
+
+
+def memory_per_10k_tasks() -> Dict[str, int]:
+    """Bytes allocated to hold 10k tasks as dicts vs TaskRecord (values shared, containers counted)"""
+    docs = _task_docs(10_000, random.Random(7))
+    results = {}
+    for name, build in (("dicts", lambda: [dict(doc) for doc in docs]), ("records", lambda: TaskRecord.from_docs(docs))):
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        held = build()
+        results[name] = tracemalloc.get_traced_memory()[0] - before
+        tracemalloc.stop()
+        del held
+    return results
+
+
+# ===================== ACCOUNTS RECEIVABLE =====================
+
+@benchmark("receivables.summarize[1000]")
+def bench_receivables_summary():
+    rng = random.Random(3)
+    accounts = [
+        {"amount": float(rng.randint(100, 50000)), "paid_amount": float(rng.randint(0, 100)),
+         "status": rng.choice(["pending", "paid", "overdue", "partial"]),
+         "is_partner": rng.random() < 0.2, "partner_percentage": 30.0}
+        for _ in range(1000)
+    ]
+    return lambda: server.summarize_accounts_receivable(accounts)
+
+
+# ===================== UPLOADS =====================
+
+@benchmark("uploads.to_data_url[1MB]")
+def bench_data_url_1mb():
+    content = random.Random(4).randbytes(1024 * 1024)
+    return lambda: server.to_data_url(content, "image/png")
+
+
+@benchmark("uploads.to_data_url[5MB]")
+def bench_data_url_5mb():
+    content = random.Random(5).randbytes(5 * 1024 * 1024)
+    return lambda: server.to_data_url(content, "audio/webm")
+
+
+# ===================== RUNNER =====================
+
+def measure(func: Callable[[], object], rounds: int, min_time: float) -> dict:
+    # Calibrar cuántas llamadas entran en una ronda de al menos min_time
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time or number >= 1_000_000:
+            break
+        number = max(number * 2, int(number * min_time / max(elapsed, 1e-9) * 1.1))
+
+    samples = [elapsed / number]
+    for _ in range(rounds - 1):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        samples.append((time.perf_counter() - start) / number)
+
+    median = statistics.median(samples)
+    return {
+        "median_us": round(median * 1e6, 3),
+        "min_us": round(min(samples) * 1e6, 3),
+        "stdev_us": round(statistics.stdev(samples) * 1e6, 3) if len(samples) > 1 else 0.0,
+        "ops_per_sec": round(1 / median, 1) if median else 0.0,
+        "rounds": rounds,
+        "iterations": number,
+    }
+
+
+def compare(results: Dict[str, dict], baseline: dict, max_regression: float) -> List[str]:
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get("benchmarks", {}).get(name)
+        if not previous or not previous.get("median_us"):
+            continue
+        change = (current["median_us"] - previous["median_us"]) / previous["median_us"] * 100
+        current["change_pct"] = round(change, 1)
+        if change > max_regression:
+            regressions.append(f"{name}: {previous['median_us']}µs -> {current['median_us']}µs (+{change:.1f}%)")
+    return regressions
+
+
+def bcrypt_rounds() -> Optional[int]:
+    parts = server.hash_password("x").split("$")
+    return int(parts[2]) if len(parts) > 2 and parts[2].isdigit() else None
+
+
+def main(args) -> int:
+    selected = [name for name in BENCHMARKS if not args.k or any(k in name for k in args.k)]
+    if not selected:
+        print("Ningún benchmark coincide con el filtro")
+        return 1
+
+    baseline = json.loads(Path(args.baseline).read_text()) if args.baseline else None
+    results: Dict[str, dict] = {}
+    print(f"{'benchmark':<42} {'median':>12} {'min':>12} {'stdev':>10} {'ops/s':>12}")
+    for name in selected:
+        results[name] = measure(BENCHMARKS[name](), args.rounds, args.min_time)
+        r = results[name]
+        print(f"{name:<42} {r['median_us']:>10.2f}µs {r['min_us']:>10.2f}µs {r['stdev_us']:>8.2f}µs {r['ops_per_sec']:>12,.1f}")
+
+    memory = None
+    if args.memory:
+        memory = memory_per_10k_tasks()
+        print(f"\nMemoria por 10k tareas: dicts {memory['dicts'] / 1024 / 1024:.2f} MB, "
+              f"records {memory['records'] / 1024 / 1024:.2f} MB "
+              f"({(1 - memory['records'] / memory['dicts']) * 100:.0f}% menos)")
+
+    if args.save:
+        Path(args.save).write_text(json.dumps({
+            "meta": {
+                "timestamp": datetime.now(timezone.utc).isoformat(),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "bcrypt_rounds": bcrypt_rounds(),
+            },
+            "benchmarks": results,
+            **({"memory_per_10k_tasks": memory} if memory else {}),
+        }, indent=2, ensure_ascii=False))
+        print(f"Resultados guardados en {args.save}")
+
+    if baseline is not None:
+        regressions = compare(results, baseline, args.max_regression)
+        if regressions:
+            print(f"\nRegresiones mayores a {args.max_regression}% respecto a {args.baseline}:")
+            for line in regressions:
+                print(f"  - {line}")
+            return 1
+        print(f"\nSin regresiones mayores a {args.max_regression}% respecto a {args.baseline}")
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Micro-benchmarks del backend")
+    parser.add_argument("-k", action="append", help="Correr solo benchmarks cuyo nombre contenga este texto")
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--min-time", type=float, default=0.2, help="Duración mínima de cada ronda (s)")
+    parser.add_argument("--save", help="Guardar resultados como baseline JSON")
+    parser.add_argument("--baseline", help="Baseline JSON contra el cual comparar")
+    parser.add_argument("--memory", action="store_true", help="Medir también la memoria de 10k tareas (dicts vs records)")
+    parser.add_argument("--max-regression", type=float, default=float(os.environ.get("BENCHMARK_MAX_REGRESSION", "10")),
+                        help="Porcentaje de regresión tolerado sobre la mediana")
+    return parser
+
+
+if __name__ == "__main__":
+    sys.exit(main(build_parser().parse_args()))
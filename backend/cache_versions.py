@@ -0,0 +1,101 @@
+"""
+Versiones por empresa de los caches en memoria, compartidas entre workers.
+
+Los caches de proyectos visibles, reporte de carga, autocompletado y
+destinatarios de hitos viven en cada worker y se actualizan o invalidan en el
+worker que atiende la escritura. Para que los demás workers también se
+enteren, cada escritura incrementa en `cache_versions` la versión de los
+caches afectados de esa empresa (un documento por empresa, un campo por
+cache). Al leer, cada cache compara la versión con la que cargó sus datos y
+si cambió descarta lo de esa empresa y recarga.
+
+La versión de cada empresa se lee de Mongo como mucho una vez cada
+`check_seconds` por worker (1 por defecto, CACHE_VERSION_CHECK_SECONDS): un
+cambio hecho en otro worker se ve a más tardar en ese tiempo, en lugar del
+TTL de cada cache. El worker que hizo el cambio ya lo aplicó a su copia, así
+que no recarga salvo que otro worker haya cambiado algo en el medio. Los TTL
+siguen como red de seguridad para escrituras que no pasan por la API.
+"""
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from pymongo import ReturnDocument
+
+COLLECTION = "cache_versions"
+
+PROJECT_ACCESS = "project_access"
+WORKLOAD = "workload"
+AUTOCOMPLETE = "autocomplete"
+RECIPIENTS = "recipients"
+
+
+def company_key(company_id: Optional[str]) -> str:
+    # Usuarios sin empresa (SUPER_ADMIN) comparten una clave propia
+    return company_id if company_id is not None else "-"
+
+
+class CacheVersions:
+    def __init__(self, check_seconds: float = 1.0):
+        self.check_seconds = check_seconds
+        # empresa -> (leído en, {cache: versión})
+        self._known: Dict[str, Tuple[float, Dict[str, int]]] = {}
+        self._listeners: List[Callable[[str, str, int, int], None]] = []
+
+    def subscribe(self, listener: Callable[[str, str, int, int], None]):
+        """listener(company_key, cache, old, new) runs when this worker bumps a version it was up to date with"""
+        self._listeners.append(listener)
+
+    async def current(self, db, company_id: Optional[str], cache: str) -> int:
+        key = company_key(company_id)
+        known = self._known.get(key)
+        now = time.monotonic()
+        if known is None or now - known[0] >= self.check_seconds:
+            doc = await db[COLLECTION].find_one({"_id": key}, {"_id": 0})
+            known = self._known[key] = (now, {k: int(v) for k, v in (doc or {}).items()})
+        return known[1].get(cache, 0)
+
+    async def bump(self, db, company_id: Optional[str], *caches: str):
+        """Tell every worker that the company's data behind these caches changed"""
+        if not caches:
+            return
+        key = company_key(company_id)
+        doc = await db[COLLECTION].find_one_and_update(
+            {"_id": key}, {"$inc": {cache: 1 for cache in caches}},
+            projection={"_id": 0}, upsert=True, return_document=ReturnDocument.AFTER
+        )
+        versions = {k: int(v) for k, v in doc.items()}
+        previous = self._known.get(key, (0.0, {}))[1]
+        self._known[key] = (time.monotonic(), versions)
+        for cache in caches:
+            new = versions.get(cache, 0)
+            # Solo si nadie más cambió la versión desde la última lectura: este worker ya aplicó el cambio
+            if previous.get(cache, 0) == new - 1:
+                for listener in self._listeners:
+                    listener(key, cache, new - 1, new)
+
+
+class VersionedCompanies:
+    """The version of each company's data that one cache holds"""
+
+    def __init__(self, versions: Optional[CacheVersions], cache: str):
+        self.versions = versions
+        self.cache = cache
+        self._loaded: Dict[str, int] = {}
+        if versions is not None:
+            versions.subscribe(self._advance)
+
+    async def check(self, db, company_id: Optional[str]) -> bool:
+        """False when another worker changed the company since this cache loaded it; the caller
+        drops the company's entries and reloads (the new version is already recorded)"""
+        if self.versions is None:
+            return True
+        key = company_key(company_id)
+        version = await self.versions.current(db, company_id, self.cache)
+        if self._loaded.get(key) == version:
+            return True
+        self._loaded[key] = version
+        return False
+
+    def _advance(self, key: str, cache: str, old: int, new: int):
+        if cache == self.cache and self._loaded.get(key) == old:
+            self._loaded[key] = new
@@ -0,0 +1,210 @@
+"""
+Compresión gzip/Brotli de respuestas HTTP.
+
+Middleware ASGI puro (como MetricsMiddleware) para que también funcione con
+StreamingResponse. Solo se comprimen los tipos de `content_types` (JSON,
+texto, CSV, JS, SVG...) y nunca los que ya vienen comprimidos: PDF, imágenes,
+audio, video, zip y los .xlsx/.docx (que son zip). Tampoco respuestas que ya
+traen Content-Encoding, HEAD, 204/304 ni cuerpos de menos de `minimum_size`.
+
+Se usa Brotli cuando el cliente lo acepta y el paquete `brotli` está
+instalado; si no, gzip. En respuestas por partes se junta al menos
+`minimum_size` antes de decidir y después cada parte se comprime y se
+envía con flush, así el cliente recibe datos sin esperar el final.
+
+Comprimir un export grande lleva cientos de ms de CPU (se midieron ~270 ms en
+un cuerpo del tamaño de /tasks/export): las partes de `thread_min_size` bytes o
+más se comprimen en un thread con `asyncio.to_thread` para no frenar el event
+loop. zlib y brotli liberan el GIL mientras comprimen. Las respuestas chicas
+se comprimen en el loop, donde un thread costaría más que la compresión.
+
+Variables de entorno (leídas en los servidores):
+- COMPRESSION_MIN_SIZE: bytes mínimos para comprimir (1024 por defecto)
+- COMPRESSION_THREAD_MIN_SIZE: desde cuántos bytes se comprime en un thread (65536 por defecto)
+- COMPRESSION_GZIP_LEVEL: nivel de gzip (6 por defecto)
+- COMPRESSION_BROTLI_QUALITY: calidad de Brotli (4 por defecto)
+"""
+import asyncio
+import zlib
+from typing import Iterable, Optional
+
+from metrics import REGISTRY
+
+try:
+    import brotli
+except ImportError:  # dependencia opcional: sin ella solo gzip
+    brotli = None
+
+DEFAULT_CONTENT_TYPES = (
+    "application/json",
+    "application/javascript",
+    "application/x-ndjson",
+    "application/xml",
+    "image/svg+xml",
+    "text/",
+)
+
+# Ya comprimidos: comprimirlos de nuevo solo gasta CPU
+PRECOMPRESSED_PREFIXES = (
+    "application/pdf",
+    "application/zip",
+    "application/gzip",
+    "application/x-gzip",
+    "application/x-7z-compressed",
+    "application/x-rar-compressed",
+    "application/vnd.openxmlformats-officedocument.",
+    "application/octet-stream",
+    "image/",
+    "audio/",
+    "video/",
+    "font/woff",
+)
+
+COMPRESSED_RESPONSES = REGISTRY.counter("http_responses_compressed_total", "Responses compressed by encoding", ("encoding",))
+COMPRESSION_BYTES_IN = REGISTRY.counter("http_compression_bytes_in_total", "Response bytes before compression", ("encoding",))
+COMPRESSION_BYTES_OUT = REGISTRY.counter("http_compression_bytes_out_total", "Response bytes after compression", ("encoding",))
+
+
+def accepted_encoding(accept_encoding: str, brotli_available: bool = True) -> Optional[str]:
+    """Best of br/gzip that the Accept-Encoding header allows (q=0 excludes)"""
+    weights = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        name = name.strip().lower()
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        weights[name] = q
+    wildcard = weights.get("*", 0.0)
+    candidates = (["br"] if brotli_available else []) + ["gzip"]
+    best = max(candidates, key=lambda name: (weights.get(name, wildcard), name == "br"))
+    return best if weights.get(best, wildcard) > 0 else None
+
+
+def is_compressible(content_type: str, allowed: Iterable[str] = DEFAULT_CONTENT_TYPES) -> bool:
+    content_type = content_type.split(";")[0].strip().lower()
+    if not content_type or content_type.startswith(PRECOMPRESSED_PREFIXES):
+        return False
+    return content_type.startswith(tuple(allowed))
+
+
+class _Encoder:
+    def __init__(self, encoding: str, gzip_level: int, brotli_quality: int):
+        self.encoding = encoding
+        if encoding == "br":
+            self._br = brotli.Compressor(quality=brotli_quality)
+        else:
+            self._gz = zlib.compressobj(gzip_level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes, final: bool) -> bytes:
+        if self.encoding == "br":
+            out = self._br.process(data) if data else b""
+            return out + (self._br.finish() if final else self._br.flush())
+        out = self._gz.compress(data) if data else b""
+        return out + self._gz.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+
+
+class CompressionMiddleware:
+    def __init__(self, app, minimum_size: int = 1024, gzip_level: int = 6, brotli_quality: int = 4,
+                 content_types: Iterable[str] = DEFAULT_CONTENT_TYPES, thread_min_size: int = 65536):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.thread_min_size = thread_min_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.content_types = tuple(content_types)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope.get("method") == "HEAD":
+            await self.app(scope, receive, send)
+            return
+
+        accept = ""
+        for name, value in scope.get("headers", []):
+            if name == b"accept-encoding":
+                accept = value.decode("latin-1")
+                break
+        encoding = accepted_encoding(accept, brotli is not None) if accept else None
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        buffered = []
+        buffered_size = 0
+        encoder: Optional[_Encoder] = None
+        passthrough = False
+
+        async def compress(body: bytes, final: bool) -> bytes:
+            # Las partes de una respuesta se comprimen de a una: el encoder nunca se usa desde dos threads
+            if len(body) >= self.thread_min_size:
+                return await asyncio.to_thread(encoder.compress, body, final)
+            return encoder.compress(body, final)
+
+        async def send_compressed(body: bytes, final: bool):
+            out = await compress(body, final)
+            COMPRESSION_BYTES_IN.inc(len(body), encoding=encoding)
+            COMPRESSION_BYTES_OUT.inc(len(out), encoding=encoding)
+            await send({"type": "http.response.body", "body": out, "more_body": not final})
+
+        async def send_wrapper(message):
+            nonlocal start_message, buffered_size, encoder, passthrough
+            if message["type"] == "http.response.start":
+                headers = {k.lower(): v for k, v in message.get("headers", [])}
+                if (message["status"] in (204, 304) or b"content-encoding" in headers
+                        or not is_compressible(headers.get(b"content-type", b"").decode("latin-1"), self.content_types)):
+                    passthrough = True
+                    await send(message)
+                else:
+                    start_message = message
+                return
+
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+
+            if encoder is not None:
+                await send_compressed(body, final=not more_body)
+                return
+
+            buffered.append(body)
+            buffered_size += len(body)
+            if more_body and buffered_size < self.minimum_size:
+                return
+
+            pending = b"".join(buffered)
+            buffered.clear()
+            if not more_body and buffered_size < self.minimum_size:
+                # Muy chica: sale tal cual
+                passthrough = True
+                await send(start_message)
+                await send({"type": "http.response.body", "body": pending, "more_body": False})
+                return
+
+            encoder = _Encoder(encoding, self.gzip_level, self.brotli_quality)
+            headers = [(k, v) for k, v in start_message.get("headers", []) if k.lower() not in (b"content-length", b"vary")]
+            vary = [v for k, v in start_message.get("headers", []) if k.lower() == b"vary"]
+            vary_value = b", ".join(vary + [b"Accept-Encoding"]) if not any(b"accept-encoding" in v.lower() for v in vary) else b", ".join(vary)
+            headers += [(b"content-encoding", encoding.encode()), (b"vary", vary_value)]
+            COMPRESSED_RESPONSES.inc(encoding=encoding)
+
+            if not more_body:
+                out = await compress(pending, final=True)
+                COMPRESSION_BYTES_IN.inc(len(pending), encoding=encoding)
+                COMPRESSION_BYTES_OUT.inc(len(out), encoding=encoding)
+                await send({**start_message, "headers": headers + [(b"content-length", str(len(out)).encode())]})
+                await send({"type": "http.response.body", "body": out, "more_body": False})
+                return
+
+            # Respuesta por partes: sin Content-Length (chunked)
+            await send({**start_message, "headers": headers})
+            await send_compressed(pending, final=False)
+
+        await self.app(scope, receive, send_wrapper)
@@ -0,0 +1,212 @@
+"""
+Análisis de contratos con LLM, con cache y sin bloquear el event loop.
+
+El endpoint `/contracts/{id}/analyze` ya no habla directo con la librería del
+proveedor: usa un `ContractAnalyzer` (`EmergentAnalyzer` en producción,
+`LocalStubAnalyzer` para pruebas y entornos sin API key, elegido con
+CONTRACT_ANALYZER=stub). Cuando hay pasajes relevantes del índice de búsqueda
+(contract_search.py) se mandan solo esos; si no, el PDF completo.
+
+Las respuestas se guardan por (hash del PDF, pregunta normalizada, analizador,
+modelo, versión del prompt, versión de la selección de pasajes): en memoria
+con LRU dentro del worker y en la colección `contract_analyses` para los demás
+workers y reinicios. Cambiar de modelo, de prompt (`PROMPT_VERSION`) o de
+cómo se eligen los pasajes no devuelve respuestas viejas. Si llegan varias
+preguntas iguales al mismo tiempo solo una llega al LLM; las demás esperan ese
+mismo resultado. Los errores no se guardan, así que la siguiente pregunta
+vuelve a intentar, y las respuestas del stub quedan solo en memoria: nunca
+llegan a `contract_analyses`.
+"""
+import asyncio
+import hashlib
+import logging
+import re
+import time
+import unicodedata
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+COLLECTION = "contract_analyses"
+# Subir cuando cambien SYSTEM_MESSAGE o passages_prompt: las respuestas guardadas dejan de usarse
+PROMPT_VERSION = 1
+# Campos de la clave de cache, en el orden de la tupla que recibe AnalysisCache
+KEY_FIELDS = ("content_hash", "question_key", "analyzer", "model", "prompt_version", "passages_version")
+SYSTEM_MESSAGE = "Eres un asistente legal que analiza contratos en español. Responde de forma clara y estructurada."
+
+ANALYSIS_REQUESTS = REGISTRY.counter("contract_analysis_requests_total", "Contract analysis requests by result source", ("source",))
+ANALYSIS_SECONDS = REGISTRY.histogram("contract_analysis_llm_seconds", "Time spent waiting for the LLM per contract analysis")
+
+
+def content_hash(content: bytes) -> str:
+    return hashlib.sha256(content).hexdigest()
+
+
+async def file_hash(file_path: str) -> str:
+    """Hash of a file on disk, read in a thread"""
+    def read():
+        digest = hashlib.sha256()
+        with open(file_path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        return digest.hexdigest()
+    return await asyncio.to_thread(read)
+
+
+def normalize_question(question: str) -> str:
+    """Case, accents, spacing and surrounding punctuation do not change the cache key"""
+    text = unicodedata.normalize("NFKD", question.casefold())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    text = re.sub(r"\s+", " ", text).strip()
+    return text.strip("¿?¡!.,;: ")
+
+
+def passages_prompt(question: str, passages: List[dict]) -> str:
+    excerpts = "\n\n".join(
+        f"[Página {p['page']}]\n{p['text']}" if p.get("page") else p["text"] for p in passages
+    )
+    return f"Fragmentos relevantes del contrato:\n\n{excerpts}\n\nPregunta: {question}"
+
+
+class ContractAnalyzer:
+    """Interface: answer a question about one contract"""
+
+    name = "base"
+    model = ""
+    # Las respuestas de analizadores que no se persisten quedan solo en la cache del worker
+    persist = True
+
+    async def analyze(self, contract: dict, question: str, passages: Optional[List[dict]] = None) -> str:
+        raise NotImplementedError
+
+
+class EmergentAnalyzer(ContractAnalyzer):
+    name = "emergent"
+
+    def __init__(self, api_key: str, provider: str = "gemini", model: str = "gemini-2.5-flash"):
+        self.api_key = api_key
+        self.provider = provider
+        self.model = f"{provider}/{model}"
+        self.chat_model = model
+
+    async def analyze(self, contract: dict, question: str, passages: Optional[List[dict]] = None) -> str:
+        from emergentintegrations.llm.chat import LlmChat, UserMessage, FileContentWithMimeType
+
+        chat = LlmChat(
+            api_key=self.api_key,
+            session_id=f"contract-{contract['id']}",
+            system_message=SYSTEM_MESSAGE
+        ).with_model(self.provider, self.chat_model)
+        if passages:
+            message = UserMessage(text=passages_prompt(question, passages))
+        else:
+            message = UserMessage(
+                text=question,
+                file_contents=[FileContentWithMimeType(file_path=contract["file_path"], mime_type="application/pdf")]
+            )
+        return await chat.send_message(message)
+
+
+class LocalStubAnalyzer(ContractAnalyzer):
+    """Deterministic answer built from the extracted text; no network"""
+
+    name = "stub"
+    model = "stub"
+    persist = False
+
+    def __init__(self, delay_seconds: float = 0.0):
+        self.delay_seconds = delay_seconds
+        self.calls = 0
+
+    async def analyze(self, contract: dict, question: str, passages: Optional[List[dict]] = None) -> str:
+        self.calls += 1
+        if self.delay_seconds:
+            await asyncio.sleep(self.delay_seconds)
+        text = passages_prompt(question, passages) if passages else contract.get("extracted_text") or ""
+        return f"[stub] {question}\n\n{text[:500]}"
+
+
+class AnalysisCache:
+    def __init__(self, max_entries: int = 1000):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[str, ...], dict]" = OrderedDict()
+        self._inflight: Dict[Tuple[str, ...], asyncio.Future] = {}
+
+    def _remember(self, key: Tuple[str, ...], result: dict):
+        self._entries[key] = result
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def get_or_compute(self, db, key: Tuple[str, ...], compute: Callable[[], Awaitable[dict]],
+                             persist: bool = True) -> Tuple[dict, str]:
+        """(result, source) where source is memory, db, shared or llm.
+        key follows KEY_FIELDS; with persist=False contract_analyses is neither read nor written"""
+        cached = self._entries.get(key)
+        if cached is not None:
+            self._entries.move_to_end(key)
+            return cached, "memory"
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            return await asyncio.shield(inflight), "shared"
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            key_filter = dict(zip(KEY_FIELDS, key))
+            stored = None
+            if persist:
+                stored = await db[COLLECTION].find_one(key_filter, {"_id": 0, "analysis": 1, "question": 1, "created_at": 1})
+            if stored is not None:
+                source = "db"
+                result = stored
+            else:
+                source = "llm"
+                started = time.perf_counter()
+                result = await compute()
+                ANALYSIS_SECONDS.observe(time.perf_counter() - started)
+                result = {**result, "created_at": datetime.now(timezone.utc).isoformat()}
+                if persist:
+                    await db[COLLECTION].update_one(key_filter, {"$set": {**result, **key_filter}}, upsert=True)
+            self._remember(key, result)
+            future.set_result(result)
+            return result, source
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Evita el warning de "exception never retrieved" cuando nadie más esperaba
+            future.exception()
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+    def clear(self):
+        self._entries.clear()
+
+
+async def analyze_cached(db, analyzer: ContractAnalyzer, cache: AnalysisCache, contract: dict,
+                         contract_hash: str, question: str,
+                         find_passages: Optional[Callable[[], Awaitable[List[dict]]]] = None,
+                         passages_version: str = "") -> Tuple[dict, str]:
+    """Answer from cache when possible; otherwise ask the analyzer once for all concurrent callers.
+    find_passages is only awaited on a cache miss; passages_version identifies how it selects passages"""
+    async def compute():
+        passages = await find_passages() if find_passages is not None else None
+        return {
+            "analysis": await analyzer.analyze(contract, question, passages),
+            "question": question,
+            "passages": len(passages or [])
+        }
+
+    key = (contract_hash, normalize_question(question), analyzer.name, analyzer.model,
+           str(PROMPT_VERSION), passages_version if find_passages is not None else "")
+    result, source = await cache.get_or_compute(db, key, compute, persist=analyzer.persist)
+    ANALYSIS_REQUESTS.inc(source=source)
+    return result, source
@@ -0,0 +1,175 @@
+"""
+Extracción de texto de contratos PDF fuera del event loop.
+
+`upload_contract` guarda el archivo, registra un job en `contract_jobs` y
+responde enseguida. El job corre en un ProcessPoolExecutor: primero cuenta las
+páginas y después extrae el texto por tramos de `pages_per_chunk` páginas. Cada
+tramo terminado se guarda en `contract_pages` (un documento por página) y
+avanza `pages_done` del job, así que el progreso y las páginas ya extraídas se
+pueden leer antes de que termine el documento completo. Al terminar se
+escribe también `extracted_text` en el contrato, como antes. Si la extracción
+falla se borran las páginas ya guardadas: un contrato `failed` no queda con
+texto a medias en las búsquedas. Las páginas se leen por (contract_id, page),
+con el índice que crea `ensure_indexes` al arrancar.
+
+Los procesos del pool se crean con forkserver (spawn donde no existe), no con
+fork: el worker de uvicorn ya tiene threads (watchdog del loop, executor de
+Motor, listener de logging) y un fork puede dejar al hijo bloqueado en un lock
+que tenía otro thread. Cada proceso guarda los últimos PDFs abiertos, así un
+archivo se parsea una vez por proceso y no una vez por tramo.
+
+Los jobs viven en memoria del worker que recibió la subida: si el proceso se
+reinicia a mitad de una extracción, el job queda en `processing` y hay que
+volver a subir el archivo.
+"""
+import asyncio
+import logging
+import multiprocessing
+import os
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+JOBS = "contract_jobs"
+PAGES = "contract_pages"
+
+
+# Funciones que corren en los procesos del pool (deben ser de módulo para poder serializarse)
+
+# PDFs ya parseados en este proceso: (ruta, mtime, tamaño) -> PdfReader
+READER_CACHE_SIZE = 4
+_readers: "OrderedDict[tuple, object]" = OrderedDict()
+
+
+def _reader(file_path: str):
+    from PyPDF2 import PdfReader
+    stat = os.stat(file_path)
+    key = (file_path, stat.st_mtime_ns, stat.st_size)
+    reader = _readers.get(key)
+    if reader is None:
+        reader = _readers[key] = PdfReader(file_path)
+        while len(_readers) > READER_CACHE_SIZE:
+            _readers.popitem(last=False)
+    else:
+        _readers.move_to_end(key)
+    return reader
+
+
+def count_pages(file_path: str) -> int:
+    return len(_reader(file_path).pages)
+
+
+def extract_page_range(file_path: str, start: int, end: int) -> List[str]:
+    reader = _reader(file_path)
+    texts = []
+    for index in range(start, min(end, len(reader.pages))):
+        try:
+            texts.append(reader.pages[index].extract_text() or "")
+        except Exception as e:  # una página dañada no invalida el resto
+            texts.append("")
+            logging.getLogger(__name__).warning("Error extracting page %s of %s: %s", index + 1, file_path, e)
+    return texts
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+class ContractExtractor:
+    def __init__(self, max_workers: int = 2, pages_per_chunk: int = 20, max_concurrent_jobs: int = 4):
+        self.max_workers = max_workers
+        self.pages_per_chunk = pages_per_chunk
+        self.max_concurrent_jobs = max_concurrent_jobs
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._jobs: Dict[str, asyncio.Task] = {}
+        self._slots: Optional[asyncio.Semaphore] = None
+
+    def _executor(self) -> ProcessPoolExecutor:
+        # El pool se crea con la primera subida: no agrega procesos al arranque
+        if self._pool is None:
+            method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            self._pool = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=multiprocessing.get_context(method))
+        return self._pool
+
+    @staticmethod
+    async def ensure_indexes(db):
+        await db[PAGES].create_index([("contract_id", 1), ("page", 1)])
+
+    async def submit(self, db, contract_id: str, file_path: str, on_done: Optional[Callable[[], None]] = None) -> dict:
+        """Register an extraction job and start it in the background; returns the job document.
+        on_done is called after the text has been stored"""
+        job = {
+            "id": str(uuid.uuid4()),
+            "contract_id": contract_id,
+            "status": "queued",
+            "pages_total": None,
+            "pages_done": 0,
+            "error": None,
+            "created_at": _now(),
+            "updated_at": _now(),
+        }
+        await db[JOBS].insert_one(dict(job))
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_concurrent_jobs)
+        task = asyncio.create_task(self._run(db, job, file_path, on_done), name=f"contract-extract-{contract_id}")
+        self._jobs[job["id"]] = task
+        task.add_done_callback(lambda _: self._jobs.pop(job["id"], None))
+        return job
+
+    async def _update_job(self, db, job_id: str, fields: dict, inc: Optional[dict] = None):
+        update = {"$set": {**fields, "updated_at": _now()}}
+        if inc:
+            update["$inc"] = inc
+        await db[JOBS].update_one({"id": job_id}, update)
+
+    async def _run(self, db, job: dict, file_path: str, on_done):
+        loop = asyncio.get_running_loop()
+        contract_id = job["contract_id"]
+        async with self._slots:
+            try:
+                total = await loop.run_in_executor(self._executor(), count_pages, file_path)
+                await self._update_job(db, job["id"], {"status": "processing", "pages_total": total})
+
+                async def chunk(start: int, end: int):
+                    return start, await loop.run_in_executor(self._executor(), extract_page_range, file_path, start, end)
+
+                # Tramos en paralelo hasta el tamaño del pool; cada uno se guarda apenas termina
+                chunks = [chunk(start, min(start + self.pages_per_chunk, total)) for start in range(0, total, self.pages_per_chunk)]
+                done: Dict[int, List[str]] = {}
+                for future in asyncio.as_completed(chunks):
+                    start, texts = await future
+                    done[start] = texts
+                    if texts:
+                        await db[PAGES].insert_many([
+                            {"contract_id": contract_id, "page": start + i + 1, "text": text}
+                            for i, text in enumerate(texts)
+                        ])
+                    await self._update_job(db, job["id"], {}, {"pages_done": len(texts)})
+
+                # extracted_text completo se mantiene para los endpoints que lo leen
+                await db.contracts.update_one({"id": contract_id}, {"$set": {
+                    "extracted_text": "".join("".join(done[start]) for start in sorted(done)),
+                    "text_status": "done",
+                    "pages_count": total,
+                }})
+                await self._update_job(db, job["id"], {"status": "done"})
+                if on_done is not None:
+                    on_done()
+            except Exception as e:
+                logger.error(f"Error extracting PDF text: {e}")
+                await db[PAGES].delete_many({"contract_id": contract_id})
+                await db.contracts.update_one({"id": contract_id}, {"$set": {"text_status": "failed"}})
+                await self._update_job(db, job["id"], {"status": "failed", "error": str(e)})
+
+    async def shutdown(self):
+        for task in list(self._jobs.values()):
+            task.cancel()
+        if self._jobs:
+            await asyncio.gather(*self._jobs.values(), return_exceptions=True)
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
@@ -0,0 +1,145 @@
+"""
+Búsqueda de pasajes dentro del texto extraído de los contratos.
+
+El texto de cada página (`contract_pages`) se divide en fragmentos de uno o
+más párrafos de hasta `CHUNK_CHARS` caracteres y se indexa con BM25. Hay un
+índice en memoria por proyecto, construido la primera vez que se busca y
+descartado cuando termina la extracción de un contrato del proyecto; como
+cada worker tiene el suyo, también se reconstruye después de `ttl_seconds` (y
+se descarta por LRU si hay demasiados proyectos cargados). Los contratos
+anteriores a `contract_pages` se indexan desde `extracted_text`, sin número
+de página.
+
+`/contracts/{id}/search` devuelve los mejores pasajes y el análisis con LLM
+manda solo esos pasajes en lugar del PDF completo.
+"""
+import math
+import re
+import time
+import unicodedata
+from collections import Counter, OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+CHUNK_CHARS = 1000
+# Subir cuando cambie cómo se eligen los pasajes (fragmentos, tokens, BM25): forma parte de la clave
+# de las respuestas guardadas del análisis (ver contract_analysis.py)
+SELECTION_VERSION = 1
+
+STOPWORDS = frozenset(
+    "a al algo ante como con contra cual de del desde donde e el ella ellas ellos en entre es esa ese esta este "
+    "fue ha hay la las le les lo los mas me mi muy no nos o para pero por que se segun ser si sin sobre son su sus "
+    "tal te tiene todo tu un una uno unos unas y ya".split()
+)
+
+_PARAGRAPHS = re.compile(r"\n\s*\n")
+_TOKENS = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> List[str]:
+    text = unicodedata.normalize("NFKD", text.casefold())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return [t for t in _TOKENS.findall(text) if len(t) > 1 and t not in STOPWORDS]
+
+
+def split_chunks(text: str, max_chars: int = CHUNK_CHARS) -> List[str]:
+    """Group paragraphs up to max_chars; paragraphs longer than that are cut at whitespace"""
+    chunks: List[str] = []
+    current = ""
+    for paragraph in _PARAGRAPHS.split(text):
+        paragraph = paragraph.strip()
+        while len(paragraph) > max_chars:
+            cut = paragraph.rfind(" ", 0, max_chars)
+            cut = cut if cut > 0 else max_chars
+            if current:
+                chunks.append(current)
+                current = ""
+            chunks.append(paragraph[:cut].strip())
+            paragraph = paragraph[cut:].strip()
+        if not paragraph:
+            continue
+        if current and len(current) + len(paragraph) + 2 > max_chars:
+            chunks.append(current)
+            current = paragraph
+        else:
+            current = f"{current}\n\n{paragraph}" if current else paragraph
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+class BM25Index:
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.passages: List[dict] = []
+        self._lengths: List[int] = []
+        self._postings: Dict[str, List[tuple]] = {}
+
+    def add(self, contract_id: str, page: Optional[int], text: str):
+        for number, chunk in enumerate(split_chunks(text)):
+            tokens = tokenize(chunk)
+            if not tokens:
+                continue
+            index = len(self.passages)
+            self.passages.append({"contract_id": contract_id, "page": page, "chunk": number, "text": chunk})
+            self._lengths.append(len(tokens))
+            for term, tf in Counter(tokens).items():
+                self._postings.setdefault(term, []).append((index, tf))
+
+    def search(self, query: str, limit: int = 5, contract_id: Optional[str] = None) -> List[dict]:
+        if not self.passages:
+            return []
+        total = len(self.passages)
+        avg_length = sum(self._lengths) / total
+        scores: Dict[int, float] = {}
+        for term in set(tokenize(query)):
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (total - len(postings) + 0.5) / (len(postings) + 0.5))
+            for index, tf in postings:
+                if contract_id is not None and self.passages[index]["contract_id"] != contract_id:
+                    continue
+                norm = tf + self.k1 * (1 - self.b + self.b * self._lengths[index] / avg_length)
+                scores[index] = scores.get(index, 0.0) + idf * tf * (self.k1 + 1) / norm
+        best = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:limit]
+        return [{**self.passages[index], "score": round(score, 4)} for index, score in best]
+
+
+class ContractSearch:
+    def __init__(self, max_projects: int = 50, ttl_seconds: float = 600):
+        self.max_projects = max_projects
+        self.ttl_seconds = ttl_seconds
+        # project_id -> (expira, índice)
+        self._indexes: "OrderedDict[Optional[str], Tuple[float, BM25Index]]" = OrderedDict()
+
+    async def index(self, db, project_id: Optional[str]) -> BM25Index:
+        cached = self._indexes.get(project_id)
+        now = time.monotonic()
+        if cached is not None and cached[0] > now:
+            self._indexes.move_to_end(project_id)
+            return cached[1]
+
+        index = BM25Index()
+        contracts = await db.contracts.find({"project_id": project_id}, {"_id": 0, "id": 1, "pages_count": 1}).to_list(None)
+        paged = [c["id"] for c in contracts if c.get("pages_count") is not None]
+        legacy = [c["id"] for c in contracts if c.get("pages_count") is None]
+        if paged:
+            async for page in db.contract_pages.find({"contract_id": {"$in": paged}}, {"_id": 0}).sort([("contract_id", 1), ("page", 1)]):
+                index.add(page["contract_id"], page["page"], page.get("text") or "")
+        if legacy:
+            async for contract in db.contracts.find({"id": {"$in": legacy}}, {"_id": 0, "id": 1, "extracted_text": 1}):
+                index.add(contract["id"], None, contract.get("extracted_text") or "")
+
+        self._indexes[project_id] = (now + self.ttl_seconds, index)
+        self._indexes.move_to_end(project_id)
+        while len(self._indexes) > self.max_projects:
+            self._indexes.popitem(last=False)
+        return index
+
+    async def search(self, db, contract: dict, query: str, limit: int = 5) -> List[dict]:
+        index = await self.index(db, contract.get("project_id"))
+        return index.search(query, limit, contract_id=contract["id"])
+
+    def invalidate(self, project_id: Optional[str]):
+        self._indexes.pop(project_id, None)
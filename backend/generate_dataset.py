@@ -0,0 +1,457 @@
+#!/usr/bin/env python3
+"""
+Generador determinístico de datasets multi-tenant a escala configurable.
+
+Produce N empresas × M usuarios × P proyectos × T tareas, más comentarios,
+pagos, fases, grupos de tareas, cuentas por cobrar y activity logs, con el
+mismo esquema que escribe `server_multitenant.py`. Los tamaños siguen una
+distribución Zipf (`--skew`): pocas empresas grandes y muchas pequeñas, y en
+cada proyecto pocos usuarios concentran la mayoría de las tareas.
+
+Con la misma semilla (y --fixed-now) se generan los mismos documentos,
+incluidos los ids, con cualquier valor de --processes; solo cambia la sal del
+hash de contraseña. Así benchmarks y análisis de índices son comparables
+entre corridas. Los documentos se
+escriben con `insert_many(ordered=False)` en batches concurrentes, y con
+--processes varias empresas se generan en paralelo en procesos separados.
+
+Uso:
+    python generate_dataset.py --db-name pactum_bench --companies 50 --users 40 --projects 20 --tasks 200
+    python generate_dataset.py --companies 400 --tasks 500 --comments 3 --processes 8   # ~8M documentos
+    python generate_dataset.py --dry-run --companies 500   # solo contar documentos
+
+La base indicada se BORRA antes de generar (salvo --no-drop).
+Todos los usuarios tienen la contraseña DEFAULT_PASSWORD.
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+import uuid
+from datetime import datetime, timezone, timedelta
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+DEFAULT_PASSWORD = "Dataset2026!"
+
+ROLES = ("SUPER_ADMIN", "COMPANY_ADMIN", "TEAM_MEMBER", "USER")
+
+COLLECTIONS = (
+    "companies", "users", "clients", "projects", "tasks", "task_groups", "task_comments",
+    "payments", "phases", "accounts_receivable", "activity_logs",
+)
+
+TASK_STATUSES = (("done", 35), ("in_progress", 20), ("todo", 20), ("backlog", 15), ("review", 10))
+TASK_PRIORITIES = (("medium", 45), ("high", 25), ("low", 20), ("urgent", 10))
+RECEIVABLE_STATUSES = (("pending", 45), ("paid", 30), ("overdue", 15), ("partial", 10))
+PHASE_NAMES = ("Descubrimiento", "Diseño", "Desarrollo", "QA", "Despliegue", "Soporte")
+WORDS = ("api", "kanban", "reporte", "pago", "cliente", "login", "dashboard", "factura", "correo", "integración",
+         "módulo", "exportar", "importar", "permisos", "notificación", "móvil", "backend", "frontend", "pruebas", "deploy")
+
+
+def zipf_weights(count: int, skew: float) -> List[float]:
+    """Weights normalized to mean 1.0; skew=0 is uniform"""
+    if count <= 0:
+        return []
+    raw = [1 / (rank + 1) ** skew for rank in range(count)]
+    factor = count / sum(raw)
+    return [w * factor for w in raw]
+
+
+def scaled(mean: float, weight: float, minimum: int = 0) -> int:
+    return max(minimum, int(round(mean * weight)))
+
+
+class Pools:
+    """Precomputed words and timestamps shared by all companies of a run
+
+    Generating text and ISO dates per document dominates the cost at scale.
+    """
+
+    SIZE = 4096
+    # Antigüedades máximas (días) que usa generate_company; sus pools se crean al inicio
+    TIMESTAMP_DAYS = (365, 90, 60, 30)
+
+    def __init__(self, seed: int, now: datetime):
+        self.seed = seed
+        self.rng = random.Random(f"{seed}-pools")
+        self.now = now
+        self.words = [self.rng.choice(WORDS) for _ in range(self.SIZE)]
+        self._timestamps: Dict[int, List[str]] = {days: self._timestamp_pool(days) for days in self.TIMESTAMP_DAYS}
+
+    def _timestamp_pool(self, max_days_ago: int) -> List[str]:
+        # Un generador por pool: el contenido no depende de qué empresa (o proceso) lo pidió primero
+        rng = random.Random(f"{self.seed}-timestamps-{max_days_ago}")
+        return sorted(
+            (self.now - timedelta(seconds=rng.randrange(max(1, max_days_ago * 86400)))).isoformat()
+            for _ in range(self.SIZE)
+        )
+
+    def timestamps(self, max_days_ago: int) -> List[str]:
+        pool = self._timestamps.get(max_days_ago)
+        if pool is None:
+            pool = self._timestamps[max_days_ago] = self._timestamp_pool(max_days_ago)
+        return pool
+
+
+class DocumentFactory:
+    """Deterministic ids, timestamps and weighted choices for one company"""
+
+    def __init__(self, seed: str, pools: Pools):
+        self.rng = random.Random(seed)
+        self.pools = pools
+        self.now = pools.now
+
+    def uuid(self) -> str:
+        return str(uuid.UUID(int=self.rng.getrandbits(128), version=4))
+
+    def timestamp(self, max_days_ago: int = 365) -> str:
+        return self.pools.timestamps(max_days_ago)[int(self.rng.random() * Pools.SIZE)]
+
+    def date(self, min_days: int, max_days: int) -> str:
+        return (self.now + timedelta(days=self.rng.randint(min_days, max_days))).date().isoformat()
+
+    def weighted(self, options) -> str:
+        values, weights = zip(*options)
+        return self.rng.choices(values, weights)[0]
+
+    def words(self, count: int) -> str:
+        start = int(self.rng.random() * (Pools.SIZE - count))
+        return " ".join(self.pools.words[start:start + count])
+
+
+def generate_company(index: int, seed: int, size: float, args, pools: Pools, password_hash: str) -> Iterator[Tuple[str, dict]]:
+    """Yield (collection, document) for one company; `size` scales its volume"""
+    f = DocumentFactory(f"{seed}-company-{index}", pools)
+    now = pools.now
+    rng = f.rng
+    company_id = f.uuid()
+    created_at = f.timestamp()
+
+    yield "companies", {
+        "id": company_id, "name": f"Empresa {index}", "email": f"empresa{index}@dataset.example.com",
+        "phone": None, "logo_url": None, "primary_color": "#3b82f6", "secondary_color": "#1e40af",
+        "status": "active", "subscription_status": "active" if rng.random() < 0.8 else "trial",
+        "trial_ends_at": (now + timedelta(days=14)).isoformat(), "trial_started_at": created_at,
+        "active_modules": ["crm", "projects", "tasks"], "created_at": created_at, "updated_at": created_at,
+    }
+
+    def user_doc(kind: str, number: int, role: str, name: str) -> dict:
+        return {
+            "id": f.uuid(), "email": f"{kind}{index}_{number}@dataset.example.com", "password": password_hash,
+            "name": name, "role": role, "company_id": company_id, "status": "active", "created_at": f.timestamp(),
+        }
+
+    user_count = scaled(args.users, size, minimum=2)
+    admin = user_doc("admin", 0, "COMPANY_ADMIN", f"Admin {index}")
+    members = [user_doc("member", i, "TEAM_MEMBER", f"Miembro {index}-{i}") for i in range(max(1, int(user_count * 0.7)))]
+    client_users = [user_doc("user", i, "USER", f"Cliente {index}-{i}") for i in range(max(1, user_count - len(members) - 1))]
+    for doc in (admin, *members, *client_users):
+        yield "users", doc
+
+    clients = []
+    for client_user in client_users:
+        client = {
+            "id": f.uuid(), "name": client_user["name"], "email": client_user["email"], "phone": None,
+            "company_name": f"Cliente S.A. {index}-{len(clients)}", "address": None, "city": None, "country": "Nicaragua",
+            "tags": [], "notes": None, "status": "active" if rng.random() < 0.85 else "inactive",
+            "company_id": company_id, "created_by": admin["id"], "created_at": f.timestamp(), "updated_at": f.timestamp(30),
+        }
+        clients.append((client, client_user))
+        yield "clients", client
+
+    def log(entity_type: str, entity_id: str, action: str, user: dict, changes: dict) -> Tuple[str, dict]:
+        return "activity_logs", {
+            "id": f.uuid(), "entity_type": entity_type, "entity_id": entity_id, "action": action,
+            "user_id": user["id"], "user_name": user["name"], "company_id": company_id,
+            "changes": changes, "timestamp": f.timestamp(),
+        }
+
+    project_weights = zipf_weights(scaled(args.projects, size, minimum=1), args.skew)
+    for p, project_weight in enumerate(project_weights):
+        client, client_user = clients[p % len(clients)]
+        team = rng.sample(members, min(len(members), rng.randint(2, 6)))
+        assigned = [admin["id"], *[m["id"] for m in team], client_user["id"]]
+        # Pocos miembros concentran la mayoría de las tareas
+        assignee_weights = zipf_weights(len(team), args.skew)
+        task_count = scaled(args.tasks, project_weight)
+        done_ratio = rng.random()
+
+        project_id = f.uuid()
+        project_created = f.timestamp()
+        yield "projects", {
+            "id": project_id, "name": f"Proyecto {index}-{p}", "description": f.words(8),
+            "client_name": client["name"], "client_id": client["id"], "budget": float(rng.randint(2, 200) * 500),
+            "status": f.weighted((("en_progreso", 60), ("planificacion", 15), ("completado", 15), ("pausado", 10))),
+            "start_date": project_created[:10], "end_date": f.date(30, 365), "assigned_users": assigned,
+            "deliverables": [], "notes": None, "progress_percentage": int(done_ratio * 100),
+            "company_id": company_id, "created_by": admin["id"], "created_at": project_created, "updated_at": f.timestamp(30),
+        }
+        yield log("project", project_id, "created", admin, {"name": f"Proyecto {index}-{p}"})
+
+        group_ids = [f.uuid() for _ in range(rng.randint(0, args.task_groups))] if task_count else []
+        group_tasks: Dict[str, List[str]] = {g: [] for g in group_ids}
+
+        for t in range(task_count):
+            task_id = f.uuid()
+            assignee = rng.choices(team, assignee_weights)[0] if team else admin
+            group_id = rng.choice(group_ids) if group_ids and rng.random() < 0.6 else None
+            if group_id:
+                group_tasks[group_id].append(task_id)
+            estimated = rng.choice((0.5, 1, 2, 3, 4, 6, 8, 12, 16))
+            status = f.weighted(TASK_STATUSES)
+            task_created = f.timestamp()
+            yield "tasks", {
+                "id": task_id, "title": f"{f.words(3).capitalize()} #{t}", "description": f.words(12),
+                "project_id": project_id, "assigned_to": assignee["id"], "status": status,
+                "priority": f.weighted(TASK_PRIORITIES), "estimated_hours": estimated, "estimated_minutes": None,
+                "due_date": f.date(-30, 120), "tags": rng.sample(WORDS, rng.randint(0, 3)), "technical_notes": None,
+                "attachments": [], "task_group_id": group_id, "company_id": company_id, "created_by": admin["id"],
+                "created_at": task_created, "updated_at": task_created,
+                "actual_hours": round(estimated * rng.uniform(0.5, 1.5), 1) if status == "done" else 0,
+            }
+            for _ in range(int(rng.expovariate(1 / args.logs)) if args.logs else 0):
+                yield log("task", task_id, f.weighted((("updated", 5), ("status_changed", 4), ("comment_added", 2))), assignee, {"status": status})
+            for _ in range(int(rng.expovariate(1 / args.comments)) if args.comments else 0):
+                author = rng.choice(team) if team and rng.random() < 0.8 else client_user
+                comment_at = f.timestamp()
+                yield "task_comments", {
+                    "id": f.uuid(), "task_id": task_id, "project_id": project_id, "user_id": author["id"],
+                    "user_name": author["name"], "text": f.words(rng.randint(4, 20)), "audio_url": None,
+                    "audio_duration": None, "images": None, "created_at": comment_at, "created_at_utc": comment_at,
+                }
+
+        for g, group_id in enumerate(group_ids):
+            yield "task_groups", {
+                "id": group_id, "name": f"Sprint {g + 1}", "description": None, "project_id": project_id,
+                "total_estimated_hours": float(rng.randint(10, 120)), "task_ids": group_tasks[group_id],
+                "color": "#3b82f6", "created_by": admin["id"], "created_at": project_created, "updated_at": project_created,
+            }
+
+        for n in range(args.payments):
+            paid = (n + 1) / max(1, args.payments) <= done_ratio
+            yield "payments", {
+                "id": f.uuid(), "project_id": project_id, "payment_number": n + 1, "description": f"Pago {n + 1}",
+                "amount": float(rng.randint(5, 80) * 100), "percentage": 100 // max(1, args.payments),
+                "due_date": f.date(-90, 180), "notes": None, "status": "pagado" if paid else "pendiente",
+                "paid_date": f.timestamp(90)[:10] if paid else None, "payment_method": "transferencia" if paid else None,
+                "receipt_url": None, "created_by": admin["id"], "created_at": project_created, "updated_at": project_created,
+            }
+
+        for n in range(args.phases):
+            progress = max(0, min(100, int(done_ratio * args.phases * 100) - n * 100))
+            yield "phases", {
+                "id": f.uuid(), "project_id": project_id, "name": PHASE_NAMES[n % len(PHASE_NAMES)], "description": None,
+                "order": n + 1, "estimated_days": rng.randint(5, 30), "start_date": f.date(-60, 60),
+                "status": "completado" if progress >= 100 else "en_progreso" if progress else "pendiente",
+                "progress": progress, "end_date": None, "created_by": admin["id"],
+                "created_at": project_created, "updated_at": project_created,
+            }
+
+    for n in range(scaled(args.receivables, size)):
+        client, _ = clients[n % len(clients)]
+        amount = float(rng.randint(5, 500) * 100)
+        status = f.weighted(RECEIVABLE_STATUSES)
+        is_partner = rng.random() < 0.2
+        yield "accounts_receivable", {
+            "id": f.uuid(), "company_id": company_id, "client_id": client["id"], "client_name": client["name"],
+            "amount": amount, "due_date": f.date(-60, 120), "invoice_number": f"F-{index:04d}-{n:05d}",
+            "description": None, "is_partner": is_partner, "partner_percentage": float(rng.choice((10, 20, 30, 50))) if is_partner else None,
+            "status": status, "paid_amount": amount if status == "paid" else round(amount * rng.uniform(0.1, 0.9), 2) if status == "partial" else 0,
+            "paid_date": f.timestamp(60)[:10] if status == "paid" else None, "notes": None,
+            "created_by": admin["id"], "created_at": f.timestamp(), "updated_at": f.timestamp(30),
+        }
+
+
+class BatchWriter:
+    """Buffers documents per collection and flushes them with bounded concurrency"""
+
+    def __init__(self, db, batch_size: int = 5000, concurrency: int = 8, dry_run: bool = False):
+        self.db = db
+        self.batch_size = batch_size
+        self.dry_run = dry_run
+        self.counts: Dict[str, int] = {name: 0 for name in COLLECTIONS}
+        self._buffers: Dict[str, List[dict]] = {name: [] for name in COLLECTIONS}
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._pending: set = set()
+
+    async def add(self, collection: str, doc: dict):
+        buffer = self._buffers[collection]
+        buffer.append(doc)
+        self.counts[collection] += 1
+        if len(buffer) >= self.batch_size:
+            self._buffers[collection] = []
+            await self._flush(collection, buffer)
+
+    async def _flush(self, collection: str, docs: List[dict]):
+        if self.dry_run or not docs:
+            return
+        # Esperar un slot antes de seguir generando mantiene acotada la memoria
+        await self._semaphore.acquire()
+        task = asyncio.create_task(self._insert(collection, docs))
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+
+    async def _insert(self, collection: str, docs: List[dict]):
+        try:
+            await self.db[collection].insert_many(docs, ordered=False)
+        finally:
+            self._semaphore.release()
+
+    async def close(self):
+        for collection, docs in self._buffers.items():
+            self._buffers[collection] = []
+            await self._flush(collection, docs)
+        if self._pending:
+            await asyncio.gather(*self._pending)
+
+    @property
+    def total(self) -> int:
+        return sum(self.counts.values())
+
+
+async def generate_dataset(
+    db,
+    args,
+    batch_size: int = 5000,
+    concurrency: int = 8,
+    dry_run: bool = False,
+    drop: bool = True,
+    progress: Optional[Callable[[int, int, int], None]] = None,
+    shard: Tuple[int, int] = (0, 1)
+) -> Tuple[Dict[str, List[str]], Dict[str, int]]:
+    """Write the dataset described by `args`; returns (login emails per role, documents per collection)
+
+    `shard=(k, n)` writes only the companies with index % n == k, so n processes
+    can generate the same dataset in parallel.
+    """
+    import bcrypt
+
+    if drop and not dry_run:
+        for name in COLLECTIONS:
+            await db.drop_collection(name)
+
+    now = datetime(2026, 1, 1, tzinfo=timezone.utc) if args.fixed_now else datetime.now(timezone.utc)
+    # Un solo hash para todos los usuarios: hashear millones de contraseñas dominaría el tiempo
+    password_hash = bcrypt.hashpw(DEFAULT_PASSWORD.encode("utf-8"), bcrypt.gensalt()).decode("utf-8")
+    writer = BatchWriter(db, batch_size, concurrency, dry_run)
+    pools = Pools(args.seed, now)
+    accounts: Dict[str, List[str]] = {role: [] for role in ROLES}
+
+    shard_index, shard_count = shard
+    if shard_index == 0:
+        super_admin_email = "superadmin@dataset.example.com"
+        await writer.add("users", {
+            "id": str(uuid.UUID(int=random.Random(f"{args.seed}-super").getrandbits(128), version=4)),
+            "email": super_admin_email, "password": password_hash, "name": "Super Admin", "role": "SUPER_ADMIN",
+            "company_id": None, "status": "active", "created_at": now.isoformat(),
+        })
+        accounts["SUPER_ADMIN"].append(super_admin_email)
+
+    for index, size in enumerate(zipf_weights(args.companies, args.skew)):
+        if index % shard_count != shard_index:
+            continue
+        for collection, doc in generate_company(index, args.seed, size, args, pools, password_hash):
+            if collection == "users":
+                accounts[doc["role"]].append(doc["email"])
+            await writer.add(collection, doc)
+        if progress:
+            progress(index + 1, args.companies, writer.total)
+
+    await writer.close()
+    return accounts, writer.counts
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Generador de datasets multi-tenant sintéticos")
+    add_dataset_arguments(parser)
+    parser.add_argument("--mongo-url", default=os.environ.get("MONGO_URL", "mongodb://localhost:27017"))
+    parser.add_argument("--db-name", default="pactum_dataset")
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=8, help="insert_many simultáneos por proceso")
+    parser.add_argument("--processes", type=int, default=1, help="Procesos generadores en paralelo")
+    parser.add_argument("--no-drop", action="store_true", help="No borrar las colecciones antes de generar")
+    parser.add_argument("--dry-run", action="store_true", help="Generar sin escribir (para contar documentos)")
+    return parser
+
+
+def add_dataset_arguments(parser: argparse.ArgumentParser, **defaults):
+    """Dataset shape options, shared with load_test.py"""
+    options = {"companies": 10, "users": 20, "projects": 10, "tasks": 100, "comments": 2.0, "logs": 1.0,
+               "task_groups": 3, "payments": 4, "phases": 4, "receivables": 30}
+    options.update(defaults)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--companies", type=int, default=options["companies"])
+    parser.add_argument("--users", type=int, default=options["users"], help="Usuarios promedio por empresa")
+    parser.add_argument("--projects", type=int, default=options["projects"], help="Proyectos promedio por empresa")
+    parser.add_argument("--tasks", type=int, default=options["tasks"], help="Tareas promedio por proyecto")
+    parser.add_argument("--comments", type=float, default=options["comments"], help="Comentarios promedio por tarea")
+    parser.add_argument("--logs", type=float, default=options["logs"], help="Activity logs promedio por tarea")
+    parser.add_argument("--task-groups", type=int, default=options["task_groups"], help="Máximo de grupos por proyecto")
+    parser.add_argument("--payments", type=int, default=options["payments"], help="Pagos por proyecto")
+    parser.add_argument("--phases", type=int, default=options["phases"], help="Fases por proyecto")
+    parser.add_argument("--receivables", type=int, default=options["receivables"], help="Cuentas por cobrar promedio por empresa")
+    parser.add_argument("--skew", type=float, default=1.0, help="Exponente Zipf de tamaños (0 = uniforme)")
+    parser.add_argument("--fixed-now", action="store_true", help="Fechas relativas a 2026-01-01 para datasets idénticos")
+
+
+async def run_shard(args, shard: Tuple[int, int], drop: bool, progress=None) -> Dict[str, int]:
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    client = AsyncIOMotorClient(args.mongo_url)
+    try:
+        _, counts = await generate_dataset(
+            client[args.db_name], args, batch_size=args.batch_size, concurrency=args.concurrency,
+            dry_run=args.dry_run, drop=drop, progress=progress, shard=shard
+        )
+    finally:
+        client.close()
+    return counts
+
+
+def _shard_process(args, shard_index: int) -> Dict[str, int]:
+    return asyncio.run(run_shard(args, (shard_index, args.processes), drop=False))
+
+
+async def drop_collections(args):
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    client = AsyncIOMotorClient(args.mongo_url)
+    for name in COLLECTIONS:
+        await client[args.db_name].drop_collection(name)
+    client.close()
+
+
+def main(args) -> int:
+    start = time.monotonic()
+
+    def progress(done: int, total: int, documents: int):
+        if done == total or done % max(1, total // 20) == 0:
+            elapsed = time.monotonic() - start
+            print(f"  {done}/{total} empresas, {documents:,} documentos ({documents / elapsed:,.0f} docs/s)")
+
+    print(f"Generando en '{args.db_name}' (semilla {args.seed}){' [dry-run]' if args.dry_run else ''}...")
+    if args.processes > 1:
+        from concurrent.futures import ProcessPoolExecutor
+
+        if not args.no_drop and not args.dry_run:
+            asyncio.run(drop_collections(args))
+        counts = {name: 0 for name in COLLECTIONS}
+        with ProcessPoolExecutor(max_workers=args.processes) as pool:
+            for shard_counts in pool.map(_shard_process, [args] * args.processes, range(args.processes)):
+                for name, count in shard_counts.items():
+                    counts[name] += count
+    else:
+        counts = asyncio.run(run_shard(args, (0, 1), drop=not args.no_drop, progress=progress))
+    elapsed = time.monotonic() - start
+
+    for name in COLLECTIONS:
+        print(f"  {name:<22} {counts[name]:>12,}")
+    total = sum(counts.values())
+    print(f"Total: {total:,} documentos en {elapsed:.1f}s ({total / elapsed:,.0f} docs/s). Contraseña: {DEFAULT_PASSWORD}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(build_parser().parse_args()))
@@ -0,0 +1,333 @@
+"""
+Read model del tablero Kanban por proyecto.
+
+Cada proyecto tiene un documento en `project_boards` con todo lo que la vista
+Kanban necesita: resumen del proyecto, tarjetas de tareas (sin descripción ni
+adjuntos), grupos de tareas y nombres de los usuarios involucrados. Así
+`GET /projects/{id}/board` es una sola lectura por clave.
+
+El documento se construye completo la primera vez que se pide y después se
+mantiene con updates puntuales desde los endpoints que escriben tareas, grupos,
+proyectos y usuarios. Los updates incrementales nunca crean el documento
+(sin upsert): si no existe, la siguiente lectura lo reconstruye. Las escrituras
+que no pasan por la API (scripts, endpoints de corrección) se absorben con una
+reconstrucción completa cada `rebuild_seconds`.
+
+Cada update incremental incrementa `version`. La reconstrucción lee la
+versión antes de leer tareas y grupos, y reemplaza el documento solo si la
+versión sigue igual: un update que llega mientras se arma la foto no se
+pisa, la reconstrucción se reintenta con datos nuevos. Si falta el
+documento se crea un placeholder (con `schema_version` vacío, así las
+lecturas lo ignoran) para que los updates concurrentes también lo marquen.
+
+`project_id` tiene un índice único (`ensure_indexes`, al arrancar): la
+lectura por clave no recorre la colección y dos primeras lecturas
+simultáneas no pueden crear dos documentos para el mismo proyecto; la que
+pierde el upsert vuelve a leer.
+"""
+import logging
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError, OperationFailure
+
+logger = logging.getLogger(__name__)
+
+COLLECTION = "project_boards"
+SCHEMA_VERSION = 1
+
+# Columnas en el orden del tablero; estados desconocidos se agregan al final
+BOARD_STATUSES = ("backlog", "todo", "in_progress", "review", "done")
+
+# Campos de la tarea que viajan en la tarjeta
+CARD_FIELDS = (
+    "id", "title", "status", "priority", "assigned_to", "task_group_id",
+    "estimated_hours", "estimated_minutes", "actual_hours", "due_date", "tags",
+    "created_at", "updated_at",
+)
+GROUP_FIELDS = ("id", "name", "color", "total_estimated_hours")
+PROJECT_FIELDS = ("id", "name", "client_name", "status", "progress_percentage")
+
+
+def _safe_key(key: Any) -> bool:
+    # Los ids se usan como nombre de campo: no pueden tener '.' ni empezar con '$'
+    return isinstance(key, str) and bool(key) and "." not in key and not key.startswith("$")
+
+
+def _pick(doc: dict, fields: Iterable[str]) -> dict:
+    return {f: doc.get(f) for f in fields if f in doc}
+
+
+def task_card(task: dict) -> dict:
+    return _pick(task, CARD_FIELDS)
+
+
+def estimated_hours(card: dict) -> float:
+    if card.get("estimated_hours") is not None:
+        return float(card["estimated_hours"] or 0)
+    return float(card.get("estimated_minutes") or 0) / 60
+
+
+class KanbanBoards:
+    def __init__(self, rebuild_seconds: int = 600):
+        self.rebuild_seconds = rebuild_seconds
+
+    async def ensure_indexes(self, db):
+        """Unique index on project_id; duplicates left by older versions are dropped (rebuilt on read)"""
+        try:
+            await db[COLLECTION].create_index("project_id", unique=True)
+        except OperationFailure as e:
+            if e.code != 11000:
+                raise
+            logger.warning("Tableros duplicados por proyecto: se descartan todos y se reconstruyen al leer")
+            await db[COLLECTION].delete_many({})
+            await db[COLLECTION].create_index("project_id", unique=True)
+
+    # ---------- lectura ----------
+
+    async def get(self, db, project_id: str) -> Optional[dict]:
+        """Board document for the project, rebuilt if missing or stale; None if the project does not exist"""
+        board = await db[COLLECTION].find_one({"project_id": project_id}, {"_id": 0})
+        if board is None or self._is_stale(board):
+            board = await self.rebuild(db, project_id)
+        return board
+
+    def _is_stale(self, board: dict) -> bool:
+        if board.get("schema_version") != SCHEMA_VERSION:
+            return True
+        if not self.rebuild_seconds:
+            return False
+        try:
+            built_at = datetime.fromisoformat(board["built_at"])
+        except (KeyError, TypeError, ValueError):
+            return True
+        return (datetime.now(timezone.utc) - built_at).total_seconds() > self.rebuild_seconds
+
+    async def rebuild(self, db, project_id: str, attempts: int = 3) -> Optional[dict]:
+        board = None
+        for _ in range(attempts):
+            try:
+                current = await db[COLLECTION].find_one_and_update(
+                    {"project_id": project_id},
+                    {"$setOnInsert": {"project_id": project_id, "version": 0}},
+                    projection={"_id": 0, "version": 1}, upsert=True, return_document=ReturnDocument.AFTER
+                )
+            except DuplicateKeyError:
+                # Otra lectura creó el documento al mismo tiempo: se vuelve a leer
+                continue
+            version = current.get("version")
+            board = await self._snapshot(db, project_id)
+            if board is None:
+                await db[COLLECTION].delete_one({"project_id": project_id})
+                return None
+            board["version"] = (version or 0) + 1
+            # Documentos previos a `version` no tienen el campo: {"version": None} también los encuentra
+            result = await db[COLLECTION].replace_one({"project_id": project_id, "version": version}, board)
+            if result.matched_count:
+                return board
+        if board is None:
+            return await self._snapshot(db, project_id)
+        # Escrituras constantes sobre el proyecto: se responde la foto sin guardarla
+        logger.warning("Tablero modificado durante la reconstrucción, no se guarda", extra={"project_id": project_id})
+        return board
+
+    async def _snapshot(self, db, project_id: str) -> Optional[dict]:
+        project = await db.projects.find_one(
+            {"id": project_id}, {"_id": 0, "company_id": 1, "assigned_users": 1, **{f: 1 for f in PROJECT_FIELDS}}
+        )
+        if not project:
+            return None
+
+        tasks = await db.tasks.find(
+            {"project_id": project_id}, {"_id": 0, **{f: 1 for f in CARD_FIELDS}}
+        ).to_list(None)
+        groups = await db.task_groups.find(
+            {"project_id": project_id}, {"_id": 0, **{f: 1 for f in GROUP_FIELDS}}
+        ).to_list(None)
+
+        user_ids = set(project.get("assigned_users") or [])
+        user_ids.update(t["assigned_to"] for t in tasks if t.get("assigned_to"))
+        users = await db.users.find(
+            {"id": {"$in": list(user_ids)}}, {"_id": 0, "id": 1, "name": 1}
+        ).to_list(None) if user_ids else []
+
+        now = datetime.now(timezone.utc).isoformat()
+        board = {
+            "project_id": project_id,
+            "company_id": project.get("company_id"),
+            "assigned_users": project.get("assigned_users") or [],
+            "project": _pick(project, PROJECT_FIELDS),
+            "cards": {t["id"]: task_card(t) for t in tasks if _safe_key(t.get("id"))},
+            "groups": {g["id"]: _pick(g, GROUP_FIELDS) for g in groups if _safe_key(g.get("id"))},
+            "user_names": {u["id"]: u.get("name") for u in users if _safe_key(u.get("id"))},
+            "schema_version": SCHEMA_VERSION,
+            "built_at": now,
+            "updated_at": now,
+        }
+        return board
+
+    # ---------- escrituras incrementales ----------
+
+    async def _apply(self, db, project_id: str, update: dict):
+        update.setdefault("$set", {})["updated_at"] = datetime.now(timezone.utc).isoformat()
+        update["$inc"] = {"version": 1}
+        try:
+            await db[COLLECTION].update_one({"project_id": project_id}, update)
+        except Exception:
+            # Un tablero desactualizado es peor que uno ausente: se descarta y se reconstruye al leer
+            logger.warning("No se pudo actualizar el tablero, se invalida", exc_info=True, extra={"project_id": project_id})
+            await self.invalidate(db, project_id)
+
+    async def _user_names(self, db, fields: dict) -> dict:
+        user_id = fields.get("assigned_to")
+        if not _safe_key(user_id):
+            return {}
+        user = await db.users.find_one({"id": user_id}, {"_id": 0, "name": 1})
+        return {f"user_names.{user_id}": user.get("name")} if user else {}
+
+    def _project_set(self, project_fields: Optional[dict]) -> dict:
+        return {f"project.{k}": v for k, v in (project_fields or {}).items() if k in PROJECT_FIELDS}
+
+    async def upsert_task(self, db, task: dict, project_fields: Optional[dict] = None):
+        task_id = task.get("id")
+        if not _safe_key(task_id):
+            await self.invalidate(db, task["project_id"])
+            return
+        update = {"$set": {
+            f"cards.{task_id}": task_card(task),
+            **await self._user_names(db, task),
+            **self._project_set(project_fields),
+        }}
+        await self._apply(db, task["project_id"], update)
+
+    async def update_task(self, db, project_id: str, task_id: str, fields: dict, project_fields: Optional[dict] = None):
+        card_fields = {k: v for k, v in fields.items() if k in CARD_FIELDS and k != "id"}
+        if not card_fields and not project_fields:
+            return
+        if not _safe_key(task_id):
+            await self.invalidate(db, project_id)
+            return
+        update = {"$set": {
+            **{f"cards.{task_id}.{k}": v for k, v in card_fields.items()},
+            **await self._user_names(db, card_fields),
+            **self._project_set(project_fields),
+        }}
+        await self._apply(db, project_id, update)
+
+    async def remove_task(self, db, project_id: str, task_id: str):
+        if not _safe_key(task_id):
+            await self.invalidate(db, project_id)
+            return
+        await self._apply(db, project_id, {"$unset": {f"cards.{task_id}": ""}})
+
+    async def upsert_group(self, db, group: dict, added: Iterable[str] = (), removed: Iterable[str] = ()):
+        """Store the group and move the membership of the given task ids"""
+        group_id = group.get("id")
+        if not _safe_key(group_id):
+            await self.invalidate(db, group["project_id"])
+            return
+        # Los task_ids del grupo pueden no ser de este proyecto: sin upsert de la
+        # tarjeta, el update sobre una ruta inexistente crearía una tarjeta parcial
+        # que render() descarta (no tiene "id")
+        added = [t for t in added if _safe_key(t)]
+        removed = [t for t in removed if _safe_key(t) and t not in added]
+        update = {"$set": {
+            f"groups.{group_id}": _pick(group, GROUP_FIELDS),
+            **{f"cards.{t}.task_group_id": group_id for t in added},
+        }}
+        if removed:
+            update["$unset"] = {f"cards.{t}.task_group_id": "" for t in removed}
+        await self._apply(db, group["project_id"], update)
+
+    async def remove_group(self, db, group: dict, task_ids: Iterable[str] = ()):
+        group_id = group.get("id")
+        if not _safe_key(group_id):
+            await self.invalidate(db, group["project_id"])
+            return
+        update = {"$unset": {
+            f"groups.{group_id}": "",
+            **{f"cards.{t}.task_group_id": "" for t in task_ids if _safe_key(t)},
+        }}
+        await self._apply(db, group["project_id"], update)
+
+    async def update_project(self, db, project_id: str, fields: dict):
+        if "assigned_users" in fields or "company_id" in fields:
+            # Cambian los permisos y los miembros: más simple reconstruir
+            await self.invalidate(db, project_id)
+            return
+        project_set = self._project_set(fields)
+        if project_set:
+            await self._apply(db, project_id, {"$set": project_set})
+
+    async def rename_user(self, db, company_id: str, user_id: str, name: str):
+        if not _safe_key(user_id):
+            return
+        try:
+            await db[COLLECTION].update_many(
+                {"company_id": company_id, f"user_names.{user_id}": {"$exists": True}},
+                {"$set": {f"user_names.{user_id}": name}, "$inc": {"version": 1}}
+            )
+        except Exception:
+            logger.warning("No se pudo propagar el nombre de usuario a los tableros", exc_info=True, extra={"user_id": user_id})
+
+    async def invalidate(self, db, project_id: str):
+        try:
+            await db[COLLECTION].delete_one({"project_id": project_id})
+        except Exception:
+            logger.warning("No se pudo invalidar el tablero", exc_info=True, extra={"project_id": project_id})
+
+    # ---------- respuesta ----------
+
+    @staticmethod
+    def render(board: dict) -> dict:
+        user_names = board.get("user_names") or {}
+        groups = board.get("groups") or {}
+        columns: Dict[str, dict] = {
+            status: {"status": status, "count": 0, "estimated_hours": 0.0, "actual_hours": 0.0, "tasks": []}
+            for status in BOARD_STATUSES
+        }
+        group_members: Dict[str, List[str]] = {group_id: [] for group_id in groups}
+
+        for card in (board.get("cards") or {}).values():
+            if not card.get("id"):
+                continue
+            card = dict(card)
+            if card.get("assigned_to"):
+                card["assigned_to_name"] = user_names.get(card["assigned_to"]) or "Sin asignar"
+            group_id = card.get("task_group_id")
+            if group_id in groups:
+                card["task_group_name"] = groups[group_id].get("name")
+                group_members[group_id].append(card["id"])
+
+            status = card.get("status") or "backlog"
+            column = columns.get(status)
+            if column is None:
+                column = columns[status] = {"status": status, "count": 0, "estimated_hours": 0.0, "actual_hours": 0.0, "tasks": []}
+            column["count"] += 1
+            column["estimated_hours"] += estimated_hours(card)
+            column["actual_hours"] += float(card.get("actual_hours") or 0)
+            column["tasks"].append(card)
+
+        for column in columns.values():
+            column["tasks"].sort(key=lambda c: c.get("created_at") or "")
+            column["estimated_hours"] = round(column["estimated_hours"], 2)
+            column["actual_hours"] = round(column["actual_hours"], 2)
+
+        return {
+            "project": board.get("project") or {"id": board.get("project_id")},
+            "columns": list(columns.values()),
+            "groups": [
+                {**group, "task_ids": group_members[group_id], "task_count": len(group_members[group_id])}
+                for group_id, group in groups.items()
+            ],
+            "members": [
+                {"id": user_id, "name": user_names.get(user_id)} for user_id in board.get("assigned_users") or []
+            ],
+            "totals": {
+                "count": sum(c["count"] for c in columns.values()),
+                "estimated_hours": round(sum(c["estimated_hours"] for c in columns.values()), 2),
+                "actual_hours": round(sum(c["actual_hours"] for c in columns.values()), 2),
+            },
+            "updated_at": board.get("updated_at"),
+        }
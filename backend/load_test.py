@@ -0,0 +1,338 @@
+#!/usr/bin/env python3
+"""
+Prueba de carga reproducible para la API multitenant.
+
+Levanta `server_multitenant.app` dentro del mismo proceso (httpx + ASGITransport,
+sin red), siembra un dataset con `generate_dataset.py` y simula usuarios virtuales con una
+mezcla de roles (SUPER_ADMIN, COMPANY_ADMIN, TEAM_MEMBER, USER) recorriendo
+los flujos de Kanban, dashboard, comentarios y exportación. Al terminar
+imprime p50/p95/p99 y throughput por ruta.
+
+Uso:
+    # MongoDB local (recomendado para números comparables con producción)
+    python load_test.py --mongo-url mongodb://localhost:27017 --db-name pactum_loadtest
+
+    # Sin mongod: stand-in en memoria (requiere `pip install mongomock-motor`)
+    python load_test.py --in-memory
+
+    # Guardar resultados y comparar contra una corrida anterior
+    python load_test.py --output results.json --baseline baseline.json --max-regression 20
+
+La base indicada en --db-name se BORRA antes de sembrar.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Optional
+
+ROOT_DIR = Path(__file__).parent
+sys.path.insert(0, str(ROOT_DIR))
+
+from generate_dataset import DEFAULT_PASSWORD, add_dataset_arguments, generate_dataset  # noqa: E402
+
+DEFAULT_MIX = {"SUPER_ADMIN": 1, "COMPANY_ADMIN": 4, "TEAM_MEMBER": 10, "USER": 5}
+
+# Acciones por rol con su peso relativo
+ROLE_ACTIONS = {
+    "SUPER_ADMIN": {"admin_companies": 3, "dashboard": 3, "projects": 2, "kanban": 2},
+    "COMPANY_ADMIN": {"dashboard": 4, "projects": 3, "kanban": 6, "move_task": 3, "comments": 3, "add_comment": 1, "export": 1},
+    "TEAM_MEMBER": {"dashboard": 2, "projects": 2, "kanban": 8, "move_task": 5, "comments": 4, "add_comment": 2, "notifications": 1},
+    "USER": {"dashboard": 3, "projects": 3, "kanban": 5, "comments": 3, "notifications": 2},
+}
+
+TASK_STATUSES = ["backlog", "todo", "in_progress", "review", "done"]
+
+
+def parse_mix(value: str) -> Dict[str, int]:
+    mix = {}
+    for item in value.split(","):
+        role, _, weight = item.partition("=")
+        role = role.strip().upper()
+        if role not in ROLE_ACTIONS:
+            raise argparse.ArgumentTypeError(f"Rol desconocido: {role}")
+        mix[role] = int(weight or 1)
+    return mix
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile over an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, int(round(pct / 100 * len(sorted_values) + 0.5)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+# ===================== VIRTUAL USERS =====================
+
+class Results:
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = {}
+        self.errors: Dict[str, int] = {}
+
+    def record(self, route: str, seconds: float, ok: bool):
+        self.latencies.setdefault(route, []).append(seconds)
+        if not ok:
+            self.errors[route] = self.errors.get(route, 0) + 1
+
+    def summary(self, elapsed: float) -> dict:
+        routes = {}
+        all_latencies = []
+        for route, values in sorted(self.latencies.items()):
+            values.sort()
+            all_latencies.extend(values)
+            routes[route] = self._stats(values, self.errors.get(route, 0), elapsed)
+        all_latencies.sort()
+        return {"routes": routes, "total": self._stats(all_latencies, sum(self.errors.values()), elapsed)}
+
+    @staticmethod
+    def _stats(values: List[float], errors: int, elapsed: float) -> dict:
+        return {
+            "requests": len(values),
+            "errors": errors,
+            "rps": round(len(values) / elapsed, 2) if elapsed else 0.0,
+            "p50_ms": round(percentile(values, 50) * 1000, 2),
+            "p95_ms": round(percentile(values, 95) * 1000, 2),
+            "p99_ms": round(percentile(values, 99) * 1000, 2),
+            "max_ms": round(values[-1] * 1000, 2) if values else 0.0,
+        }
+
+
+class VirtualUser:
+    def __init__(self, http, results: Results, role: str, email: str, rng: random.Random):
+        self.http = http
+        self.results = results
+        self.role = role
+        self.email = email
+        self.rng = rng
+        self.headers: Dict[str, str] = {}
+        self.projects: List[dict] = []
+        self.tasks: List[dict] = []
+        actions = ROLE_ACTIONS[role]
+        self.actions = list(actions)
+        self.weights = list(actions.values())
+
+    async def request(self, method: str, route: str, url: str, **kwargs):
+        start = time.perf_counter()
+        try:
+            response = await self.http.request(method, url, headers=self.headers, **kwargs)
+            ok = response.status_code < 400
+        except Exception:
+            response, ok = None, False
+        self.results.record(f"{method} {route}", time.perf_counter() - start, ok)
+        return response if ok else None
+
+    async def login(self) -> bool:
+        response = await self.request("POST", "/api/auth/login", "/api/auth/login", json={"email": self.email, "password": DEFAULT_PASSWORD})
+        if response is None:
+            return False
+        self.headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+        await self.load_projects()
+        return True
+
+    async def load_projects(self):
+        response = await self.request("GET", "/api/projects", "/api/projects")
+        if response is not None:
+            self.projects = response.json()
+
+    def pick_project(self) -> Optional[dict]:
+        return self.rng.choice(self.projects) if self.projects else None
+
+    def pick_task(self) -> Optional[dict]:
+        return self.rng.choice(self.tasks) if self.tasks else None
+
+    async def run(self, deadline: float, think_time: float):
+        if not self.headers:
+            return
+        while time.monotonic() < deadline:
+            action = self.rng.choices(self.actions, self.weights)[0]
+            await getattr(self, f"do_{action}")()
+            # sleep(0) cede el loop aunque el stand-in en memoria nunca suspenda
+            await asyncio.sleep(self.rng.uniform(0, think_time) if think_time else 0)
+
+    # Acciones
+
+    async def do_admin_companies(self):
+        await self.request("GET", "/api/admin/companies", "/api/admin/companies")
+
+    async def do_dashboard(self):
+        await self.request("GET", "/api/dashboard/stats", "/api/dashboard/stats")
+
+    async def do_projects(self):
+        await self.load_projects()
+
+    async def do_kanban(self):
+        project = self.pick_project()
+        if project is None:
+            return
+        response = await self.request("GET", "/api/tasks", "/api/tasks", params={"project_id": project["id"]})
+        if response is not None:
+            self.tasks = response.json()
+
+    async def do_move_task(self):
+        task = self.pick_task()
+        if task is None:
+            return await self.do_kanban()
+        await self.request(
+            "PATCH", "/api/tasks/{task_id}/status", f"/api/tasks/{task['id']}/status",
+            params={"status": self.rng.choice(TASK_STATUSES)}
+        )
+
+    async def do_comments(self):
+        task = self.pick_task()
+        if task is None:
+            return await self.do_kanban()
+        await self.request("GET", "/api/tasks/{task_id}/comments", f"/api/tasks/{task['id']}/comments")
+
+    async def do_add_comment(self):
+        task = self.pick_task()
+        if task is None:
+            return await self.do_kanban()
+        await self.request(
+            "POST", "/api/tasks/{task_id}/comments", f"/api/tasks/{task['id']}/comments",
+            data={"project_id": task["project_id"], "text": "Comentario de prueba de carga"}
+        )
+
+    async def do_export(self):
+        project = self.pick_project()
+        params = {"project_id": project["id"]} if project and self.rng.random() < 0.5 else {}
+        await self.request("GET", "/api/tasks/export", "/api/tasks/export", params=params)
+
+    async def do_notifications(self):
+        await self.request("GET", "/api/notifications", "/api/notifications")
+
+
+# ===================== REPORTING =====================
+
+def print_report(summary: dict):
+    header = f"{'route':<45} {'reqs':>7} {'err':>5} {'rps':>8} {'p50':>9} {'p95':>9} {'p99':>9} {'max':>9}"
+    print(header)
+    print("-" * len(header))
+    rows = list(summary["routes"].items()) + [("TOTAL", summary["total"])]
+    for route, s in rows:
+        print(f"{route:<45} {s['requests']:>7} {s['errors']:>5} {s['rps']:>8.1f} "
+              f"{s['p50_ms']:>8.1f}ms {s['p95_ms']:>7.1f}ms {s['p99_ms']:>7.1f}ms {s['max_ms']:>7.1f}ms")
+
+
+def compare(summary: dict, baseline: dict, max_regression: float) -> List[str]:
+    """Routes whose p95 grew or throughput dropped more than `max_regression` percent"""
+    regressions = []
+    for route, current in summary["routes"].items():
+        previous = baseline.get("routes", {}).get(route)
+        if not previous or not previous.get("requests"):
+            continue
+        if previous["p95_ms"] > 0:
+            change = (current["p95_ms"] - previous["p95_ms"]) / previous["p95_ms"] * 100
+            if change > max_regression:
+                regressions.append(f"{route}: p95 {previous['p95_ms']}ms -> {current['p95_ms']}ms (+{change:.1f}%)")
+        if previous["rps"] > 0:
+            change = (previous["rps"] - current["rps"]) / previous["rps"] * 100
+            if change > max_regression:
+                regressions.append(f"{route}: rps {previous['rps']} -> {current['rps']} (-{change:.1f}%)")
+    return regressions
+
+
+# ===================== MAIN =====================
+
+def load_app(args):
+    """Import server_multitenant pointing at the load-test database"""
+    os.environ["MONGO_URL"] = args.mongo_url
+    os.environ["DB_NAME"] = args.db_name
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    import server_multitenant
+
+    if args.in_memory:
+        try:
+            from mongomock_motor import AsyncMongoMockClient
+        except ImportError:
+            sys.exit("--in-memory requiere mongomock-motor: pip install mongomock-motor")
+        server_multitenant.client = AsyncMongoMockClient()
+        server_multitenant.db = server_multitenant.client[args.db_name]
+        # Sin réplicas en memoria: los reportes leen de la misma base
+        server_multitenant.analytics_db = server_multitenant.db
+    return server_multitenant
+
+
+async def main(args) -> int:
+    import httpx
+
+    server = load_app(args)
+
+    print(f"Sembrando dataset en '{args.db_name}' ({'memoria' if args.in_memory else args.mongo_url})...")
+    accounts, counts = await generate_dataset(server.db, args)
+
+    await server.app.router.startup()
+    results = Results()
+    try:
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://loadtest", timeout=60) as http:
+            roles = [role for role in args.mix if accounts.get(role)]
+            weights = [args.mix[role] for role in roles]
+            vus = []
+            for i in range(args.concurrency):
+                vu_rng = random.Random(f"{args.seed}-{i}")
+                role = vu_rng.choices(roles, weights)[0]
+                vus.append(VirtualUser(http, results, role, vu_rng.choice(accounts[role]), vu_rng))
+
+            # El login (bcrypt) se hace antes de medir la ventana de carga
+            await asyncio.gather(*(vu.login() for vu in vus))
+
+            print(f"Ejecutando {args.concurrency} usuarios virtuales durante {args.duration}s "
+                  f"({', '.join(f'{r}={sum(v.role == r for v in vus)}' for r in roles)})...")
+            start = time.monotonic()
+            await asyncio.gather(*(vu.run(start + args.duration, args.think_time) for vu in vus))
+            elapsed = time.monotonic() - start
+    finally:
+        await server.app.router.shutdown()
+
+    summary = results.summary(elapsed)
+    summary["meta"] = {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "backend": "memory" if args.in_memory else "mongod",
+        "duration_s": round(elapsed, 2),
+        "concurrency": args.concurrency,
+        "seed": args.seed,
+        "mix": args.mix,
+        "dataset": counts,
+    }
+    print_report(summary)
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(summary, indent=2, ensure_ascii=False))
+        print(f"Resultados guardados en {args.output}")
+
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text())
+        regressions = compare(summary, baseline, args.max_regression)
+        if regressions:
+            print(f"\nRegresiones mayores a {args.max_regression}% respecto a {args.baseline}:")
+            for line in regressions:
+                print(f"  - {line}")
+            return 1
+        print(f"\nSin regresiones mayores a {args.max_regression}% respecto a {args.baseline}")
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Prueba de carga de la API multitenant")
+    parser.add_argument("--mongo-url", default="mongodb://localhost:27017")
+    parser.add_argument("--db-name", default="pactum_loadtest")
+    parser.add_argument("--in-memory", action="store_true", help="Usar mongomock-motor en lugar de mongod")
+    parser.add_argument("--duration", type=float, default=30, help="Segundos de carga")
+    parser.add_argument("--concurrency", type=int, default=20, help="Usuarios virtuales simultáneos")
+    parser.add_argument("--think-time", type=float, default=0.0, help="Pausa máxima aleatoria entre acciones (s)")
+    parser.add_argument("--mix", type=parse_mix, default=DEFAULT_MIX, help="Ej: SUPER_ADMIN=1,COMPANY_ADMIN=4,TEAM_MEMBER=10,USER=5")
+    add_dataset_arguments(parser, companies=3, users=10, projects=6, tasks=40, receivables=10)
+    parser.add_argument("--output", help="Guardar resultados en JSON")
+    parser.add_argument("--baseline", help="JSON de una corrida anterior para comparar")
+    parser.add_argument("--max-regression", type=float, default=20.0, help="Porcentaje de regresión tolerado")
+    return parser
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main(build_parser().parse_args())))
@@ -0,0 +1,146 @@
+"""
+Detector de lag y bloqueos del event loop.
+
+Una corrutina "heartbeat" duerme `interval` segundos y mide cuánto tarde
+despierta (lag). Un thread watchdog revisa el último heartbeat: si el loop
+lleva más de `block_threshold` sin latir, captura el stack del thread del loop
+con `sys._current_frames()` y lo registra en el log junto con la tarea activa.
+Así se ve exactamente qué código bloquea (bcrypt, pandas, base64, PyPDF2...).
+
+Variables de entorno:
+- LOOP_MONITOR: "0" lo desactiva (activo por defecto)
+- LOOP_MONITOR_INTERVAL_MS: periodo del heartbeat (100 por defecto)
+- LOOP_BLOCK_THRESHOLD_MS: bloqueo mínimo que se reporta (250 por defecto)
+
+Métricas expuestas en /metrics:
+- event_loop_lag_seconds (histograma)
+- event_loop_blocked_total{site} (site = función de la app que bloqueaba)
+- event_loop_blocked_seconds (histograma de duración de cada bloqueo)
+"""
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from pathlib import Path
+from typing import Optional
+
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+APP_DIR = str(Path(__file__).parent)
+
+LOOP_LAG = REGISTRY.histogram(
+    "event_loop_lag_seconds", "Event loop scheduling lag",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+)
+LOOP_BLOCKED = REGISTRY.counter("event_loop_blocked_total", "Times the event loop was blocked over the threshold", ("site",))
+LOOP_BLOCKED_SECONDS = REGISTRY.histogram("event_loop_blocked_seconds", "Duration of event loop blocks over the threshold")
+
+
+def _blocking_site(frame) -> str:
+    """Innermost frame that belongs to the app (falls back to the innermost frame)"""
+    innermost = None
+    app_frame = None
+    while frame is not None:
+        if innermost is None:
+            innermost = frame
+        if app_frame is None and frame.f_code.co_filename.startswith(APP_DIR) and not frame.f_code.co_filename.endswith("loop_monitor.py"):
+            app_frame = frame
+        frame = frame.f_back
+    chosen = app_frame or innermost
+    if chosen is None:
+        return "unknown"
+    return f"{Path(chosen.f_code.co_filename).name}:{chosen.f_code.co_name}"
+
+
+class LoopMonitor:
+    def __init__(self, interval: float = 0.1, block_threshold: float = 0.25, stack_limit: int = 25):
+        self.interval = interval
+        self.block_threshold = block_threshold
+        self.stack_limit = stack_limit
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_id: Optional[int] = None
+        self._last_beat = time.monotonic()
+        self._heartbeat_task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    @classmethod
+    def from_env(cls) -> Optional["LoopMonitor"]:
+        if os.environ.get("LOOP_MONITOR", "1") == "0":
+            return None
+        return cls(
+            interval=float(os.environ.get("LOOP_MONITOR_INTERVAL_MS", "100")) / 1000,
+            block_threshold=float(os.environ.get("LOOP_BLOCK_THRESHOLD_MS", "250")) / 1000
+        )
+
+    def start(self):
+        """Must be called from the event loop thread (e.g. a startup handler)"""
+        if self._heartbeat_task is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._stop.clear()
+        self._heartbeat_task = self._loop.create_task(self._heartbeat())
+        self._watchdog = threading.Thread(target=self._watch, name="loop-monitor", daemon=True)
+        self._watchdog.start()
+
+    async def stop(self):
+        self._stop.set()
+        if self._heartbeat_task is not None:
+            self._heartbeat_task.cancel()
+            try:
+                await self._heartbeat_task
+            except asyncio.CancelledError:
+                pass
+            self._heartbeat_task = None
+        if self._watchdog is not None:
+            self._watchdog.join(timeout=self.interval * 4)
+            self._watchdog = None
+
+    async def _heartbeat(self):
+        while True:
+            started = time.monotonic()
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            LOOP_LAG.observe(max(0.0, now - started - self.interval))
+            self._last_beat = now
+
+    def _watch(self):
+        blocked_since = None
+        while not self._stop.wait(self.interval / 2):
+            stalled = time.monotonic() - self._last_beat - self.interval
+            if stalled >= self.block_threshold:
+                if blocked_since is None:
+                    blocked_since = self._last_beat
+                    self._report_block(stalled)
+            elif blocked_since is not None:
+                LOOP_BLOCKED_SECONDS.observe(self._last_beat - blocked_since - self.interval)
+                blocked_since = None
+
+    def _report_block(self, stalled: float):
+        frame = sys._current_frames().get(self._loop_thread_id)
+        if frame is None:
+            return
+        site = _blocking_site(frame)
+        LOOP_BLOCKED.inc(site=site)
+
+        task_name = None
+        try:
+            # Lectura sin lock desde otro thread: solo informativa
+            task = asyncio.tasks._current_tasks.get(self._loop)
+            if task is not None:
+                task_name = f"{task.get_name()} {task.get_coro().__qualname__}"
+        except Exception:
+            pass
+
+        stack = "".join(traceback.format_stack(frame, limit=self.stack_limit))
+        logger.warning(
+            "Event loop blocked for %.0fms at %s (task %s)\n%s", stalled * 1000, site, task_name, stack,
+            extra={"blocked_ms": round(stalled * 1000), "site": site}
+        )
@@ -0,0 +1,434 @@
+"""
+Métricas en formato de texto Prometheus sin dependencias externas.
+
+- `MetricsMiddleware`: latencia, status, respuestas en vuelo y tamaño por ruta.
+- `MongoCommandMetrics`: listener de pymongo (command monitoring) que cuenta y
+  mide cada comando de Mongo y lo atribuye a la request actual a través de un
+  contextvar. Motor ejecuta pymongo en un thread pool copiando el contexto,
+  por eso el listener ve el `RequestStats` de la request que lanzó el comando.
+
+Cada worker de uvicorn mantiene su propio registro. Con un solo worker
+`/metrics` expone ese registro tal cual. Con varios (run_production.py define
+METRICS_MULTIPROC_DIR), cada worker vuelca su registro a
+`<dir>/<pid>.json` cada METRICS_FLUSH_SECONDS (5 por defecto) y `/metrics`
+junta los de todos, con una label `worker` (el pid) en cada serie. Así el
+scrape no salta entre procesos y `rate()` funciona; `sum without (worker)`
+da el total del despliegue. Los archivos de workers que ya no existen se
+descartan.
+"""
+import asyncio
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from pymongo import monitoring
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DEFAULT_SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+DEFAULT_COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89, 144)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(f'{extra[0]}="{_escape(extra[1])}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _value_lines(name: str, labelnames: Tuple[str, ...], items) -> List[str]:
+    return [f"{name}{_format_labels(labelnames, k)} {_format_value(v)}" for k, v in items]
+
+
+def _histogram_lines(name: str, labelnames: Tuple[str, ...], buckets: Tuple[float, ...], items) -> List[str]:
+    lines = []
+    for key, state in items:
+        cumulative = 0.0
+        for bound, count in zip(buckets, state):
+            cumulative += count
+            lines.append(f"{name}_bucket{_format_labels(labelnames, key, ('le', _format_value(bound)))} {_format_value(cumulative)}")
+        lines.append(f"{name}_bucket{_format_labels(labelnames, key, ('le', '+Inf'))} {_format_value(state[-1])}")
+        lines.append(f"{name}_sum{_format_labels(labelnames, key)} {_format_value(state[-2])}")
+        lines.append(f"{name}_count{_format_labels(labelnames, key)} {_format_value(state[-1])}")
+    return lines
+
+
+class _Metric:
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def snapshot(self) -> dict:
+        """JSON-serializable state, merged across workers by render_snapshots"""
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return _value_lines(self.name, self.labelnames, items)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            values = [[list(k), v] for k, v in self._values.items()]
+        return {"type": self.type_name, "help": self.documentation, "labelnames": list(self.labelnames), "values": values}
+
+
+class Gauge(Counter):
+    type_name = "gauge"
+
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (), buckets: Iterable[float] = DEFAULT_LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # key -> [bucket counts..., sum, count]
+        self._values: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0.0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                state[index] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = [(k, list(v)) for k, v in self._values.items()]
+        return _histogram_lines(self.name, self.labelnames, self.buckets, items)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            values = [[list(k), list(v)] for k, v in self._values.items()]
+        return {"type": self.type_name, "help": self.documentation, "labelnames": list(self.labelnames),
+                "buckets": list(self.buckets), "values": values}
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Iterable[str] = (), buckets: Iterable[float] = DEFAULT_LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(m.render() for m in metrics) + "\n"
+
+    def snapshot(self) -> Dict[str, dict]:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {m.name: m.snapshot() for m in metrics}
+
+
+def render_snapshots(snapshots: Dict[str, Dict[str, dict]]) -> str:
+    """Prometheus text for several workers' registry snapshots, with a `worker` label per series"""
+    names: Dict[str, dict] = {}
+    for snapshot in snapshots.values():
+        for name, metric in snapshot.items():
+            names.setdefault(name, metric)
+    blocks = []
+    for name, meta in names.items():
+        lines = [f"# HELP {name} {meta['help']}", f"# TYPE {name} {meta['type']}"]
+        labelnames = ("worker", *meta["labelnames"])
+        for worker in sorted(snapshots):
+            metric = snapshots[worker].get(name)
+            if metric is None:
+                continue
+            items = [((worker, *key), value) for key, value in metric["values"]]
+            if metric["type"] == "histogram":
+                lines.extend(_histogram_lines(name, labelnames, tuple(metric["buckets"]), items))
+            else:
+                lines.extend(_value_lines(name, labelnames, items))
+        blocks.append("\n".join(lines))
+    return "\n".join(blocks) + "\n"
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class MetricsExporter:
+    """Serves /metrics for one worker, or for all workers through a shared directory"""
+
+    def __init__(self, registry: "Registry", directory: Optional[str] = None, flush_seconds: float = 5.0):
+        self.registry = registry
+        self.directory = directory
+        self.flush_seconds = flush_seconds
+        self.worker = str(os.getpid())
+        self._task: Optional[asyncio.Task] = None
+
+    @classmethod
+    def from_env(cls, registry: "Registry") -> "MetricsExporter":
+        return cls(registry, os.environ.get("METRICS_MULTIPROC_DIR") or None,
+                   float(os.environ.get("METRICS_FLUSH_SECONDS", "5")))
+
+    @property
+    def _path(self) -> str:
+        return os.path.join(self.directory, f"{self.worker}.json")
+
+    def flush(self):
+        """Write this worker's snapshot atomically (readers never see half a file)"""
+        tmp = f"{self._path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.registry.snapshot(), f)
+        os.replace(tmp, self._path)
+
+    def collect(self) -> str:
+        if not self.directory:
+            return self.registry.render()
+        snapshots = {self.worker: self.registry.snapshot()}
+        for filename in os.listdir(self.directory):
+            worker, ext = os.path.splitext(filename)
+            if ext != ".json" or worker == self.worker or not worker.isdigit():
+                continue
+            path = os.path.join(self.directory, filename)
+            if not _pid_alive(int(worker)):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+                continue
+            try:
+                with open(path) as f:
+                    snapshots[worker] = json.load(f)
+            except (OSError, ValueError):
+                logger.warning("No se pudieron leer las métricas de un worker", extra={"worker": worker})
+        return render_snapshots(snapshots)
+
+    async def render(self) -> str:
+        if not self.directory:
+            return self.registry.render()
+        return await asyncio.to_thread(self.collect)
+
+    def start(self):
+        """Must be called from the event loop (e.g. a startup handler)"""
+        if self.directory and self._task is None:
+            os.makedirs(self.directory, exist_ok=True)
+            self._task = asyncio.create_task(self._flush_loop(), name="metrics-flush")
+
+    async def _flush_loop(self):
+        while True:
+            try:
+                await asyncio.to_thread(self.flush)
+            except Exception:
+                logger.warning("No se pudieron volcar las métricas del worker", exc_info=True)
+            await asyncio.sleep(self.flush_seconds)
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+        try:
+            os.remove(self._path)
+        except OSError:
+            pass
+
+
+REGISTRY = Registry()
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+HTTP_REQUESTS = REGISTRY.counter("http_requests_total", "HTTP requests by route and status", ("method", "route", "status"))
+HTTP_LATENCY = REGISTRY.histogram("http_request_duration_seconds", "HTTP request latency", ("method", "route"))
+HTTP_IN_FLIGHT = REGISTRY.gauge("http_requests_in_flight", "HTTP requests currently being served")
+HTTP_RESPONSE_SIZE = REGISTRY.histogram("http_response_size_bytes", "HTTP response body size", ("method", "route"), DEFAULT_SIZE_BUCKETS)
+HTTP_MONGO_COMMANDS = REGISTRY.histogram("http_request_mongo_commands", "Mongo commands issued per HTTP request", ("method", "route"), DEFAULT_COUNT_BUCKETS)
+HTTP_MONGO_SECONDS = REGISTRY.histogram("http_request_mongo_seconds", "Time spent in Mongo commands per HTTP request", ("method", "route"))
+MONGO_COMMANDS = REGISTRY.counter("mongo_commands_total", "Mongo commands by name and collection", ("command", "collection"))
+MONGO_FAILURES = REGISTRY.counter("mongo_command_failures_total", "Failed Mongo commands", ("command", "collection"))
+MONGO_LATENCY = REGISTRY.histogram("mongo_command_duration_seconds", "Mongo command latency", ("command", "collection"))
+
+
+class RequestStats:
+    """Per-request accumulator shared with the Mongo listener threads"""
+
+    __slots__ = ("method", "path", "mongo_commands", "mongo_seconds", "commands", "_lock")
+
+    def __init__(self, method: str = "", path: str = ""):
+        self.method = method
+        self.path = path
+        self.mongo_commands = 0
+        self.mongo_seconds = 0.0
+        # "find tasks" -> count, para detectar patrones N+1
+        self.commands: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def record_mongo(self, seconds: float, key: str = ""):
+        with self._lock:
+            self.mongo_commands += 1
+            self.mongo_seconds += seconds
+            self.commands[key] = self.commands.get(key, 0) + 1
+
+
+current_request: contextvars.ContextVar[Optional[RequestStats]] = contextvars.ContextVar("current_request", default=None)
+
+
+def route_label(scope: dict) -> str:
+    """Route template (e.g. /api/tasks/{task_id}) to keep label cardinality bounded"""
+    route = scope.get("route")
+    path = getattr(route, "path", None)
+    return path or "unmatched"
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware so streaming responses are measured end to end"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats(scope.get("method", ""), scope.get("path", ""))
+        token = current_request.set(stats)
+        status_code = 500
+        response_size = 0
+        start = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status_code, response_size
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            elif message["type"] == "http.response.body":
+                response_size += len(message.get("body", b""))
+            await send(message)
+
+        HTTP_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            HTTP_IN_FLIGHT.dec()
+            current_request.reset(token)
+
+            labels = {"method": stats.method, "route": route_label(scope)}
+            HTTP_REQUESTS.inc(status=str(status_code), **labels)
+            HTTP_LATENCY.observe(elapsed, **labels)
+            HTTP_RESPONSE_SIZE.observe(response_size, **labels)
+            HTTP_MONGO_COMMANDS.observe(stats.mongo_commands, **labels)
+            HTTP_MONGO_SECONDS.observe(stats.mongo_seconds, **labels)
+
+
+def command_collection(command_name: str, command: dict) -> str:
+    if command_name == "getMore":
+        return str(command.get("collection", ""))
+    value = command.get(command_name)
+    return value if isinstance(value, str) else ""
+
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """Counts and times every Mongo command, globally and per request"""
+
+    def __init__(self):
+        # (connection_id, request_id) -> collection
+        self._pending: Dict[tuple, str] = {}
+
+    def started(self, event):
+        self._pending[(event.connection_id, event.request_id)] = command_collection(event.command_name, event.command)
+
+    def _finish(self, event, failed: bool):
+        collection = self._pending.pop((event.connection_id, event.request_id), "")
+        seconds = event.duration_micros / 1_000_000
+        MONGO_COMMANDS.inc(command=event.command_name, collection=collection)
+        MONGO_LATENCY.observe(seconds, command=event.command_name, collection=collection)
+        if failed:
+            MONGO_FAILURES.inc(command=event.command_name, collection=collection)
+
+        stats = current_request.get()
+        if stats is not None:
+            stats.record_mongo(seconds, f"{event.command_name} {collection}")
+
+    def succeeded(self, event):
+        self._finish(event, failed=False)
+
+    def failed(self, event):
+        self._finish(event, failed=True)
@@ -0,0 +1,161 @@
+"""
+Configuración del cliente de Mongo y métricas del pool de conexiones.
+
+Cada worker de uvicorn es un proceso con su propio `AsyncIOMotorClient` y
+su propio pool, así que el total de conexiones contra Mongo es
+`workers × (maxPoolSize + MONITOR_CONNECTIONS_PER_WORKER)`: además del pool,
+cada worker abre hasta 2 conexiones de monitoreo por servidor. Con
+MONGO_CONNECTION_BUDGET el pool de cada worker se calcula repartiendo ese
+total entre WEB_CONCURRENCY workers (lo exporta run_production.py) y
+descontando las de monitoreo, para escalar en cores sin agotar las conexiones
+del cluster. MONGO_MAX_POOL_SIZE explícito tiene prioridad.
+
+Variables de entorno:
+- MONGO_MAX_POOL_SIZE / MONGO_MIN_POOL_SIZE: tamaño del pool por worker
+- MONGO_CONNECTION_BUDGET: conexiones totales permitidas para todos los workers
+- MONGO_WAIT_QUEUE_TIMEOUT_MS: espera máxima por una conexión libre (5000 por defecto)
+- MONGO_MAX_IDLE_TIME_MS: cierra conexiones ociosas (60000 por defecto)
+- MONGO_MAX_CONNECTING: conexiones que se abren en paralelo (2 por defecto)
+- MONGO_COMPRESSORS: p. ej. "zstd,snappy,zlib"; se ignoran los no instalados
+- MONGO_READ_PREFERENCE: primary (por defecto), primaryPreferred, secondaryPreferred...
+
+`PoolMetrics` es un listener de pymongo (CMAP) que expone en /metrics:
+- mongo_pool_wait_seconds: espera hasta obtener una conexión del pool
+- mongo_pool_waiting: operaciones esperando una conexión
+- mongo_pool_connections{state}: conexiones abiertas y en uso
+- mongo_pool_checkout_failures_total{reason}: timeouts y errores al pedir conexión
+- mongo_pool_cleared_total: veces que se limpió el pool (failover, errores de red)
+Con varios workers cada pool es del proceso: las series llevan la label
+`worker` (ver MetricsExporter en metrics.py).
+"""
+import importlib.util
+import logging
+import os
+import threading
+import time
+from typing import Dict, Iterable, Mapping, Optional
+
+from pymongo import monitoring
+
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_POOL_SIZE = 100  # el default de pymongo
+DEFAULT_MIN_POOL_SIZE = 0
+DEFAULT_WAIT_QUEUE_TIMEOUT_MS = 5000
+DEFAULT_MAX_IDLE_TIME_MS = 60000
+DEFAULT_MAX_CONNECTING = 2
+# Conexiones de monitoreo (SDAM) por servidor y worker, aparte del pool
+MONITOR_CONNECTIONS_PER_WORKER = 2
+
+# Compresor -> paquete que pymongo necesita para usarlo
+_COMPRESSOR_MODULES = {"zstd": "zstandard", "snappy": "snappy", "zlib": "zlib"}
+
+POOL_WAIT = REGISTRY.histogram(
+    "mongo_pool_wait_seconds", "Time waiting to check out a Mongo connection",
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+)
+POOL_WAITING = REGISTRY.gauge("mongo_pool_waiting", "Operations waiting for a Mongo connection")
+POOL_CONNECTIONS = REGISTRY.gauge("mongo_pool_connections", "Mongo pool connections by state", ("state",))
+POOL_CHECKOUT_FAILURES = REGISTRY.counter("mongo_pool_checkout_failures_total", "Failed connection checkouts", ("reason",))
+POOL_CLEARED = REGISTRY.counter("mongo_pool_cleared_total", "Times a Mongo connection pool was cleared")
+
+
+def available_compressors(requested: Iterable[str]) -> list:
+    """Requested compressors whose Python package is installed, in order"""
+    available = []
+    for name in requested:
+        name = name.strip().lower()
+        module = _COMPRESSOR_MODULES.get(name)
+        if module and importlib.util.find_spec(module) is not None:
+            available.append(name)
+        elif name:
+            logger.warning("Compresor de Mongo no disponible, se ignora: %s", name)
+    return available
+
+
+def pool_size(environ: Mapping[str, str]) -> int:
+    """maxPoolSize for this worker: explicit, or its share of the connection budget minus monitoring connections"""
+    if environ.get("MONGO_MAX_POOL_SIZE"):
+        return int(environ["MONGO_MAX_POOL_SIZE"])
+    budget = int(environ.get("MONGO_CONNECTION_BUDGET", "0"))
+    if budget:
+        workers = max(1, int(environ.get("WEB_CONCURRENCY", "1")))
+        return max(1, budget // workers - MONITOR_CONNECTIONS_PER_WORKER)
+    return DEFAULT_MAX_POOL_SIZE
+
+
+def client_options(environ: Optional[Mapping[str, str]] = None) -> Dict[str, object]:
+    """Keyword arguments for AsyncIOMotorClient built from the environment"""
+    environ = os.environ if environ is None else environ
+    max_pool = pool_size(environ)
+    options: Dict[str, object] = {
+        "maxPoolSize": max_pool,
+        "minPoolSize": min(int(environ.get("MONGO_MIN_POOL_SIZE", DEFAULT_MIN_POOL_SIZE)), max_pool),
+        "waitQueueTimeoutMS": int(environ.get("MONGO_WAIT_QUEUE_TIMEOUT_MS", DEFAULT_WAIT_QUEUE_TIMEOUT_MS)),
+        "maxIdleTimeMS": int(environ.get("MONGO_MAX_IDLE_TIME_MS", DEFAULT_MAX_IDLE_TIME_MS)),
+        "maxConnecting": int(environ.get("MONGO_MAX_CONNECTING", DEFAULT_MAX_CONNECTING)),
+    }
+    compressors = available_compressors(environ.get("MONGO_COMPRESSORS", "").split(","))
+    if compressors:
+        options["compressors"] = ",".join(compressors)
+    if environ.get("MONGO_READ_PREFERENCE"):
+        options["readPreference"] = environ["MONGO_READ_PREFERENCE"]
+    return options
+
+
+class PoolMetrics(monitoring.ConnectionPoolListener):
+    """Connection pool (CMAP) listener: checkout wait time, waiting operations and pool size"""
+
+    def __init__(self):
+        # Motor hace el checkout en un thread del executor: inicio y fin ocurren en el mismo thread
+        self._local = threading.local()
+
+    def _checkout_finished(self) -> Optional[float]:
+        started = getattr(self._local, "started", None)
+        if started is None:
+            return None
+        self._local.started = None
+        POOL_WAITING.dec()
+        return time.perf_counter() - started
+
+    def connection_check_out_started(self, event):
+        self._local.started = time.perf_counter()
+        POOL_WAITING.inc()
+
+    def connection_checked_out(self, event):
+        waited = self._checkout_finished()
+        if waited is not None:
+            POOL_WAIT.observe(waited)
+        POOL_CONNECTIONS.inc(state="in_use")
+
+    def connection_check_out_failed(self, event):
+        waited = self._checkout_finished()
+        if waited is not None:
+            POOL_WAIT.observe(waited)
+        POOL_CHECKOUT_FAILURES.inc(reason=str(event.reason))
+
+    def connection_checked_in(self, event):
+        POOL_CONNECTIONS.dec(state="in_use")
+
+    def connection_created(self, event):
+        POOL_CONNECTIONS.inc(state="open")
+
+    def connection_closed(self, event):
+        POOL_CONNECTIONS.dec(state="open")
+
+    def pool_cleared(self, event):
+        POOL_CLEARED.inc()
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
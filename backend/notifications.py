@@ -0,0 +1,195 @@
+"""
+Motor de notificaciones de hitos de proyecto (25%, 50%, 75%, 100%).
+
+Los cambios de estado de tareas publican un evento (proyecto, progreso anterior,
+progreso nuevo) en una cola en memoria y el request responde sin esperar. Un
+grupo de workers toma los eventos en lotes, resuelve el destinatario de cada
+proyecto (el usuario cuyo email es el del cliente del proyecto) desde un cache
+con TTL, y guarda todas las notificaciones del lote con un solo insert_many.
+Los cambios de proyectos, clientes y usuarios suben la versión `recipients`
+de la empresa (ver cache_versions.py), así ningún worker sigue usando un
+destinatario viejo.
+
+Si la cola está llena el evento se descarta y se cuenta en
+milestone_events_dropped_total: una notificación perdida es preferible a
+frenar las escrituras de tareas. Al apagar, `stop()` procesa lo que quede en
+la cola antes de cancelar los workers.
+"""
+import asyncio
+import logging
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+from cache_versions import RECIPIENTS, CacheVersions, VersionedCompanies
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+MILESTONES = (25, 50, 75, 100)
+
+EVENTS_DROPPED = REGISTRY.counter("milestone_events_dropped_total", "Milestone events dropped because the queue was full")
+NOTIFICATIONS_SENT = REGISTRY.counter("milestone_notifications_total", "Milestone notifications stored", ("milestone",))
+QUEUE_DEPTH = REGISTRY.gauge("milestone_queue_depth", "Milestone events waiting to be processed")
+BATCH_SIZE = REGISTRY.histogram("milestone_batch_size", "Events processed per notification batch", buckets=(1, 2, 5, 10, 25, 50, 100, 250))
+
+
+def crossed_milestones(old_progress: int, new_progress: int) -> List[int]:
+    return [m for m in MILESTONES if old_progress < m <= new_progress]
+
+
+def milestone_message(project_name: Optional[str], milestone: int) -> str:
+    return f"El proyecto '{project_name}' ha alcanzado el {milestone}% de progreso. {'¡Listo para el siguiente pago!' if milestone in [25, 50, 75] else '¡Proyecto completado!'}"
+
+
+class MilestoneNotifier:
+    def __init__(self, workers: int = 2, max_queue: int = 10000, batch_size: int = 100, cache_ttl: float = 300,
+                 versions: Optional[CacheVersions] = None):
+        self.workers = workers
+        self.batch_size = batch_size
+        self.cache_ttl = cache_ttl
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self._tasks: List[asyncio.Task] = []
+        self._db = None
+        # project_id -> (expira, {"user_id", "project_name", "client_name"} o None si no hay destinatario, company_id)
+        self._recipients: Dict[str, Tuple[float, Optional[dict], Optional[str]]] = {}
+        self._versions = VersionedCompanies(versions, RECIPIENTS)
+
+    def start(self, db):
+        """Must be called from the event loop (e.g. a startup handler)"""
+        if self._tasks:
+            return
+        self._db = db
+        # La cola se crea de nuevo por si el loop cambió (tests, reinicios)
+        self._queue = asyncio.Queue(maxsize=self._queue.maxsize)
+        self._tasks = [asyncio.create_task(self._worker(), name=f"milestone-worker-{i}") for i in range(self.workers)]
+
+    async def stop(self, timeout: float = 5.0):
+        if not self._tasks:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Se descartan eventos de hitos pendientes al apagar", extra={"pending": self._queue.qsize()})
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def publish(self, project_id: str, old_progress: int, new_progress: int):
+        """Queue a progress change; returns immediately"""
+        if not crossed_milestones(old_progress, new_progress):
+            return
+        if not self._tasks:
+            logger.warning("Notificador de hitos detenido, evento descartado", extra={"project_id": project_id})
+            EVENTS_DROPPED.inc()
+            return
+        try:
+            self._queue.put_nowait((project_id, old_progress, new_progress))
+        except asyncio.QueueFull:
+            EVENTS_DROPPED.inc()
+            logger.warning("Cola de hitos llena, evento descartado", extra={"project_id": project_id})
+            return
+        QUEUE_DEPTH.set(self._queue.qsize())
+
+    def invalidate(self, project_id: Optional[str] = None):
+        """Forget cached recipients (all of them when project_id is None)"""
+        if project_id is None:
+            self._recipients.clear()
+        else:
+            self._recipients.pop(project_id, None)
+
+    async def _worker(self):
+        while True:
+            events = [await self._queue.get()]
+            while len(events) < self.batch_size:
+                try:
+                    events.append(self._queue.get_nowait())
+                except asyncio.QueueEmpty:
+                    break
+            QUEUE_DEPTH.set(self._queue.qsize())
+            try:
+                await self._process(events)
+            except Exception:
+                logger.exception("Error procesando notificaciones de hitos", extra={"events": len(events)})
+            finally:
+                for _ in events:
+                    self._queue.task_done()
+
+    async def _process(self, events: List[tuple]):
+        BATCH_SIZE.observe(len(events))
+        recipients = await self._resolve({project_id for project_id, _, _ in events})
+        now = datetime.now(timezone.utc).isoformat()
+        notifications = []
+        sent: Dict[int, int] = {}
+        for project_id, old_progress, new_progress in events:
+            recipient = recipients.get(project_id)
+            if not recipient:
+                continue
+            for milestone in crossed_milestones(old_progress, new_progress):
+                sent[milestone] = sent.get(milestone, 0) + 1
+                notifications.append({
+                    "id": str(uuid.uuid4()),
+                    "user_id": recipient["user_id"],
+                    "project_id": project_id,
+                    "type": "milestone",
+                    "title": f"¡Hito alcanzado: {milestone}%!",
+                    "message": milestone_message(recipient.get("project_name"), milestone),
+                    "read": False,
+                    "created_at": now
+                })
+        if not notifications:
+            return
+        await self._db.notifications.insert_many(notifications, ordered=False)
+        for milestone, count in sent.items():
+            NOTIFICATIONS_SENT.inc(count, milestone=str(milestone))
+        logger.info("Milestone notifications sent", extra={"count": len(notifications), "projects": len(recipients)})
+
+    async def _resolve(self, project_ids: set) -> Dict[str, Optional[dict]]:
+        """project_id -> recipient, reading only the projects missing from the cache (3 queries per batch at most)"""
+        companies = {cached[2] for cached in map(self._recipients.get, project_ids) if cached}
+        for company_id in companies:
+            if not await self._versions.check(self._db, company_id):
+                for project_id in [p for p, cached in self._recipients.items() if cached[2] == company_id]:
+                    del self._recipients[project_id]
+        now = time.monotonic()
+        resolved: Dict[str, Optional[dict]] = {}
+        missing = []
+        for project_id in project_ids:
+            cached = self._recipients.get(project_id)
+            if cached and cached[0] > now:
+                resolved[project_id] = cached[1]
+            else:
+                missing.append(project_id)
+        if not missing:
+            return resolved
+
+        db = self._db
+        projects = await db.projects.find(
+            {"id": {"$in": missing}}, {"_id": 0, "id": 1, "name": 1, "client_id": 1, "company_id": 1}
+        ).to_list(None)
+        client_ids = list({p["client_id"] for p in projects if p.get("client_id")})
+        clients = await db.clients.find(
+            {"id": {"$in": client_ids}}, {"_id": 0, "id": 1, "name": 1, "email": 1}
+        ).to_list(None) if client_ids else []
+        emails = list({c["email"] for c in clients if c.get("email")})
+        users = await db.users.find(
+            {"email": {"$in": emails}}, {"_id": 0, "id": 1, "email": 1}
+        ).to_list(None) if emails else []
+
+        client_map = {c["id"]: c for c in clients}
+        user_by_email = {u["email"]: u["id"] for u in users}
+        expires = now + self.cache_ttl
+        for project_id in missing:
+            resolved[project_id] = None
+        for project in projects:
+            client = client_map.get(project.get("client_id"))
+            user_id = user_by_email.get(client.get("email")) if client else None
+            resolved[project["id"]] = {
+                "user_id": user_id, "project_name": project.get("name"), "client_name": client.get("name")
+            } if user_id else None
+        company_of = {p["id"]: p.get("company_id") for p in projects}
+        for project_id in missing:
+            self._recipients[project_id] = (expires, resolved[project_id], company_of.get(project_id))
+        return resolved
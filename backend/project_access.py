@@ -0,0 +1,92 @@
+"""
+Cache de los proyectos visibles por usuario y por empresa.
+
+Casi todos los listados filtran por `project_id: {"$in": [...]}` y antes
+armaban esa lista con una consulta a `projects` en cada request. Aquí se
+guardan dos conjuntos con TTL:
+
+- ("assigned", user_id): proyectos donde el usuario está en assigned_users
+- ("company", company_id): todos los proyectos de la empresa
+
+Los endpoints de proyectos invalidan las claves afectadas al crear, eliminar o
+cambiar asignaciones, y suben la versión `project_access` de la empresa (ver
+cache_versions.py): los demás workers descartan los conjuntos de esa empresa
+en su siguiente lectura. El TTL acota lo que cambie un script. Como hay una
+clave por usuario, el cache guarda como mucho `max_entries` conjuntos y
+descarta los menos usados (PROJECT_ACCESS_CACHE_ENTRIES).
+"""
+import time
+from collections import OrderedDict
+from typing import Iterable, List, Optional, Tuple
+
+from cache_versions import PROJECT_ACCESS, CacheVersions, VersionedCompanies, company_key
+
+_PROJECTION = {"_id": 0, "id": 1, "client_id": 1}
+
+
+class ProjectAccessCache:
+    def __init__(self, ttl_seconds: float = 30, versions: Optional[CacheVersions] = None, max_entries: int = 10000):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        # clave -> (expira, proyectos, empresa), de la menos a la más usada
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[float, List[dict], str]]" = OrderedDict()
+        self._versions = VersionedCompanies(versions, PROJECT_ACCESS)
+
+    async def _get(self, db, key: Tuple[str, str], query: dict, company_id: Optional[str]) -> List[dict]:
+        if not await self._versions.check(db, company_id):
+            self._drop_company(company_key(company_id))
+        cached = self._entries.get(key)
+        now = time.monotonic()
+        if cached and cached[0] > now:
+            self._entries.move_to_end(key)
+            return cached[1]
+        projects = await db.projects.find(query, _PROJECTION).to_list(None)
+        self._entries[key] = (now + self.ttl_seconds, projects, company_key(company_id))
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return projects
+
+    def _drop_company(self, company: str):
+        for key in [k for k, entry in self._entries.items() if entry[2] == company]:
+            del self._entries[key]
+
+    async def assigned(self, db, user_id: str, company_id: Optional[str] = None) -> List[dict]:
+        return await self._get(db, ("assigned", user_id), {"assigned_users": user_id}, company_id)
+
+    async def company(self, db, company_id: Optional[str]) -> List[dict]:
+        return await self._get(db, ("company", company_id), {"company_id": company_id}, company_id)
+
+    def invalidate_project(self, company_id: Optional[str], user_ids: Iterable[str] = ()):
+        """Drop the sets a project belongs to: its company and every user assigned to it"""
+        self._entries.pop(("company", company_id), None)
+        for user_id in user_ids:
+            self._entries.pop(("assigned", user_id), None)
+
+    def clear(self):
+        self._entries.clear()
+
+
+class ProjectScope:
+    """Per-request view of the projects a user can reach; sets are loaded on first use"""
+
+    def __init__(self, db, user: dict, cache: ProjectAccessCache):
+        self.db = db
+        self.user = user
+        self.cache = cache
+
+    async def assigned_ids(self) -> List[str]:
+        return [p["id"] for p in await self.cache.assigned(self.db, self.user["id"], self.user.get("company_id"))]
+
+    async def assigned_client_ids(self) -> List[str]:
+        projects = await self.cache.assigned(self.db, self.user["id"], self.user.get("company_id"))
+        return [p["client_id"] for p in projects if p.get("client_id")]
+
+    async def company_ids(self) -> List[str]:
+        return [p["id"] for p in await self.cache.company(self.db, self.user.get("company_id"))]
+
+    async def visible_ids(self) -> List[str]:
+        """USER sees assigned projects; other roles see the whole company"""
+        if self.user["role"] == "USER":
+            return await self.assigned_ids()
+        return await self.company_ids()
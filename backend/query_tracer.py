@@ -0,0 +1,204 @@
+"""
+Trazado de consultas de Mongo por request.
+
+- `QueryTracer`: listener de pymongo que registra en el log las consultas más
+  lentas que `slow_ms`, con la forma del filtro (valores reemplazados por "?")
+  y, si está habilitado, un resumen del plan obtenido con `explain`.
+- `query_budget(n)`: decorador que declara cuántos comandos de Mongo puede
+  ejecutar un endpoint. `QueryBudgetMiddleware` lo verifica al enviar la
+  respuesta: en modo "warn" solo registra, en modo "strict" (tests) responde 500.
+
+La request actual se obtiene del contextvar `metrics.current_request`, que
+`MetricsMiddleware` inicializa en cada request.
+"""
+import asyncio
+import json
+import logging
+from typing import Any, Dict, Optional
+
+from pymongo import monitoring
+
+from metrics import REGISTRY, command_collection, current_request, route_label
+
+logger = logging.getLogger(__name__)
+
+BUDGET_EXCEEDED = REGISTRY.counter("mongo_query_budget_exceeded_total", "Requests that exceeded their Mongo query budget", ("route",))
+SLOW_QUERIES = REGISTRY.counter("mongo_slow_queries_total", "Mongo commands slower than the slow-query threshold", ("command", "collection"))
+
+# Comandos internos que no interesa trazar
+_IGNORED_COMMANDS = {"explain", "hello", "isMaster", "ismaster", "ping", "endSessions", "saslStart", "saslContinue", "buildInfo"}
+
+# Comandos que aceptan explain con verbosity queryPlanner
+_EXPLAINABLE = {"find", "aggregate", "count", "distinct"}
+
+
+def query_shape(value: Any) -> Any:
+    """Replace literal values with '?' keeping field names and operators"""
+    if isinstance(value, dict):
+        return {k: query_shape(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        if value and all(isinstance(v, dict) for v in value):
+            return [query_shape(v) for v in value]
+        return ["?"] if value else []
+    return "?"
+
+
+def command_filter(command_name: str, command: dict) -> Any:
+    if command_name == "find":
+        return command.get("filter", {})
+    if command_name in ("count", "distinct", "findAndModify"):
+        return command.get("query", {})
+    if command_name == "aggregate":
+        pipeline = command.get("pipeline") or []
+        return pipeline[0].get("$match", {}) if pipeline and isinstance(pipeline[0], dict) else {}
+    if command_name in ("update", "delete"):
+        statements = command.get("updates" if command_name == "update" else "deletes") or []
+        return statements[0].get("q", {}) if statements else {}
+    return {}
+
+
+def summarize_plan(explain_result: dict) -> str:
+    """Compact winning plan such as 'FETCH > IXSCAN(project_id_1)' or 'COLLSCAN'"""
+    planner = explain_result.get("queryPlanner")
+    if planner is None:
+        # aggregate explain wraps the planner inside the first stage
+        for stage in explain_result.get("stages", []):
+            cursor = stage.get("$cursor")
+            if cursor:
+                planner = cursor.get("queryPlanner")
+                break
+    if not planner:
+        return "unknown"
+
+    parts = []
+    stage = planner.get("winningPlan", {})
+    stage = stage.get("queryPlan", stage)
+    while stage:
+        name = stage.get("stage", "?")
+        if stage.get("indexName"):
+            name += f"({stage['indexName']})"
+        parts.append(name)
+        stage = stage.get("inputStage")
+    return " > ".join(parts) or "unknown"
+
+
+class QueryTracer(monitoring.CommandListener):
+    """Logs slow Mongo commands with their filter shape and plan summary"""
+
+    def __init__(self, slow_ms: float = 100.0, explain: bool = False):
+        self.slow_ms = slow_ms
+        self.explain = explain
+        self._pending: Dict[tuple, tuple] = {}
+        self._plans: Dict[str, str] = {}
+        self._db = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def configure(self, db, loop: asyncio.AbstractEventLoop):
+        """Needed only for explain: the listener runs in Motor's executor threads"""
+        self._db = db
+        self._loop = loop
+
+    def started(self, event):
+        if event.command_name in _IGNORED_COMMANDS:
+            return
+        self._pending[(event.connection_id, event.request_id)] = (event.database_name, event.command)
+
+    def succeeded(self, event):
+        self._finish(event)
+
+    def failed(self, event):
+        self._finish(event)
+
+    def _finish(self, event):
+        pending = self._pending.pop((event.connection_id, event.request_id), None)
+        if pending is None:
+            return
+        elapsed_ms = event.duration_micros / 1000
+        if elapsed_ms < self.slow_ms:
+            return
+
+        database_name, command = pending
+        collection = command_collection(event.command_name, command)
+        shape = json.dumps(query_shape(command_filter(event.command_name, command)), sort_keys=True, default=str)
+        shape_key = f"{collection}.{event.command_name} {shape}"
+        stats = current_request.get()
+
+        SLOW_QUERIES.inc(command=event.command_name, collection=collection)
+        logger.warning(
+            "Slow query %.1fms %s.%s filter=%s plan=%s request=%s %s",
+            elapsed_ms, collection, event.command_name, shape,
+            self._plans.get(shape_key, "pending" if self.explain else "n/a"),
+            stats.method if stats else "-", stats.path if stats else "-"
+        )
+
+        if self.explain and shape_key not in self._plans and event.command_name in _EXPLAINABLE:
+            self._plans[shape_key] = "pending"
+            self._schedule_explain(shape_key, database_name, command)
+
+    def _schedule_explain(self, shape_key: str, database_name: str, command: dict):
+        if self._db is None or self._loop is None or self._loop.is_closed():
+            return
+        explain_command = {k: v for k, v in command.items() if not k.startswith("$") and k not in ("lsid", "txnNumber", "readConcern")}
+        coroutine = self._explain(shape_key, database_name, explain_command)
+        try:
+            asyncio.run_coroutine_threadsafe(coroutine, self._loop)
+        except RuntimeError:
+            coroutine.close()
+
+    async def _explain(self, shape_key: str, database_name: str, command: dict):
+        try:
+            result = await self._db.client[database_name].command({"explain": command, "verbosity": "queryPlanner"})
+            self._plans[shape_key] = summarize_plan(result)
+            logger.info("Query plan %s -> %s", shape_key, self._plans[shape_key])
+        except Exception as e:
+            self._plans[shape_key] = f"explain failed: {e}"
+
+
+def query_budget(max_commands: int):
+    """Declare the maximum number of Mongo commands an endpoint may issue"""
+    def decorator(endpoint):
+        endpoint.query_budget = max_commands
+        return endpoint
+    return decorator
+
+
+class QueryBudgetMiddleware:
+    """Checks per-route query budgets; must run inside MetricsMiddleware"""
+
+    def __init__(self, app, mode: str = "warn"):
+        self.app = app
+        self.mode = mode
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or self.mode == "off":
+            await self.app(scope, receive, send)
+            return
+
+        replaced = False
+
+        async def send_wrapper(message):
+            nonlocal replaced
+            if replaced:
+                return
+            if message["type"] == "http.response.start":
+                budget = getattr(scope.get("endpoint"), "query_budget", None)
+                stats = current_request.get()
+                if budget is not None and stats is not None and stats.mongo_commands > budget:
+                    route = route_label(scope)
+                    BUDGET_EXCEEDED.inc(route=route)
+                    top = sorted(stats.commands.items(), key=lambda item: item[1], reverse=True)[:5]
+                    detail = f"{route} ejecutó {stats.mongo_commands} consultas (presupuesto {budget}): {top}"
+                    if self.mode == "strict":
+                        replaced = True
+                        body = json.dumps({"detail": f"Presupuesto de consultas excedido: {detail}"}, ensure_ascii=False).encode("utf-8")
+                        await send({
+                            "type": "http.response.start",
+                            "status": 500,
+                            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+                        })
+                        await send({"type": "http.response.body", "body": body})
+                        return
+                    logger.warning("Query budget exceeded: %s", detail)
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Lecturas analíticas en réplicas secundarias.
+
+Los reportes (métricas globales, dashboard, estadísticas de cuentas por
+cobrar, logs de actividad, historial de reasignaciones, exportación a Excel)
+hacen conteos y listados grandes que compiten en el primario con las
+escrituras del Kanban. Esas rutas leen de `analytics_db`: la misma base con
+read preference `secondaryPreferred` y staleness acotada, así que pueden
+mostrar datos con hasta `ANALYTICS_MAX_STALENESS_SECONDS` de atraso. Si no
+hay secundarias disponibles (o el servidor es standalone) leen del primario.
+
+Todo lo transaccional (lecturas antes de escribir, read-after-write, caches
+que se actualizan de forma incremental como el reporte de carga) sigue en
+`db`, con la read preference del cliente (primary por defecto).
+
+Variables de entorno (leídas en el servidor):
+- ANALYTICS_READ_PREFERENCE: secondaryPreferred (por defecto), secondary,
+  nearest, primaryPreferred o primary (desactiva el ruteo)
+- ANALYTICS_MAX_STALENESS_SECONDS: atraso máximo tolerado (120 por defecto;
+  Mongo exige al menos 90, -1 sin límite)
+
+Para probarlo con un replica set local:
+    python read_routing.py          # muestra qué servidor atiende cada lectura
+"""
+import os
+import sys
+from typing import Optional
+
+from pymongo.read_preferences import Nearest, PrimaryPreferred, Secondary, SecondaryPreferred
+
+DEFAULT_READ_PREFERENCE = "secondaryPreferred"
+DEFAULT_MAX_STALENESS_SECONDS = 120
+MIN_MAX_STALENESS_SECONDS = 90  # mínimo que acepta el servidor
+
+_READ_PREFERENCES = {
+    "primarypreferred": PrimaryPreferred,
+    "secondary": Secondary,
+    "secondarypreferred": SecondaryPreferred,
+    "nearest": Nearest,
+}
+
+
+def analytics_read_preference(mode: str = DEFAULT_READ_PREFERENCE,
+                              max_staleness_seconds: int = DEFAULT_MAX_STALENESS_SECONDS):
+    """Read preference for analytic reads, or None to keep the client's (primary)"""
+    mode = (mode or "primary").strip().lower()
+    if mode == "primary":
+        return None
+    try:
+        preference = _READ_PREFERENCES[mode]
+    except KeyError:
+        raise ValueError(f"ANALYTICS_READ_PREFERENCE desconocida: '{mode}'")
+    if max_staleness_seconds != -1 and max_staleness_seconds < MIN_MAX_STALENESS_SECONDS:
+        raise ValueError(f"ANALYTICS_MAX_STALENESS_SECONDS debe ser -1 o al menos {MIN_MAX_STALENESS_SECONDS}")
+    return preference(max_staleness=max_staleness_seconds)
+
+
+def analytics_database(client, name: str, mode: str = DEFAULT_READ_PREFERENCE,
+                       max_staleness_seconds: int = DEFAULT_MAX_STALENESS_SECONDS):
+    """Same database as `client[name]`, routed to secondaries for read-only reports"""
+    preference = analytics_read_preference(mode, max_staleness_seconds)
+    if preference is None:
+        return client[name]
+    return client.get_database(name, read_preference=preference)
+
+
+def describe_routing(mongo_url: str, name: str, collection: str = "activity_logs",
+                     mode: Optional[str] = None, max_staleness_seconds: Optional[int] = None) -> dict:
+    """Which server answers a primary read and an analytic read (sync pymongo, for local checks)"""
+    from pymongo import MongoClient
+
+    client = MongoClient(mongo_url, serverSelectionTimeoutMS=5000)
+    try:
+        hello = client.admin.command("hello")
+        result = {
+            "replica_set": hello.get("setName"),
+            "primary": hello.get("primary"),
+            "hosts": hello.get("hosts", []),
+        }
+        databases = {
+            "primary": client[name],
+            "analytics": analytics_database(
+                client, name,
+                mode if mode is not None else os.environ.get("ANALYTICS_READ_PREFERENCE", DEFAULT_READ_PREFERENCE),
+                max_staleness_seconds if max_staleness_seconds is not None
+                else int(os.environ.get("ANALYTICS_MAX_STALENESS_SECONDS", DEFAULT_MAX_STALENESS_SECONDS)),
+            ),
+        }
+        for label, database in databases.items():
+            cursor = database[collection].find({}, {"_id": 1}).limit(1)
+            list(cursor)
+            address = cursor.address
+            result[label] = {
+                "read_preference": repr(database.read_preference),
+                "server": f"{address[0]}:{address[1]}" if address else None,
+            }
+        return result
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    from pathlib import Path
+
+    from dotenv import load_dotenv
+
+    load_dotenv(Path(__file__).parent / ".env")
+    routing = describe_routing(os.environ["MONGO_URL"], os.environ.get("DB_NAME", "pactum_saas"))
+    print(f"replica set: {routing['replica_set'] or '(standalone)'}  primario: {routing['primary']}")
+    for label in ("primary", "analytics"):
+        print(f"{label:<10} {routing[label]['server']:<24} {routing[label]['read_preference']}")
+    if routing["replica_set"] and routing["analytics"]["server"] == routing["primary"]:
+        print("Las lecturas analíticas fueron al primario: ¿hay secundarias dentro de la staleness permitida?")
+        sys.exit(1)
@@ -0,0 +1,160 @@
+"""
+Acceso a colecciones con alcance de empresa y proyecciones obligatorias.
+
+Cada repositorio se crea para un tenant y agrega el filtro de tenant a todas
+sus lecturas y escrituras, así un handler no puede olvidarse el
+`company_id`. Las colecciones con `company_id` propio usan
+`TenantRepository`; las tareas no lo tienen y se acotan a los proyectos ya
+autorizados (`TaskRepository`). Un documento de otra empresa se ve igual que
+uno inexistente (None → 404). Un usuario sin empresa (SUPER_ADMIN en una ruta
+que no habilita todas las empresas) no ve ningún documento, en lugar de los
+que no tienen `company_id`.
+
+Las lecturas exigen una proyección: un dict o el nombre de una de las
+`projections` del repositorio, para que cada ruta traiga solo los campos que
+usa. `_id` nunca se devuelve. Orden por defecto y límite máximo de los
+listados también se definen por colección.
+"""
+from typing import Any, Dict, Iterable, List, Optional, Union
+
+Projection = Union[str, Dict[str, Any]]
+
+# Filtro que no coincide con ningún documento (todos tienen _id)
+MATCH_NOTHING = {"_id": {"$exists": False}}
+
+
+class Repository:
+    collection: str = ""
+    default_sort: Optional[List[tuple]] = None
+    default_limit: int = 100
+    max_limit: int = 1000
+    projections: Dict[str, Dict[str, Any]] = {}
+
+    def __init__(self, db):
+        self.db = db
+
+    @property
+    def _collection(self):
+        return self.db[self.collection]
+
+    def scope(self) -> dict:
+        """Tenant filter added to every query"""
+        raise NotImplementedError
+
+    def _filter(self, query: Optional[dict]) -> dict:
+        scope = self.scope()
+        if not query:
+            return dict(scope)
+        if not scope:
+            return dict(query)
+        # $and para que el filtro del handler no pueda pisar el del tenant
+        return {"$and": [scope, query]}
+
+    def _projection(self, projection: Projection) -> Dict[str, Any]:
+        if isinstance(projection, str):
+            try:
+                projection = self.projections[projection]
+            except KeyError:
+                raise ValueError(f"{type(self).__name__}: proyección desconocida '{projection}'")
+        if not projection:
+            raise ValueError(f"{type(self).__name__}: las lecturas requieren una proyección explícita")
+        return {**projection, "_id": 0}
+
+    async def get(self, query: dict, projection: Projection) -> Optional[dict]:
+        return await self._collection.find_one(self._filter(query), self._projection(projection))
+
+    async def list(self, query: Optional[dict], projection: Projection,
+                   sort: Optional[List[tuple]] = None, limit: Optional[int] = None) -> List[dict]:
+        limit = min(limit or self.default_limit, self.max_limit)
+        cursor = self._collection.find(self._filter(query), self._projection(projection))
+        sort = sort or self.default_sort
+        if sort:
+            cursor = cursor.sort(sort)
+        return await cursor.to_list(limit)
+
+    async def count(self, query: Optional[dict] = None) -> int:
+        return await self._collection.count_documents(self._filter(query))
+
+    async def update(self, query: dict, update: dict):
+        return await self._collection.update_one(self._filter(query), update)
+
+    async def delete(self, query: dict):
+        return await self._collection.delete_one(self._filter(query))
+
+
+class TenantRepository(Repository):
+    """Collections whose documents carry company_id"""
+
+    tenant_field = "company_id"
+
+    def __init__(self, db, company_id: Optional[str], all_companies: bool = False):
+        super().__init__(db)
+        self.company_id = company_id
+        self.all_companies = all_companies
+
+    @classmethod
+    def for_user(cls, db, user: dict, allow_all_companies: bool = False):
+        """Scoped to the user's company; SUPER_ADMIN sees every company only where the route allows it"""
+        return cls(db, user.get("company_id"), all_companies=allow_all_companies and user.get("role") == "SUPER_ADMIN")
+
+    def scope(self) -> dict:
+        if self.all_companies:
+            return {}
+        if self.company_id is None:
+            return dict(MATCH_NOTHING)
+        return {self.tenant_field: self.company_id}
+
+    async def insert(self, document: dict):
+        if not self.all_companies:
+            if self.company_id is None:
+                raise ValueError(f"{type(self).__name__}: no se puede insertar sin empresa")
+            document = {**document, self.tenant_field: self.company_id}
+        return await self._collection.insert_one(document)
+
+
+class ProjectRepository(TenantRepository):
+    collection = "projects"
+    default_limit = 100
+    projections = {
+        # Documento completo para las respuestas de la API (los campos del proyecto son libres)
+        "detail": {"_id": 0},  # _projection lo agrega igual; un dict vacío se rechaza
+        "access": {"id": 1, "company_id": 1, "assigned_users": 1},
+        # Lo que usan los índices en memoria (autocompletado, permisos) al escribir
+        "write": {"id": 1, "name": 1, "client_name": 1, "client_id": 1, "status": 1, "company_id": 1, "assigned_users": 1},
+    }
+
+    @staticmethod
+    def visibility(user: dict) -> dict:
+        """Extra filter for roles that only see the projects they are assigned to"""
+        if user["role"] in ("SUPER_ADMIN", "COMPANY_ADMIN"):
+            return {}
+        return {"assigned_users": user["id"]}
+
+
+class TaskRepository(Repository):
+    """Tasks of projects the caller already authorized (tasks have no company_id of their own)"""
+
+    collection = "tasks"
+    max_limit = 1000
+
+    def __init__(self, db, project_ids: Iterable[str]):
+        super().__init__(db)
+        self.project_ids = list(project_ids)
+
+    def scope(self) -> dict:
+        if len(self.project_ids) == 1:
+            return {"project_id": self.project_ids[0]}
+        return {"project_id": {"$in": self.project_ids}}
+
+    async def status_counts(self, done_status: str = "done") -> Dict[str, int]:
+        """Total and completed task counts, computed in Mongo"""
+        rows = await self._collection.aggregate([
+            {"$match": self._filter(None)},
+            {"$group": {
+                "_id": None,
+                "total": {"$sum": 1},
+                "done": {"$sum": {"$cond": [{"$eq": ["$status", done_status]}, 1, 0]}},
+            }},
+        ]).to_list(1)
+        row = rows[0] if rows else {}
+        return {"total": row.get("total", 0), "done": row.get("done", 0)}
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Arranque de producción: varios workers de uvicorn con el pool de Mongo acotado.
+
+Cada worker es un proceso con su propio event loop y su propio pool de Motor.
+Antes de lanzar los workers se exporta WEB_CONCURRENCY para que cada uno
+calcule su parte de MONGO_CONNECTION_BUDGET (ver mongo_pool.py) y se muestra
+el total de conexiones que puede abrir el despliegue completo, pool más
+monitoreo. Si ese mismo total supera el presupuesto, no arranca.
+
+Los caches en memoria de server_multitenant (proyectos visibles, reporte de
+carga, autocompletado, destinatarios de hitos) son por worker; cada escritura
+sube la versión de la empresa en `cache_versions` y los demás workers
+descartan sus datos de esa empresa a más tardar en
+CACHE_VERSION_CHECK_SECONDS (ver cache_versions.py).
+
+Con varios workers se crea un directorio temporal para METRICS_MULTIPROC_DIR:
+`/metrics` devuelve las series de todos los workers con la label `worker`.
+
+Con SIGTERM/SIGINT uvicorn deja de aceptar conexiones, espera hasta
+--graceful-timeout a que terminen las requests en curso y corre el shutdown
+de cada worker, que detiene las tareas de fondo y cierra el cliente de Mongo.
+
+Uso:
+    python run_production.py                                  # WEB_CONCURRENCY o un worker por core
+    python run_production.py --workers 4 --port 8000
+    MONGO_CONNECTION_BUDGET=200 python run_production.py --workers 8
+    python run_production.py --check                          # solo mostrar el plan
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+from pathlib import Path
+
+import uvicorn
+
+ROOT_DIR = Path(__file__).parent
+sys.path.insert(0, str(ROOT_DIR))
+
+from mongo_pool import MONITOR_CONNECTIONS_PER_WORKER, client_options  # noqa: E402
+
+def default_workers() -> int:
+    return int(os.environ.get("WEB_CONCURRENCY") or os.cpu_count() or 1)
+
+
+def connection_plan(workers: int) -> dict:
+    environ = {**os.environ, "WEB_CONCURRENCY": str(workers)}
+    options = client_options(environ)
+    per_worker = options["maxPoolSize"] + MONITOR_CONNECTIONS_PER_WORKER
+    return {
+        "workers": workers,
+        "options": options,
+        "max_connections": workers * per_worker,
+        "budget": int(environ.get("MONGO_CONNECTION_BUDGET", "0")),
+    }
+
+
+def main(args) -> int:
+    plan = connection_plan(args.workers)
+    options = plan["options"]
+    print(f"workers: {plan['workers']}")
+    print("pool por worker: " + ", ".join(f"{k}={v}" for k, v in options.items()))
+    print(f"conexiones máximas a Mongo (por servidor): {plan['max_connections']}"
+          + (f" (presupuesto {plan['budget']})" if plan["budget"] else ""))
+    if plan["budget"] and plan["max_connections"] > plan["budget"]:
+        print("Las conexiones de los workers superan MONGO_CONNECTION_BUDGET: bajar MONGO_MAX_POOL_SIZE o --workers")
+        return 1
+    if args.check:
+        return 0
+
+    os.environ["WEB_CONCURRENCY"] = str(args.workers)
+    metrics_dir = None
+    if args.workers > 1 and not os.environ.get("METRICS_MULTIPROC_DIR"):
+        # /metrics junta los registros de todos los workers (ver metrics.py)
+        metrics_dir = os.environ["METRICS_MULTIPROC_DIR"] = tempfile.mkdtemp(prefix="pactum-metrics-")
+    try:
+        serve(args)
+    finally:
+        if metrics_dir:
+            shutil.rmtree(metrics_dir, ignore_errors=True)
+    return 0
+
+
+def serve(args):
+    uvicorn.run(
+        f"{args.module}:app",
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        app_dir=str(ROOT_DIR),
+        proxy_headers=True,
+        forwarded_allow_ips=os.environ.get("FORWARDED_ALLOW_IPS", "127.0.0.1"),
+        timeout_keep_alive=args.keep_alive,
+        timeout_graceful_shutdown=args.graceful_timeout,
+        limit_max_requests=args.max_requests or None,
+        log_level=os.environ.get("LOG_LEVEL", "info").lower(),
+    )
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Servidor de producción con varios workers")
+    parser.add_argument("--module", default="server_multitenant")
+    parser.add_argument("--host", default=os.environ.get("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.environ.get("PORT", "8000")))
+    parser.add_argument("--workers", type=int, default=default_workers())
+    parser.add_argument("--graceful-timeout", type=int, default=int(os.environ.get("GRACEFUL_SHUTDOWN_SECONDS", "30")),
+                        help="Segundos para terminar las requests en curso al apagar")
+    parser.add_argument("--keep-alive", type=int, default=int(os.environ.get("KEEP_ALIVE_SECONDS", "5")))
+    parser.add_argument("--max-requests", type=int, default=int(os.environ.get("WORKER_MAX_REQUESTS", "0")),
+                        help="Reiniciar cada worker tras N requests (0 = nunca)")
+    parser.add_argument("--check", action="store_true", help="Mostrar el plan de conexiones y salir")
+    return parser
+
+
+if __name__ == "__main__":
+    sys.exit(main(build_parser().parse_args()))
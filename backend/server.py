@@ -1,9 +1,11 @@
 from fastapi import FastAPI, APIRouter, HTTPException, Depends, UploadFile, File, Form
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from fastapi.responses import Response, JSONResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
 import os
+import asyncio
 import logging
 from pathlib import Path
 from pydantic import BaseModel, Field, ConfigDict
@@ -14,6 +16,13 @@ import bcrypt
 import jwt
 import aiofiles
 from bson import ObjectId
+from loop_monitor import LoopMonitor
+from compression import CompressionMiddleware
+from startup_jobs import BackgroundJobs
+from contract_extraction import ContractExtractor, JOBS as CONTRACT_JOBS, PAGES as CONTRACT_PAGES
+from contract_analysis import AnalysisCache, EmergentAnalyzer, LocalStubAnalyzer, analyze_cached, content_hash, file_hash
+from contract_search import CHUNK_CHARS, SELECTION_VERSION, ContractSearch
+from metrics import MetricsExporter, REGISTRY as METRICS_REGISTRY, CONTENT_TYPE as METRICS_CONTENT_TYPE
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
@@ -43,6 +52,34 @@ UPLOAD_DIR.mkdir(exist_ok=True)
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Watchdog del event loop (lag y llamadas bloqueantes); LOOP_MONITOR=0 lo desactiva
+loop_monitor = LoopMonitor.from_env()
+
+# /metrics de todos los workers cuando run_production define METRICS_MULTIPROC_DIR (ver metrics.py)
+metrics_exporter = MetricsExporter.from_env(METRICS_REGISTRY)
+
+# Extracción de texto de PDFs en procesos aparte (ver contract_extraction.py)
+contract_extractor = ContractExtractor(
+    max_workers=int(os.environ.get('PDF_EXTRACT_WORKERS', '2')),
+    pages_per_chunk=int(os.environ.get('PDF_PAGES_PER_CHUNK', '20'))
+)
+
+# Análisis de contratos: CONTRACT_ANALYZER=stub usa respuestas locales sin LLM (ver contract_analysis.py)
+if os.environ.get('CONTRACT_ANALYZER', '').lower() == 'stub':
+    contract_analyzer = LocalStubAnalyzer()
+elif EMERGENT_LLM_KEY:
+    contract_analyzer = EmergentAnalyzer(EMERGENT_LLM_KEY)
+else:
+    contract_analyzer = None
+analysis_cache = AnalysisCache(max_entries=int(os.environ.get('ANALYSIS_CACHE_ENTRIES', '1000')))
+# Índice BM25 por proyecto sobre el texto extraído (ver contract_search.py)
+contract_search = ContractSearch(ttl_seconds=float(os.environ.get('CONTRACT_SEARCH_TTL_SECONDS', '600')))
+ANALYSIS_PASSAGES = int(os.environ.get('ANALYSIS_PASSAGES', '8'))
+
+# Seed y limpieza de logs corren en segundo plano; /ready indica cuándo terminó el seed
+background_jobs = BackgroundJobs()
+LOG_CLEANUP_INTERVAL_SECONDS = float(os.environ.get('LOG_CLEANUP_INTERVAL_HOURS', '24')) * 3600
+
 # ===================== MODELS =====================
 
 class UserCreate(BaseModel):
@@ -554,29 +591,38 @@ async def upload_contract(
         content = await file.read()
         await f.write(content)
     
-    # Extract text from PDF
-    extracted_text = ""
-    try:
-        from PyPDF2 import PdfReader
-        reader = PdfReader(str(file_path))
-        for page in reader.pages:
-            extracted_text += page.extract_text() or ""
-    except Exception as e:
-        logger.error(f"Error extracting PDF text: {e}")
-    
     contract_doc = {
         "id": file_id,
         "project_id": project_id,
         "filename": file.filename,
         "file_path": str(file_path),
-        "extracted_text": extracted_text,
+        "content_hash": content_hash(content),
+        "extracted_text": "",
+        "text_status": "processing",
+        "pages_count": None,
         "uploaded_by": user["id"],
         "uploaded_at": datetime.now(timezone.utc).isoformat()
     }
     await db.contracts.insert_one(contract_doc)
+    # El texto se extrae en segundo plano; el progreso se consulta en /contracts/jobs/{job_id}
+    job = await contract_extractor.submit(db, file_id, str(file_path), on_done=lambda: contract_search.invalidate(project_id))
+    await db.contracts.update_one({"id": file_id}, {"$set": {"extraction_job_id": job["id"]}})
     await log_activity("contract", file_id, "uploaded", user, {"filename": file.filename})
     
-    return {"id": file_id, "filename": file.filename, "message": "Contrato subido exitosamente"}
+    return {
+        "id": file_id,
+        "filename": file.filename,
+        "job_id": job["id"],
+        "text_status": "processing",
+        "message": "Contrato subido exitosamente"
+    }
+
+@api_router.get("/contracts/jobs/{job_id}")
+async def get_contract_job(job_id: str, user: dict = Depends(get_current_user)):
+    job = await db[CONTRACT_JOBS].find_one({"id": job_id}, {"_id": 0})
+    if not job:
+        raise HTTPException(status_code=404, detail="Proceso no encontrado")
+    return job
 
 @api_router.get("/contracts")
 async def get_contracts(project_id: Optional[str] = None, user: dict = Depends(get_current_user)):
@@ -591,6 +637,36 @@ async def get_contract(contract_id: str, user: dict = Depends(get_current_user))
         raise HTTPException(status_code=404, detail="Contrato no encontrado")
     return contract
 
+@api_router.get("/contracts/{contract_id}/pages")
+async def get_contract_pages(contract_id: str, from_page: int = 1, limit: int = 20, user: dict = Depends(get_current_user)):
+    """Extracted text page by page; pages already processed are available while the job runs"""
+    contract = await db.contracts.find_one({"id": contract_id}, {"_id": 0, "id": 1, "text_status": 1, "pages_count": 1})
+    if not contract:
+        raise HTTPException(status_code=404, detail="Contrato no encontrado")
+    limit = max(1, min(limit, 100))
+    pages = await db[CONTRACT_PAGES].find(
+        {"contract_id": contract_id, "page": {"$gte": from_page}}, {"_id": 0, "page": 1, "text": 1}
+    ).sort("page", 1).to_list(limit)
+    return {
+        "contract_id": contract_id,
+        "text_status": contract.get("text_status", "done"),
+        "pages_count": contract.get("pages_count"),
+        "pages": pages
+    }
+
+@api_router.get("/contracts/{contract_id}/search")
+async def search_contract(contract_id: str, q: str, limit: int = 5, user: dict = Depends(get_current_user)):
+    contract = await db.contracts.find_one({"id": contract_id}, {"_id": 0, "id": 1, "project_id": 1, "text_status": 1})
+    if not contract:
+        raise HTTPException(status_code=404, detail="Contrato no encontrado")
+    results = await contract_search.search(db, contract, q, max(1, min(limit, 20)))
+    return {
+        "contract_id": contract_id,
+        "query": q,
+        "text_status": contract.get("text_status", "done"),
+        "results": [{k: r[k] for k in ("page", "chunk", "score", "text")} for r in results]
+    }
+
 @api_router.post("/contracts/{contract_id}/analyze")
 async def analyze_contract(contract_id: str, data: dict, user: dict = Depends(get_current_user)):
     """Analyze contract using AI to check compliance"""
@@ -598,34 +674,25 @@ async def analyze_contract(contract_id: str, data: dict, user: dict = Depends(ge
     if not contract:
         raise HTTPException(status_code=404, detail="Contrato no encontrado")
     
-    if not EMERGENT_LLM_KEY:
+    if contract_analyzer is None:
         raise HTTPException(status_code=500, detail="API key no configurada")
     
     question = data.get("question", "Resume los puntos principales del contrato")
     
     try:
-        from emergentintegrations.llm.chat import LlmChat, UserMessage, FileContentWithMimeType
-        
-        chat = LlmChat(
-            api_key=EMERGENT_LLM_KEY,
-            session_id=f"contract-{contract_id}",
-            system_message="Eres un asistente legal que analiza contratos en español. Responde de forma clara y estructurada."
-        ).with_model("gemini", "gemini-2.5-flash")
-        
-        file_content = FileContentWithMimeType(
-            file_path=contract["file_path"],
-            mime_type="application/pdf"
-        )
+        # Contratos subidos antes de guardar el hash: se calcula una vez y queda guardado
+        contract_hash = contract.get("content_hash")
+        if not contract_hash:
+            contract_hash = await file_hash(contract["file_path"])
+            await db.contracts.update_one({"id": contract_id}, {"$set": {"content_hash": contract_hash}})
         
-        user_message = UserMessage(
-            text=question,
-            file_contents=[file_content]
+        # Solo los pasajes relevantes; sin texto extraído se manda el PDF completo
+        result, source = await analyze_cached(
+            db, contract_analyzer, analysis_cache, contract, contract_hash, question,
+            find_passages=lambda: contract_search.search(db, contract, question, ANALYSIS_PASSAGES),
+            passages_version=f"bm25-{SELECTION_VERSION}-{CHUNK_CHARS}-{ANALYSIS_PASSAGES}"
         )
-        
-        import asyncio
-        response = asyncio.get_event_loop().run_until_complete(chat.send_message(user_message))
-        
-        return {"analysis": response, "question": question}
+        return {"analysis": result["analysis"], "question": question, "cached": source != "llm"}
     except Exception as e:
         logger.error(f"Error analyzing contract: {e}")
         # Fallback to text-based analysis
@@ -660,6 +727,8 @@ async def reset_demo_data(user: dict = Depends(get_current_user)):
     await db.opportunities.delete_many({})
     await db.activities.delete_many({})
     await db.contracts.delete_many({})
+    await db[CONTRACT_PAGES].delete_many({})
+    await db[CONTRACT_JOBS].delete_many({})
     await db.activity_logs.delete_many({})
     
     # Re-seed
@@ -764,12 +833,12 @@ async def seed_demo_data():
     if existing_project:
         return
     
-    # Seed Users
+    # Seed Users (la contraseña se hashea después, solo para los usuarios que falten)
     users_data = [
         {
             "id": "user-admin-001",
             "email": "admin@pactum.com",
-            "password": hash_password("Pactum#2026!"),
+            "password": "Pactum#2026!",
             "name": "Admin Pactum",
             "role": "Admin",
             "created_at": datetime.now(timezone.utc).isoformat()
@@ -777,16 +846,22 @@ async def seed_demo_data():
         {
             "id": "user-client-001",
             "email": "activo2_26@gmail.com",
-            "password": hash_password("Pactum#2026!"),
+            "password": "Pactum#2026!",
             "name": "Amaru José Mojica Leiva",
             "role": "Cliente",
             "created_at": datetime.now(timezone.utc).isoformat()
         }
     ]
     
+    existing_emails = {
+        u["email"] for u in await db.users.find(
+            {"email": {"$in": [u["email"] for u in users_data]}}, {"_id": 0, "email": 1}
+        ).to_list(None)
+    }
     for user in users_data:
-        existing = await db.users.find_one({"email": user["email"]})
-        if not existing:
+        if user["email"] not in existing_emails:
+            # bcrypt es CPU puro: fuera del event loop
+            user["password"] = await asyncio.to_thread(hash_password, user["password"])
             await db.users.insert_one(user)
     
     # Seed Project
@@ -1062,21 +1137,48 @@ async def seed_demo_data():
 
 # ===================== STARTUP =====================
 
+async def ensure_indexes():
+    await contract_extractor.ensure_indexes(db)
+
+background_jobs.once("ensure_indexes", ensure_indexes, required=True)
+background_jobs.once("seed_demo_data", seed_demo_data, required=True)
+background_jobs.every("cleanup_old_logs", cleanup_old_logs, interval=LOG_CLEANUP_INTERVAL_SECONDS, initial_delay=60)
+
 @app.on_event("startup")
 async def startup_event():
-    await seed_demo_data()
-    # Schedule cleanup of old logs
-    await cleanup_old_logs()
+    if loop_monitor:
+        loop_monitor.start()
+    background_jobs.start()
+    metrics_exporter.start()
 
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    await background_jobs.stop()
+    await metrics_exporter.stop()
+    if loop_monitor:
+        await loop_monitor.stop()
+    await contract_extractor.shutdown()
     client.close()
 
-# Health check
+# Health check (liveness: el proceso responde)
 @api_router.get("/health")
 async def health_check():
     return {"status": "healthy", "timestamp": datetime.now(timezone.utc).isoformat()}
 
+# Readiness: seed terminado y MongoDB accesible
+@api_router.get("/ready")
+async def readiness_check():
+    checks = {"jobs": background_jobs.ready, "database": True}
+    try:
+        await asyncio.wait_for(client.admin.command("ping"), timeout=2)
+    except Exception:
+        checks["database"] = False
+    ready = all(checks.values())
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={"status": "ready" if ready else "starting", "checks": checks, "jobs": background_jobs.status()}
+    )
+
 @api_router.get("/")
 async def root():
     return {"message": "Mini-Pactum API v1.0", "status": "running"}
@@ -1084,6 +1186,10 @@ async def root():
 # Include router
 app.include_router(api_router)
 
+@app.get("/metrics")
+async def metrics():
+    return Response(content=await metrics_exporter.render(), media_type=METRICS_CONTENT_TYPE)
+
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
@@ -1091,3 +1197,12 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+
+# Compresión gzip/Brotli de respuestas JSON/texto (ver compression.py)
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=int(os.environ.get('COMPRESSION_MIN_SIZE', '1024')),
+    gzip_level=int(os.environ.get('COMPRESSION_GZIP_LEVEL', '6')),
+    brotli_quality=int(os.environ.get('COMPRESSION_BROTLI_QUALITY', '4')),
+    thread_min_size=int(os.environ.get('COMPRESSION_THREAD_MIN_SIZE', '65536'))
+)
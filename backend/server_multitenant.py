@@ -1,31 +1,64 @@
 from fastapi import FastAPI, APIRouter, HTTPException, Depends, UploadFile, File, Form, Query
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from fastapi.responses import StreamingResponse
+from fastapi.responses import StreamingResponse, Response
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateMany, UpdateOne
 import os
+import asyncio
 import logging
 from pathlib import Path
 from pydantic import BaseModel, Field, EmailStr
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, NamedTuple
 import uuid
 from datetime import datetime, timezone, timedelta
 import bcrypt
 import jwt
 from bson import ObjectId
-import pandas as pd
 import io
 import base64
 from pytz import timezone as pytz_timezone
+from autocomplete import AutocompleteIndex, ENTITY_TYPES
+from cache_versions import AUTOCOMPLETE, PROJECT_ACCESS, RECIPIENTS, WORKLOAD, CacheVersions
+from metrics import MetricsExporter, MetricsMiddleware, MongoCommandMetrics, REGISTRY as METRICS_REGISTRY, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from mongo_pool import PoolMetrics, client_options as mongo_client_options
+from query_tracer import QueryTracer, QueryBudgetMiddleware, query_budget
+from logging_config import configure_logging, RequestIdMiddleware
+from loop_monitor import LoopMonitor
+from compression import CompressionMiddleware
+from kanban_board import KanbanBoards
+from notifications import MilestoneNotifier
+from project_access import ProjectAccessCache, ProjectScope
+from read_routing import analytics_database
+from records import ActivityRecord, ProjectRecord, RecordsResponse, TaskRecord
+from repositories import ProjectRepository, TaskRepository
+from workload import WorkloadReports
+from task_group_stats import (
+    apply_task_changes, membership_changes, backfill_stats, empty_stats, render_stats,
+    update_task_tracked, delete_task_tracked, reconcile_stats, membership_diff
+)
+from startup_jobs import BackgroundJobs, acquire_lease
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
 # MongoDB connection
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+# Slow-query log: SLOW_QUERY_MS umbral en ms, SLOW_QUERY_EXPLAIN=1 agrega resumen del plan
+query_tracer = QueryTracer(
+    slow_ms=float(os.environ.get('SLOW_QUERY_MS', '100')),
+    explain=os.environ.get('SLOW_QUERY_EXPLAIN', '0') == '1'
+)
+# Pool por worker (MONGO_MAX_POOL_SIZE o MONGO_CONNECTION_BUDGET / WEB_CONCURRENCY, ver mongo_pool.py)
+client = AsyncIOMotorClient(mongo_url, event_listeners=[MongoCommandMetrics(), query_tracer, PoolMetrics()], **mongo_client_options())
 db = client[os.environ['DB_NAME']]
+# Reportes de solo lectura: secundarias con staleness acotada (ver read_routing.py); lo transaccional usa `db`
+analytics_db = analytics_database(
+    client, os.environ['DB_NAME'],
+    os.environ.get('ANALYTICS_READ_PREFERENCE', 'secondaryPreferred'),
+    int(os.environ.get('ANALYTICS_MAX_STALENESS_SECONDS', '120'))
+)
 
 # JWT Config
 JWT_SECRET = os.environ.get('JWT_SECRET', 'pactum-secret-key-2026-demo')
@@ -37,10 +70,45 @@ app = FastAPI(title="Multi-Tenant ERP/CRM API")
 api_router = APIRouter(prefix="/api")
 security = HTTPBearer()
 
-# Configure logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+# Configure logging (JSON por cola, ver logging_config.py)
+configure_logging()
 logger = logging.getLogger(__name__)
 
+# Watchdog del event loop (lag y llamadas bloqueantes); LOOP_MONITOR=0 lo desactiva
+loop_monitor = LoopMonitor.from_env()
+
+# /metrics de todos los workers cuando run_production define METRICS_MULTIPROC_DIR (ver metrics.py)
+metrics_exporter = MetricsExporter.from_env(METRICS_REGISTRY)
+
+# Versiones por empresa de los caches en memoria para invalidarlos en todos los workers (ver cache_versions.py)
+cache_versions = CacheVersions(check_seconds=float(os.environ.get('CACHE_VERSION_CHECK_SECONDS', '1')))
+
+# Índice de autocompletado en memoria (por empresa)
+autocomplete_index = AutocompleteIndex(
+    ttl_seconds=int(os.environ.get('AUTOCOMPLETE_TTL_SECONDS', '300')), versions=cache_versions
+)
+
+# Read model del tablero Kanban (colección project_boards); BOARD_REBUILD_SECONDS=0 desactiva la reconstrucción periódica
+kanban_boards = KanbanBoards(rebuild_seconds=int(os.environ.get('BOARD_REBUILD_SECONDS', '600')))
+
+# Proyectos visibles por usuario/empresa para los filtros $in (por worker, con TTL y versión por empresa)
+project_access = ProjectAccessCache(
+    ttl_seconds=float(os.environ.get('PROJECT_ACCESS_TTL_SECONDS', '30')), versions=cache_versions,
+    max_entries=int(os.environ.get('PROJECT_ACCESS_CACHE_ENTRIES', '10000'))
+)
+
+# Reporte de carga por persona, cacheado por empresa y actualizado con cada escritura de tareas
+workload_reports = WorkloadReports(
+    ttl_seconds=float(os.environ.get('WORKLOAD_CACHE_TTL_SECONDS', '300')), versions=cache_versions
+)
+
+# Notificaciones de hitos en segundo plano (cola en memoria + workers)
+milestone_notifier = MilestoneNotifier(
+    workers=int(os.environ.get('MILESTONE_WORKERS', '2')),
+    cache_ttl=float(os.environ.get('MILESTONE_CACHE_TTL_SECONDS', '300')),
+    versions=cache_versions
+)
+
 # ===================== MODELS =====================
 
 # Company/Tenant Models
@@ -362,8 +430,46 @@ async def get_user_company(user: dict = Depends(get_current_user)):
     
     return company
 
+async def get_project_scope(user: dict = Depends(get_current_user)) -> ProjectScope:
+    """Cached sets of project ids the user can reach, for $in filters"""
+    return ProjectScope(db, user, project_access)
+
+class TaskAccess(NamedTuple):
+    task: dict
+    project: dict
+
+async def get_task_access(task_id: str, user: dict = Depends(get_current_user)) -> TaskAccess:
+    """Load a task and its project with one $lookup and enforce project access"""
+    rows = await db.tasks.aggregate([
+        {"$match": {"id": task_id}},
+        {"$limit": 1},
+        {"$lookup": {"from": "projects", "localField": "project_id", "foreignField": "id", "as": "project"}},
+        # Los adjuntos van en base64 y ninguna de estas rutas los lee
+        {"$project": {"_id": 0, "attachments": 0, "project._id": 0}}
+    ]).to_list(1)
+    if not rows:
+        raise HTTPException(status_code=404, detail="Tarea no encontrada")
+    
+    task = rows[0]
+    projects = task.pop("project", None) or []
+    if not projects:
+        raise HTTPException(status_code=404, detail="Proyecto no encontrado")
+    project = projects[0]
+    
+    if user["role"] == "USER":
+        if user["id"] not in project.get("assigned_users", []):
+            raise HTTPException(status_code=403, detail="No tienes acceso a este proyecto")
+    elif project.get("company_id") != user["company_id"]:
+        raise HTTPException(status_code=403, detail="Acceso denegado")
+    
+    return TaskAccess(task, project)
+
 # ===================== ACTIVITY LOG =====================
 
+async def caches_changed(company_id: Optional[str], *caches: str):
+    """Invalidate the company's entries in these caches on the other workers"""
+    await cache_versions.bump(db, company_id, *caches)
+
 async def log_activity(entity_type: str, entity_id: str, action: str, user: dict, company_id: Optional[str] = None, changes: dict = {}):
     log_entry = {
         "id": str(uuid.uuid4()),
@@ -378,6 +484,32 @@ async def log_activity(entity_type: str, entity_id: str, action: str, user: dict
     }
     await db.activity_logs.insert_one(log_entry)
 
+def to_data_url(content: bytes, content_type: str) -> str:
+    """Inline an uploaded file as a base64 data: URL (how attachments are stored)"""
+    return f"data:{content_type};base64,{base64.b64encode(content).decode('ascii')}"
+
+# ===================== TRANSACTIONS =====================
+
+_transactions_supported: Optional[bool] = None
+
+async def transactions_supported() -> bool:
+    """Multi-document transactions need a replica set or a sharded cluster"""
+    global _transactions_supported
+    if _transactions_supported is None:
+        try:
+            hello = await client.admin.command("hello")
+            _transactions_supported = bool(hello.get("setName")) or hello.get("msg") == "isdbgrid"
+        except Exception:
+            _transactions_supported = False
+    return _transactions_supported
+
+async def run_in_transaction(callback):
+    """Await callback(session) inside a transaction when the deployment supports it, else with session=None"""
+    if not await transactions_supported():
+        return await callback(None)
+    async with await client.start_session() as session:
+        return await session.with_transaction(callback)
+
 # ===================== PUBLIC ENDPOINTS =====================
 
 @api_router.post("/public/register-company", response_model=TokenResponse)
@@ -428,6 +560,8 @@ async def register_company(data: CompanyCreate):
         "created_at": datetime.now(timezone.utc).isoformat()
     }
     await db.users.insert_one(user_doc)
+    autocomplete_index.upsert(company_id, "users", user_doc)
+    await caches_changed(company_id, AUTOCOMPLETE)
     
     # Log activity
     await log_activity("company", company_id, "registered", {"id": "system", "name": "Sistema"}, company_id, {
@@ -506,16 +640,27 @@ async def get_me(user: dict = Depends(get_current_user)):
 # ===================== SUPER ADMIN - COMPANY MANAGEMENT =====================
 
 @api_router.get("/admin/companies")
+@query_budget(8)
 async def get_all_companies(user: dict = Depends(require_super_admin)):
     """Get all companies (SUPER_ADMIN only)"""
     companies = await db.companies.find({}, {"_id": 0}).to_list(1000)
     
-    # Add user count and client count for each company
+    # OPTIMIZACIÓN: Contar usuarios y clientes de todas las empresas con un $group cada uno
+    company_ids = [c["id"] for c in companies]
+    count_pipeline = [
+        {"$match": {"company_id": {"$in": company_ids}}},
+        {"$group": {"_id": "$company_id", "count": {"$sum": 1}}}
+    ]
+    user_counts, client_counts = await asyncio.gather(
+        db.users.aggregate(count_pipeline).to_list(None),
+        db.clients.aggregate(count_pipeline).to_list(None)
+    )
+    user_count_map = {c["_id"]: c["count"] for c in user_counts}
+    client_count_map = {c["_id"]: c["count"] for c in client_counts}
+    
     for company in companies:
-        user_count = await db.users.count_documents({"company_id": company["id"]})
-        client_count = await db.clients.count_documents({"company_id": company["id"]})
-        company["user_count"] = user_count
-        company["client_count"] = client_count
+        company["user_count"] = user_count_map.get(company["id"], 0)
+        company["client_count"] = client_count_map.get(company["id"], 0)
     
     return companies
 
@@ -585,16 +730,16 @@ async def update_subscription(company_id: str, data: SubscriptionUpdate, user: d
 @api_router.get("/admin/metrics")
 async def get_global_metrics(user: dict = Depends(require_super_admin)):
     """Get global system metrics (SUPER_ADMIN only)"""
-    total_companies = await db.companies.count_documents({})
-    active_companies = await db.companies.count_documents({"status": "active"})
-    trial_companies = await db.companies.count_documents({"subscription_status": "trial"})
-    paid_companies = await db.companies.count_documents({"subscription_status": "active"})
-    total_users = await db.users.count_documents({})
-    total_clients = await db.clients.count_documents({})
-    total_activities = await db.activities.count_documents({})
+    total_companies = await analytics_db.companies.count_documents({})
+    active_companies = await analytics_db.companies.count_documents({"status": "active"})
+    trial_companies = await analytics_db.companies.count_documents({"subscription_status": "trial"})
+    paid_companies = await analytics_db.companies.count_documents({"subscription_status": "active"})
+    total_users = await analytics_db.users.count_documents({})
+    total_clients = await analytics_db.clients.count_documents({})
+    total_activities = await analytics_db.activities.count_documents({})
     
     # Recent companies
-    recent_companies = await db.companies.find({}, {"_id": 0}).sort("created_at", -1).limit(10).to_list(10)
+    recent_companies = await analytics_db.companies.find({}, {"_id": 0}).sort("created_at", -1).limit(10).to_list(10)
     
     return {
         "total_companies": total_companies,
@@ -657,6 +802,8 @@ async def create_client(data: ClientCreate, user: dict = Depends(get_current_use
     client_doc["updated_at"] = datetime.now(timezone.utc).isoformat()
     
     await db.clients.insert_one(client_doc)
+    autocomplete_index.upsert(user["company_id"], "clients", client_doc)
+    await caches_changed(user["company_id"], AUTOCOMPLETE)
     await log_activity("client", client_id, "created", user, user["company_id"], {"name": data.name})
     
     return {"id": client_id, "message": "Cliente creado"}
@@ -689,6 +836,11 @@ async def update_client(client_id: str, data: ClientUpdate, user: dict = Depends
     update_data["updated_at"] = datetime.now(timezone.utc).isoformat()
     
     await db.clients.update_one({"id": client_id}, {"$set": update_data})
+    autocomplete_index.upsert(client.get("company_id"), "clients", {**client, **update_data})
+    if "email" in update_data:
+        # El destinatario de los hitos se busca por el email del cliente
+        milestone_notifier.invalidate()
+    await caches_changed(client.get("company_id"), AUTOCOMPLETE, *((RECIPIENTS,) if "email" in update_data else ()))
     await log_activity("client", client_id, "updated", user, client.get("company_id"), update_data)
     
     return {"message": "Cliente actualizado"}
@@ -705,6 +857,8 @@ async def delete_client(client_id: str, user: dict = Depends(get_current_user),
         raise HTTPException(status_code=403, detail="Acceso denegado")
     
     await db.clients.delete_one({"id": client_id})
+    autocomplete_index.remove(client.get("company_id"), "clients", client_id)
+    await caches_changed(client.get("company_id"), AUTOCOMPLETE)
     await log_activity("client", client_id, "deleted", user, client.get("company_id"), {"name": client.get("name")})
     
     return {"message": "Cliente eliminado"}
@@ -712,6 +866,7 @@ async def delete_client(client_id: str, user: dict = Depends(get_current_user),
 # ===================== COMPANY - ACTIVITY MANAGEMENT =====================
 
 @api_router.get("/activities")
+@query_budget(10)
 async def get_activities(
     user: dict = Depends(get_current_user),
     company: dict = Depends(get_user_company),
@@ -742,21 +897,31 @@ async def get_activities(
     if status:
         query["status"] = status
     
-    activities = await db.activities.find(query, {"_id": 0}).to_list(1000)
+    activities = ActivityRecord.from_docs(await db.activities.find(query, {"_id": 0}).to_list(1000))
+    
+    # OPTIMIZACIÓN: Obtener clientes y usuarios en una sola query cada uno
+    client_ids = list({a["client_id"] for a in activities if a.get("client_id")})
+    assigned_ids = list({a["assigned_to"] for a in activities if a.get("assigned_to")})
+    
+    client_map = {}
+    if client_ids:
+        clients = await db.clients.find({"id": {"$in": client_ids}}, {"_id": 0, "id": 1, "name": 1}).to_list(None)
+        client_map = {c["id"]: c.get("name") for c in clients}
+    
+    user_map = {}
+    if assigned_ids:
+        assigned_users = await db.users.find({"id": {"$in": assigned_ids}}, {"_id": 0, "id": 1, "name": 1}).to_list(None)
+        user_map = {u["id"]: u.get("name") for u in assigned_users}
     
     # Populate client names
     for activity in activities:
-        if activity.get("client_id"):
-            client = await db.clients.find_one({"id": activity["client_id"]}, {"_id": 0})
-            if client:
-                activity["client_name"] = client.get("name")
+        if activity.get("client_id") in client_map:
+            activity["client_name"] = client_map[activity["client_id"]]
         
-        if activity.get("assigned_to"):
-            assigned_user = await db.users.find_one({"id": activity["assigned_to"]}, {"_id": 0})
-            if assigned_user:
-                activity["assigned_to_name"] = assigned_user.get("name")
+        if activity.get("assigned_to") in user_map:
+            activity["assigned_to_name"] = user_map[activity["assigned_to"]]
     
-    return activities
+    return RecordsResponse(activities)
 
 @api_router.post("/activities")
 async def create_activity(data: ActivityCreate, user: dict = Depends(get_current_user), company: dict = Depends(get_user_company)):
@@ -832,27 +997,21 @@ async def delete_activity(activity_id: str, user: dict = Depends(get_current_use
 async def get_projects(user: dict = Depends(get_current_user), company: dict = Depends(get_user_company)):
     """Get all projects for the company or assigned to user"""
     
-    # SUPER_ADMIN ve todos los proyectos
-    if user["role"] == "SUPER_ADMIN":
-        query = {}
-    # COMPANY_ADMIN ve TODOS los proyectos de su empresa
-    elif user["role"] == "COMPANY_ADMIN":
-        query = {"company_id": user["company_id"]}
-    # USER y TEAM_MEMBER solo ven proyectos donde están asignados
-    else:
-        query = {
-            "company_id": user["company_id"],
-            "assigned_users": user["id"]
-        }
-    
-    projects = await db.projects.find(query, {"_id": 0}).to_list(100)
+    # SUPER_ADMIN ve todos los proyectos, COMPANY_ADMIN todos los de su empresa,
+    # USER y TEAM_MEMBER solo los de su empresa donde están asignados
+    repo = ProjectRepository.for_user(db, user, allow_all_companies=True)
+    projects = ProjectRecord.from_docs(await repo.list(ProjectRepository.visibility(user), "detail"))
     
     # Debug logging
-    print(f"🔍 get_projects - User: {user['email']}, Role: {user['role']}, Projects found: {len(projects)}")
-    for proj in projects:
-        print(f"   - {proj.get('name')} (ID: {proj.get('id')})")
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("get_projects", extra={
+            "user_email": user["email"],
+            "role": user["role"],
+            "projects_found": len(projects),
+            "projects": [f"{proj.get('name')} ({proj.get('id')})" for proj in projects]
+        })
     
-    return projects
+    return RecordsResponse(projects)
 
 @api_router.post("/projects")
 async def create_project(data: ProjectCreate, user: dict = Depends(require_company_admin), company: dict = Depends(get_user_company)):
@@ -877,6 +1036,10 @@ async def create_project(data: ProjectCreate, user: dict = Depends(require_compa
         "updated_at": datetime.now(timezone.utc).isoformat()
     }
     await db.projects.insert_one(project_doc)
+    autocomplete_index.upsert(user["company_id"], "projects", project_doc)
+    project_access.invalidate_project(user["company_id"], data.assigned_users)
+    workload_reports.invalidate(user["company_id"])
+    await caches_changed(user["company_id"], AUTOCOMPLETE, PROJECT_ACCESS, WORKLOAD)
     await log_activity("project", project_id, "created", user, user["company_id"], {"name": data.name})
     
     return {"id": project_id, "message": "Proyecto creado"}
@@ -884,34 +1047,56 @@ async def create_project(data: ProjectCreate, user: dict = Depends(require_compa
 @api_router.get("/projects/{project_id}")
 async def get_project(project_id: str, user: dict = Depends(get_current_user), company: dict = Depends(get_user_company)):
     """Get project details"""
-    project = await db.projects.find_one({"id": project_id}, {"_id": 0})
+    # Solo proyectos de la empresa del usuario: los de otra empresa dan 404
+    project = await ProjectRepository.for_user(db, user).get({"id": project_id}, "detail")
     if not project:
         raise HTTPException(status_code=404, detail="Proyecto no encontrado")
     
-    # Verify access
-    if project.get("company_id") != user["company_id"]:
-        raise HTTPException(status_code=403, detail="Acceso denegado")
-    
     # If user is not admin, verify they are assigned to the project
     if user.get("role") == "USER" and user["id"] not in project.get("assigned_users", []):
         raise HTTPException(status_code=403, detail="No tienes acceso a este proyecto")
     
     return project
 
+@api_router.get("/projects/{project_id}/board")
+@query_budget(8)
+async def get_project_board(project_id: str, user: dict = Depends(get_current_user)):
+    """Kanban board for a project served from its precomputed read model"""
+    # Mismas reglas que get_project antes de tocar el tablero: otra empresa o un id inexistente dan 404
+    project = await ProjectRepository.for_user(db, user).get({"id": project_id}, "access")
+    if not project:
+        raise HTTPException(status_code=404, detail="Proyecto no encontrado")
+    
+    if user.get("role") == "USER" and user["id"] not in project.get("assigned_users", []):
+        raise HTTPException(status_code=403, detail="No tienes acceso a este proyecto")
+    
+    board = await kanban_boards.get(db, project_id)
+    if not board:
+        raise HTTPException(status_code=404, detail="Proyecto no encontrado")
+    return kanban_boards.render(board)
+
 @api_router.put("/projects/{project_id}")
 async def update_project(project_id: str, data: ProjectUpdate, user: dict = Depends(require_company_admin), company: dict = Depends(get_user_company)):
     """Update project"""
-    project = await db.projects.find_one({"id": project_id})
+    repo = ProjectRepository.for_user(db, user)
+    project = await repo.get({"id": project_id}, "write")
     if not project:
         raise HTTPException(status_code=404, detail="Proyecto no encontrado")
     
-    if project.get("company_id") != user["company_id"]:
-        raise HTTPException(status_code=403, detail="Acceso denegado")
-    
     update_data = {k: v for k, v in data.dict(exclude_unset=True).items()}
     update_data["updated_at"] = datetime.now(timezone.utc).isoformat()
     
-    await db.projects.update_one({"id": project_id}, {"$set": update_data})
+    await repo.update({"id": project_id}, {"$set": update_data})
+    autocomplete_index.upsert(project.get("company_id"), "projects", {**project, **update_data})
+    await kanban_boards.update_project(db, project_id, update_data)
+    milestone_notifier.invalidate(project_id)
+    if "assigned_users" in update_data:
+        project_access.invalidate_project(
+            project.get("company_id"), set(project.get("assigned_users") or []) | set(update_data["assigned_users"] or [])
+        )
+    await caches_changed(
+        project.get("company_id"), AUTOCOMPLETE, RECIPIENTS, *((PROJECT_ACCESS,) if "assigned_users" in update_data else ())
+    )
     await log_activity("project", project_id, "updated", user, user["company_id"], update_data)
     
     return {"message": "Proyecto actualizado"}
@@ -919,14 +1104,18 @@ async def update_project(project_id: str, data: ProjectUpdate, user: dict = Depe
 @api_router.delete("/projects/{project_id}")
 async def delete_project(project_id: str, user: dict = Depends(require_company_admin), company: dict = Depends(get_user_company)):
     """Delete project"""
-    project = await db.projects.find_one({"id": project_id})
+    repo = ProjectRepository.for_user(db, user)
+    project = await repo.get({"id": project_id}, "write")
     if not project:
         raise HTTPException(status_code=404, detail="Proyecto no encontrado")
     
-    if project.get("company_id") != user["company_id"]:
-        raise HTTPException(status_code=403, detail="Acceso denegado")
-    
-    await db.projects.delete_one({"id": project_id})
+    await repo.delete({"id": project_id})
+    autocomplete_index.remove(project.get("company_id"), "projects", project_id)
+    await kanban_boards.invalidate(db, project_id)
+    milestone_notifier.invalidate(project_id)
+    project_access.invalidate_project(project.get("company_id"), project.get("assigned_users") or [])
+    workload_reports.invalidate(project.get("company_id"))
+    await caches_changed(project.get("company_id"), AUTOCOMPLETE, PROJECT_ACCESS, WORKLOAD, RECIPIENTS)
     await log_activity("project", project_id, "deleted", user, project.get("company_id"), {"name": project.get("name")})
     
     return {"message": "Proyecto eliminado"}
@@ -934,18 +1123,16 @@ async def delete_project(project_id: str, user: dict = Depends(require_company_a
 # ===================== TASKS MANAGEMENT =====================
 
 @api_router.get("/tasks")
-async def get_tasks(project_id: Optional[str] = None, status: Optional[str] = None, user: dict = Depends(get_current_user)):
+async def get_tasks(project_id: Optional[str] = None, status: Optional[str] = None, user: dict = Depends(get_current_user), scope: ProjectScope = Depends(get_project_scope)):
     """Get tasks for user's projects"""
     query = {}
     
     # If project_id is provided, filter by it first AND verify user has access
     if project_id:
         # Verify user has access to this specific project
-        if user["role"] == "USER":
-            project = await db.projects.find_one({"id": project_id, "assigned_users": user["id"]})
-            if not project:
-                # User doesn't have access to this project, return empty
-                return []
+        if user["role"] == "USER" and project_id not in await scope.assigned_ids():
+            # User doesn't have access to this project, return empty
+            return []
         query["project_id"] = project_id
     else:
         # SUPER_ADMIN ve todas las tareas
@@ -953,19 +1140,14 @@ async def get_tasks(project_id: Optional[str] = None, status: Optional[str] = No
             # No filter, see all tasks
             pass
         # COMPANY_ADMIN, TEAM_MEMBER y USER solo ven tareas de proyectos donde están asignados
+        # (sin proyectos asignados el $in vacío no devuelve ninguna tarea)
         else:
-            user_projects = await db.projects.find({"assigned_users": user["id"]}, {"_id": 0, "id": 1}).to_list(100)
-            if user_projects:
-                project_ids = [p["id"] for p in user_projects]
-                query["project_id"] = {"$in": project_ids}
-            else:
-                # Si no tiene proyectos asignados, no ve ninguna tarea
-                query["project_id"] = {"$in": []}
+            query["project_id"] = {"$in": await scope.assigned_ids()}
     
     if status:
         query["status"] = status
     
-    tasks = await db.tasks.find(query, {"_id": 0}).to_list(1000)
+    tasks = TaskRecord.from_docs(await db.tasks.find(query, {"_id": 0}).to_list(1000))
     
     # OPTIMIZACIÓN: Obtener todos los usuarios de una vez en lugar de uno por uno
     if tasks:
@@ -979,29 +1161,28 @@ async def get_tasks(project_id: Optional[str] = None, status: Optional[str] = No
                 {"_id": 0, "id": 1, "name": 1}
             ).to_list(len(assigned_user_ids))
             
-            # Crear un mapa id -> nombre para búsqueda rápida
-            user_map = {u["id"]: u["name"] for u in users}
-            
-            # Enriquecer tareas con nombres
-            for task in tasks:
-                if task.get("assigned_to"):
-                    task["assigned_to_name"] = user_map.get(task["assigned_to"], "Sin asignar")
+            enrich_assignee_names(tasks, users)
     
+    return RecordsResponse(tasks)
+
+def enrich_assignee_names(tasks: List[dict], users: List[dict]) -> List[dict]:
+    """Add assigned_to_name to each task from an id -> name map of the given users"""
+    user_map = {u["id"]: u["name"] for u in users}
+    for task in tasks:
+        if task.get("assigned_to"):
+            task["assigned_to_name"] = user_map.get(task["assigned_to"], "Sin asignar")
     return tasks
 
 @api_router.post("/tasks")
 async def create_task(data: TaskCreate, user: dict = Depends(get_current_user)):
     """Create a new task"""
     # Verify user has access to the project
-    project = await db.projects.find_one({"id": data.project_id})
+    project = await ProjectRepository.for_user(db, user).get({"id": data.project_id}, "access")
     if not project:
         raise HTTPException(status_code=404, detail="Proyecto no encontrado")
     
-    if user["role"] == "USER":
-        if user["id"] not in project.get("assigned_users", []):
-            raise HTTPException(status_code=403, detail="No tienes acceso a este proyecto")
-    elif project.get("company_id") != user["company_id"]:
-        raise HTTPException(status_code=403, detail="Acceso denegado")
+    if user["role"] == "USER" and user["id"] not in project.get("assigned_users", []):
+        raise HTTPException(status_code=403, detail="No tienes acceso a este proyecto")
     
     task_id = str(uuid.uuid4())
     task_doc = {
@@ -1014,80 +1195,36 @@ async def create_task(data: TaskCreate, user: dict = Depends(get_current_user)):
     }
     
     await db.tasks.insert_one(task_doc)
+    await sync_group_task_ids(task_id, None, task_doc.get("task_group_id"))
+    await apply_task_changes(db, [(None, task_doc)])
+    workload_reports.apply(project.get("company_id"), [(None, task_doc)])
+    await caches_changed(project.get("company_id"), WORKLOAD)
+    await kanban_boards.upsert_task(db, task_doc)
     await log_activity("task", task_id, "created", user, user["company_id"], {"title": data.title})
     
     return {"id": task_id, "message": "Tarea creada"}
 
 async def calculate_project_progress(project_id: str):
-    """Calculate project progress based on completed tasks"""
-    all_tasks = await db.tasks.find({"project_id": project_id}).to_list(1000)
-    
-    if not all_tasks:
+    """Calculate project progress based on completed tasks (counted in Mongo, no task documents are read)"""
+    counts = await TaskRepository(db, [project_id]).status_counts()
+    return progress_percentage(counts["total"], counts["done"])
+
+def compute_project_progress(tasks: List[dict]) -> int:
+    return progress_percentage(len(tasks), sum(1 for t in tasks if t.get("status") == "done"))
+
+def progress_percentage(total: int, completed: int) -> int:
+    if not total:
         return 0
     
-    completed_tasks = [t for t in all_tasks if t.get("status") == "done"]
-    progress = int((len(completed_tasks) / len(all_tasks)) * 100)
+    progress = int((completed / total) * 100)
     
     # Ensure minimum 30% progress when there are tasks
-    if progress < 30:
-        progress = 30
-    
-    return progress
-
-async def send_milestone_notification(project_id: str, old_progress: int, new_progress: int):
-    """Send notification when project reaches milestone (25%, 50%, 75%, 100%)"""
-    milestones = [25, 50, 75, 100]
-    
-    for milestone in milestones:
-        # Check if we just crossed this milestone
-        if old_progress < milestone <= new_progress:
-            project = await db.projects.find_one({"id": project_id})
-            if not project:
-                continue
-            
-            # Get client user
-            client = await db.clients.find_one({"id": project.get("client_id")})
-            if not client:
-                continue
-            
-            # Find client user by email
-            client_user = await db.users.find_one({"email": client.get("email")})
-            if not client_user:
-                continue
-            
-            # Create notification
-            notification_id = str(uuid.uuid4())
-            notification = {
-                "id": notification_id,
-                "user_id": client_user["id"],
-                "project_id": project_id,
-                "type": "milestone",
-                "title": f"¡Hito alcanzado: {milestone}%!",
-                "message": f"El proyecto '{project.get('name')}' ha alcanzado el {milestone}% de progreso. {'¡Listo para el siguiente pago!' if milestone in [25, 50, 75] else '¡Proyecto completado!'}",
-                "read": False,
-                "created_at": datetime.now(timezone.utc).isoformat()
-            }
-            
-            await db.notifications.insert_one(notification)
-            print(f"📧 Notificación de hito {milestone}% enviada al cliente {client.get('name')}")
+    return max(progress, 30)
 
 @api_router.put("/tasks/{task_id}")
-async def update_task(task_id: str, data: TaskUpdate, user: dict = Depends(get_current_user)):
+async def update_task(task_id: str, data: TaskUpdate, user: dict = Depends(get_current_user), access: TaskAccess = Depends(get_task_access)):
     """Update task"""
-    task = await db.tasks.find_one({"id": task_id})
-    if not task:
-        raise HTTPException(status_code=404, detail="Tarea no encontrada")
-    
-    # Verify access to project
-    project = await db.projects.find_one({"id": task["project_id"]})
-    if not project:
-        raise HTTPException(status_code=404, detail="Proyecto no encontrado")
-    
-    if user["role"] == "USER":
-        if user["id"] not in project.get("assigned_users", []):
-            raise HTTPException(status_code=403, detail="No tienes acceso a este proyecto")
-    elif project.get("company_id") != user["company_id"]:
-        raise HTTPException(status_code=403, detail="Acceso denegado")
+    task, project = access
     
     # Store old progress before update
     old_progress = project.get("progress_percentage", 0)
@@ -1095,7 +1232,16 @@ async def update_task(task_id: str, data: TaskUpdate, user: dict = Depends(get_c
     update_data = {k: v for k, v in data.dict(exclude_unset=True).items()}
     update_data["updated_at"] = datetime.now(timezone.utc).isoformat()
     
-    await db.tasks.update_one({"id": task_id}, {"$set": update_data})
+    # El estado anterior sale de la misma escritura: las diferencias de totales no dependen de `task`
+    tracked = await update_task_tracked(db, task_id, update_data)
+    if tracked is None:
+        raise HTTPException(status_code=404, detail="Tarea no encontrada")
+    if "task_group_id" in update_data:
+        await sync_group_task_ids(task_id, tracked[0].get("task_group_id"), update_data["task_group_id"])
+    changes = [tracked]
+    await apply_task_changes(db, changes)
+    workload_reports.apply(project.get("company_id"), changes)
+    await caches_changed(project.get("company_id"), WORKLOAD)
     await log_activity("task", task_id, "updated", user, user["company_id"], update_data)
     
     # Recalculate project progress if task status changed
@@ -1105,33 +1251,30 @@ async def update_task(task_id: str, data: TaskUpdate, user: dict = Depends(get_c
             {"id": task["project_id"]},
             {"$set": {"progress_percentage": new_progress, "updated_at": datetime.now(timezone.utc).isoformat()}}
         )
+        await kanban_boards.update_task(db, task["project_id"], task_id, update_data, {"progress_percentage": new_progress})
         
-        # Send milestone notification if applicable
-        await send_milestone_notification(task["project_id"], old_progress, new_progress)
+        # Milestone notification is resolved and stored in the background
+        milestone_notifier.publish(task["project_id"], old_progress, new_progress)
         
-        print(f"📊 Progreso del proyecto actualizado: {old_progress}% -> {new_progress}%")
+        logger.debug("Project progress updated", extra={"project_id": task["project_id"], "old_progress": old_progress, "new_progress": new_progress})
+    else:
+        await kanban_boards.update_task(db, task["project_id"], task_id, update_data)
     
     return {"message": "Tarea actualizada"}
 
 @api_router.delete("/tasks/{task_id}")
-async def delete_task(task_id: str, user: dict = Depends(get_current_user)):
+async def delete_task(task_id: str, user: dict = Depends(get_current_user), access: TaskAccess = Depends(get_task_access)):
     """Delete task"""
-    task = await db.tasks.find_one({"id": task_id})
-    if not task:
-        raise HTTPException(status_code=404, detail="Tarea no encontrada")
+    task = access.task
     
-    # Verify access
-    project = await db.projects.find_one({"id": task["project_id"]})
-    if not project:
-        raise HTTPException(status_code=404, detail="Proyecto no encontrado")
-    
-    if user["role"] == "USER":
-        if user["id"] not in project.get("assigned_users", []):
-            raise HTTPException(status_code=403, detail="No tienes acceso a este proyecto")
-    elif project.get("company_id") != user["company_id"]:
-        raise HTTPException(status_code=403, detail="Acceso denegado")
-    
-    await db.tasks.delete_one({"id": task_id})
+    deleted = await delete_task_tracked(db, task_id)
+    if deleted is None:
+        raise HTTPException(status_code=404, detail="Tarea no encontrada")
+    await sync_group_task_ids(task_id, deleted.get("task_group_id"), None)
+    await apply_task_changes(db, [(deleted, None)])
+    workload_reports.apply(access.project.get("company_id"), [(deleted, None)])
+    await caches_changed(access.project.get("company_id"), WORKLOAD)
+    await kanban_boards.remove_task(db, task["project_id"], task_id)
     await log_activity("task", task_id, "deleted", user, user["company_id"], {"title": task.get("title")})
     
     return {"message": "Tarea eliminada"}
@@ -1141,20 +1284,10 @@ async def upload_task_attachment(
     task_id: str,
     file: UploadFile = File(...),
     file_type: str = Form(...),
-    user: dict = Depends(get_current_user)
+    user: dict = Depends(get_current_user),
+    access: TaskAccess = Depends(get_task_access)
 ):
     """Upload audio or image attachment to a task"""
-    import base64
-    
-    task = await db.tasks.find_one({"id": task_id})
-    if not task:
-        raise HTTPException(status_code=404, detail="Tarea no encontrada")
-    
-    # Verify access to project
-    project = await db.projects.find_one({"id": task["project_id"]})
-    if not project:
-        raise HTTPException(status_code=404, detail="Proyecto no encontrado")
-    
     # Validate file type
     allowed_types = {
         "audio": ["audio/webm", "audio/mp3", "audio/mpeg", "audio/wav", "audio/ogg"],
@@ -1175,9 +1308,7 @@ async def upload_task_attachment(
     if file_size > 10 * 1024 * 1024:
         raise HTTPException(status_code=400, detail="Archivo muy grande (máx 10MB)")
     
-    # Convert to base64
-    file_base64 = base64.b64encode(file_content).decode('utf-8')
-    file_url = f"data:{file.content_type};base64,{file_base64}"
+    file_url = to_data_url(file_content, file.content_type)
     
     # Create attachment object
     attachment = {
@@ -1204,16 +1335,9 @@ async def upload_task_attachment(
     return {"message": "Archivo adjuntado exitosamente", "attachment": attachment}
 
 @api_router.post("/tasks/{task_id}/reassign")
-async def reassign_task(task_id: str, data: TaskReassign, user: dict = Depends(get_current_user)):
+async def reassign_task(task_id: str, data: TaskReassign, user: dict = Depends(get_current_user), access: TaskAccess = Depends(get_task_access)):
     """Reassign task to another user with reason"""
-    task = await db.tasks.find_one({"id": task_id})
-    if not task:
-        raise HTTPException(status_code=404, detail="Tarea no encontrada")
-    
-    # Verify access to project
-    project = await db.projects.find_one({"id": task["project_id"]})
-    if not project:
-        raise HTTPException(status_code=404, detail="Proyecto no encontrado")
+    task, project = access
     
     # Verify new user exists and has access to project
     new_user = await db.users.find_one({"id": data.new_assigned_to})
@@ -1248,6 +1372,9 @@ async def reassign_task(task_id: str, data: TaskReassign, user: dict = Depends(g
             "$push": {"reassignment_history": reassignment_entry}
         }
     )
+    await kanban_boards.update_task(db, task["project_id"], task_id, update_data)
+    workload_reports.apply(project.get("company_id"), [(task, {**task, **update_data})])
+    await caches_changed(project.get("company_id"), WORKLOAD)
     
     await log_activity("task", task_id, "reassigned", user, user["company_id"], {
         "from": task.get("assigned_to"),
@@ -1263,31 +1390,37 @@ async def reassign_task(task_id: str, data: TaskReassign, user: dict = Depends(g
 
 # ===================== TASK GROUPS =====================
 
+async def sync_group_task_ids(task_id: str, old_group_id: Optional[str], new_group_id: Optional[str]):
+    """Keep the groups' task_ids lists in line with a task's task_group_id"""
+    if old_group_id == new_group_id:
+        return
+    operations = []
+    if old_group_id:
+        operations.append(UpdateOne({"id": old_group_id}, {"$pull": {"task_ids": task_id}}))
+    if new_group_id:
+        operations.append(UpdateOne({"id": new_group_id}, {"$addToSet": {"task_ids": task_id}}))
+    await db.task_groups.bulk_write(operations, ordered=False)
+
 @api_router.get("/task-groups")
-async def get_task_groups(project_id: Optional[str] = None, user: dict = Depends(get_current_user)):
-    """Get task groups for a project"""
+async def get_task_groups(project_id: Optional[str] = None, with_stats: bool = False, user: dict = Depends(get_current_user), scope: ProjectScope = Depends(get_project_scope)):
+    """Get task groups for a project, optionally with their hour and status rollups"""
     query = {}
     
     if project_id:
         query["project_id"] = project_id
+    elif user["role"] in ["TEAM_MEMBER", "USER"]:
+        query["project_id"] = {"$in": await scope.assigned_ids()}
     else:
-        if user["role"] == "TEAM_MEMBER":
-            user_projects = await db.projects.find({"assigned_users": user["id"]}, {"_id": 0, "id": 1}).to_list(100)
-            if user_projects:
-                project_ids = [p["id"] for p in user_projects]
-                query["project_id"] = {"$in": project_ids}
-            else:
-                query["project_id"] = {"$in": []}
-        elif user["role"] == "USER":
-            user_projects = await db.projects.find({"assigned_users": user["id"]}, {"_id": 0, "id": 1}).to_list(100)
-            project_ids = [p["id"] for p in user_projects]
-            query["project_id"] = {"$in": project_ids}
-        else:
-            company_projects = await db.projects.find({"company_id": user["company_id"]}, {"_id": 0, "id": 1}).to_list(100)
-            project_ids = [p["id"] for p in company_projects]
-            query["project_id"] = {"$in": project_ids}
+        query["project_id"] = {"$in": await scope.company_ids()}
+    
+    if not with_stats:
+        return await db.task_groups.find(query, {"_id": 0, "stats": 0}).to_list(100)
     
     task_groups = await db.task_groups.find(query, {"_id": 0}).to_list(100)
+    # Grupos anteriores a los totales incrementales: se calculan una sola vez
+    backfilled = await backfill_stats(db, [g["id"] for g in task_groups if "stats" not in g])
+    for group in task_groups:
+        group["stats"] = render_stats(group.get("stats") or backfilled.get(group["id"]), group.get("total_estimated_hours"))
     return task_groups
 
 @api_router.post("/task-groups")
@@ -1312,19 +1445,18 @@ async def create_task_group(data: dict, user: dict = Depends(get_current_user)):
         "total_estimated_hours": data["total_estimated_hours"],
         "task_ids": data.get("task_ids", []),
         "color": data.get("color", "#3b82f6"),
+        "stats": empty_stats(),
         "created_by": user["id"],
         "created_at": datetime.now(timezone.utc).isoformat(),
         "updated_at": datetime.now(timezone.utc).isoformat()
     }
     
-    await db.task_groups.insert_one(group_doc)
+    async def write_group(session):
+        await db.task_groups.insert_one(group_doc, session=session)
+        await write_group_membership(group_id, group_doc["task_ids"], [], session)
     
-    # Update tasks with group_id
-    if data.get("task_ids"):
-        await db.tasks.update_many(
-            {"id": {"$in": data["task_ids"]}},
-            {"$set": {"task_group_id": group_id}}
-        )
+    await run_in_transaction(write_group)
+    await kanban_boards.upsert_group(db, group_doc, added=group_doc["task_ids"])
     
     await log_activity("task_group", group_id, "created", user, user["company_id"], {"name": data["name"]})
     
@@ -1347,29 +1479,50 @@ async def update_task_group(group_id: str, data: dict, user: dict = Depends(get_
     elif project.get("company_id") != user["company_id"]:
         raise HTTPException(status_code=403, detail="Acceso denegado")
     
-    update_data = {k: v for k, v in data.items() if v is not None}
+    # Los totales solo se mantienen desde las tareas
+    update_data = {k: v for k, v in data.items() if v is not None and k != "stats"}
     update_data["updated_at"] = datetime.now(timezone.utc).isoformat()
     
-    await db.task_groups.update_one({"id": group_id}, {"$set": update_data})
-    
-    # Update tasks if task_ids changed
-    if "task_ids" in data:
-        # Remove group_id from old tasks
-        await db.tasks.update_many(
-            {"task_group_id": group_id},
-            {"$unset": {"task_group_id": ""}}
-        )
-        # Add group_id to new tasks
-        if data["task_ids"]:
-            await db.tasks.update_many(
-                {"id": {"$in": data["task_ids"]}},
-                {"$set": {"task_group_id": group_id}}
-            )
+    async def write_group(session):
+        # Solo se tocan las tareas que entran o salen del grupo. Miembros = task_ids del
+        # grupo más las tareas que apuntan a él (datos viejos pueden no coincidir),
+        # leídos dentro de la transacción
+        added, removed = [], []
+        current = await db.task_groups.find_one({"id": group_id}, {"_id": 0}, session=session) or group
+        if "task_ids" in data:
+            members = await db.tasks.find({"task_group_id": group_id}, {"_id": 0, "id": 1}, session=session).to_list(None)
+            added, removed = membership_diff(current.get("task_ids") or [], [t["id"] for t in members], data["task_ids"] or [])
+        await db.task_groups.update_one({"id": group_id}, {"$set": update_data}, session=session)
+        await write_group_membership(group_id, added, removed, session)
+        return current, added, removed
+    
+    current, added, removed = await run_in_transaction(write_group)
+    await kanban_boards.upsert_group(db, {**current, **update_data}, added=added, removed=removed)
     
     await log_activity("task_group", group_id, "updated", user, user["company_id"], data)
     
     return {"message": "Grupo actualizado"}
 
+async def write_group_membership(group_id: str, added: List[str], removed: List[str], session=None):
+    """Point the added tasks at the group and unlink the removed ones, keeping other groups' task_ids and stats in line"""
+    if not added and not removed:
+        return
+    moved = await membership_changes(db, group_id, added, removed, session=session)
+    if added:
+        # Una tarea pertenece a un solo grupo: sale de la lista del grupo anterior
+        await db.task_groups.update_many(
+            {"id": {"$ne": group_id}, "task_ids": {"$in": added}},
+            {"$pull": {"task_ids": {"$in": added}}},
+            session=session
+        )
+    operations = []
+    if added:
+        operations.append(UpdateMany({"id": {"$in": added}}, {"$set": {"task_group_id": group_id}}))
+    if removed:
+        operations.append(UpdateMany({"id": {"$in": removed}, "task_group_id": group_id}, {"$unset": {"task_group_id": ""}}))
+    await db.tasks.bulk_write(operations, ordered=False, session=session)
+    await apply_task_changes(db, moved, session=session)
+
 @api_router.delete("/task-groups/{group_id}")
 async def delete_task_group(group_id: str, user: dict = Depends(get_current_user)):
     """Delete a task group"""
@@ -1394,30 +1547,27 @@ async def delete_task_group(group_id: str, user: dict = Depends(get_current_user
     )
     
     await db.task_groups.delete_one({"id": group_id})
+    await kanban_boards.remove_group(db, group, group.get("task_ids", []))
     await log_activity("task_group", group_id, "deleted", user, user["company_id"], {})
     
     return {"message": "Grupo eliminado"}
 
+@api_router.post("/task-groups/reconcile-stats")
+async def reconcile_task_group_stats(project_id: Optional[str] = None, user: dict = Depends(require_company_admin), scope: ProjectScope = Depends(get_project_scope)):
+    """Recompute the hour and status rollups of the company's task groups from their tasks"""
+    project_ids = await scope.company_ids()
+    if project_id:
+        if project_id not in project_ids:
+            raise HTTPException(status_code=403, detail="Acceso denegado")
+        project_ids = [project_id]
+    corrected = await reconcile_stats(db, {"project_id": {"$in": project_ids}})
+    return {"corrected": corrected}
+
 # ===================== TASK COMMENTS =====================
 
 @api_router.get("/tasks/{task_id}/comments")
-async def get_task_comments(task_id: str, user: dict = Depends(get_current_user)):
+async def get_task_comments(task_id: str, user: dict = Depends(get_current_user), access: TaskAccess = Depends(get_task_access)):
     """Get all comments for a task"""
-    task = await db.tasks.find_one({"id": task_id})
-    if not task:
-        raise HTTPException(status_code=404, detail="Tarea no encontrada")
-    
-    # Verify access to project
-    project = await db.projects.find_one({"id": task["project_id"]})
-    if not project:
-        raise HTTPException(status_code=404, detail="Proyecto no encontrado")
-    
-    if user["role"] == "USER":
-        if user["id"] not in project.get("assigned_users", []):
-            raise HTTPException(status_code=403, detail="No tienes acceso a este proyecto")
-    elif project.get("company_id") != user["company_id"]:
-        raise HTTPException(status_code=403, detail="Acceso denegado")
-    
     # Get comments
     comments = await db.task_comments.find(
         {"task_id": task_id},
@@ -1429,27 +1579,15 @@ async def get_task_comments(task_id: str, user: dict = Depends(get_current_user)
 @api_router.post("/tasks/{task_id}/comments")
 async def create_task_comment(
     task_id: str,
-    project_id: str = Form(...),
+    project_id: str = Form(...),  # Compatibilidad: el proyecto se toma de la tarea
     text: Optional[str] = Form(None),
     audio: Optional[UploadFile] = File(None),
     images: Optional[List[UploadFile]] = File(None),
-    user: dict = Depends(get_current_user)
+    user: dict = Depends(get_current_user),
+    access: TaskAccess = Depends(get_task_access)
 ):
     """Create a comment on a task with optional text, audio, and images"""
-    task = await db.tasks.find_one({"id": task_id})
-    if not task:
-        raise HTTPException(status_code=404, detail="Tarea no encontrada")
-    
-    # Verify access to project
-    project = await db.projects.find_one({"id": project_id})
-    if not project:
-        raise HTTPException(status_code=404, detail="Proyecto no encontrado")
-    
-    if user["role"] == "USER":
-        if user["id"] not in project.get("assigned_users", []):
-            raise HTTPException(status_code=403, detail="No tienes acceso a este proyecto")
-    elif project.get("company_id") != user["company_id"]:
-        raise HTTPException(status_code=403, detail="Acceso denegado")
+    task = access.task
     
     # Validate at least one content type
     if not text and not audio and not images:
@@ -1469,8 +1607,7 @@ async def create_task_comment(
         if audio_size > 5 * 1024 * 1024:
             raise HTTPException(status_code=400, detail="Audio muy grande (máx 5MB)")
         
-        audio_base64 = base64.b64encode(audio_content).decode('utf-8')
-        audio_url = f"data:{audio.content_type};base64,{audio_base64}"
+        audio_url = to_data_url(audio_content, audio.content_type)
         # Estimate duration (rough estimate, 1MB ~ 12 seconds for webm)
         audio_duration = min(60, int(audio_size / (1024 * 1024) * 12))
     
@@ -1490,9 +1627,7 @@ async def create_task_comment(
             if image_size > 5 * 1024 * 1024:
                 raise HTTPException(status_code=400, detail="Imagen muy grande (máx 5MB)")
             
-            image_base64 = base64.b64encode(image_content).decode('utf-8')
-            image_url = f"data:{image.content_type};base64,{image_base64}"
-            image_urls.append(image_url)
+            image_urls.append(to_data_url(image_content, image.content_type))
     
     # Create comment with Chile timezone
     chile_tz = pytz_timezone('America/Santiago')
@@ -1501,7 +1636,7 @@ async def create_task_comment(
     comment = {
         "id": str(uuid.uuid4()),
         "task_id": task_id,
-        "project_id": project_id,
+        "project_id": task["project_id"],
         "user_id": user["id"],
         "user_name": user.get("name", user.get("email")),
         "text": text,
@@ -1512,7 +1647,8 @@ async def create_task_comment(
         "created_at_utc": datetime.now(timezone.utc).isoformat()
     }
     
-    await db.task_comments.insert_one(comment)
+    # insert_one agrega _id (ObjectId) al dict; insertar una copia para poder devolverlo
+    await db.task_comments.insert_one(dict(comment))
     
     await log_activity("task", task_id, "comment_added", user, user["company_id"], {
         "has_text": bool(text),
@@ -1600,9 +1736,7 @@ async def upload_project_document(
     if file_size > 10 * 1024 * 1024:
         raise HTTPException(status_code=400, detail="Archivo muy grande (máximo 10MB)")
     
-    # Convert to base64
-    file_base64 = base64.b64encode(file_content).decode('utf-8')
-    file_url = f"data:application/pdf;base64,{file_base64}"
+    file_url = to_data_url(file_content, "application/pdf")
     
     # Create document record
     document = {
@@ -1647,16 +1781,13 @@ async def delete_project_document(project_id: str, document_id: str, user: dict
     return {"message": "Documento eliminado"}
 
 @api_router.get("/tasks/reassignments/history")
-async def get_reassignment_history(user: dict = Depends(get_current_user)):
+@query_budget(8)
+async def get_reassignment_history(user: dict = Depends(get_current_user), scope: ProjectScope = Depends(get_project_scope)):
     """Get all task reassignments history for the company"""
     # Get all tasks with reassignment history from user's company
-    company_projects = await db.projects.find(
-        {"company_id": user["company_id"]}, 
-        {"_id": 0, "id": 1}
-    ).to_list(100)
-    project_ids = [p["id"] for p in company_projects]
+    project_ids = await scope.company_ids()
     
-    tasks = await db.tasks.find(
+    tasks = await analytics_db.tasks.find(
         {
             "project_id": {"$in": project_ids},
             "reassignment_history": {"$exists": True, "$ne": []}
@@ -1664,6 +1795,20 @@ async def get_reassignment_history(user: dict = Depends(get_current_user)):
         {"_id": 0}
     ).to_list(1000)
     
+    # OPTIMIZACIÓN: Resolver todos los nombres de usuario en una sola query
+    history_user_ids = {
+        user_id
+        for task in tasks
+        for reassignment in task.get("reassignment_history", [])
+        for user_id in (reassignment.get("from_user_id"), reassignment.get("to_user_id"), reassignment.get("reassigned_by"))
+        if user_id
+    }
+    history_users = await analytics_db.users.find(
+        {"id": {"$in": list(history_user_ids)}},
+        {"_id": 0, "id": 1, "name": 1}
+    ).to_list(None) if history_user_ids else []
+    user_names = {u["id"]: u.get("name") for u in history_users}
+    
     # Flatten reassignment history with task info
     reassignments = []
     for task in tasks:
@@ -1673,19 +1818,15 @@ async def get_reassignment_history(user: dict = Depends(get_current_user)):
             to_user_id = reassignment.get("to_user_id")
             reassigned_by_id = reassignment.get("reassigned_by")
             
-            from_user = await db.users.find_one({"id": from_user_id}) if from_user_id else None
-            to_user = await db.users.find_one({"id": to_user_id}) if to_user_id else None
-            reassigned_by_user = await db.users.find_one({"id": reassigned_by_id}) if reassigned_by_id else None
-            
             reassignments.append({
                 "task_id": task["id"],
                 "task_title": task["title"],
                 "from_user_id": from_user_id or "sin_asignar",
-                "from_user_name": from_user.get("name") if from_user else "Sin asignar",
+                "from_user_name": user_names.get(from_user_id) if from_user_id in user_names else "Sin asignar",
                 "to_user_id": to_user_id or "sin_asignar",
-                "to_user_name": to_user.get("name") if to_user else "Sin asignar",
+                "to_user_name": user_names.get(to_user_id) if to_user_id in user_names else "Sin asignar",
                 "reassigned_by_id": reassigned_by_id or "sistema",
-                "reassigned_by_name": reassigned_by_user.get("name") if reassigned_by_user else "Sistema",
+                "reassigned_by_name": user_names.get(reassigned_by_id) if reassigned_by_id in user_names else "Sistema",
                 "reason": reassignment.get("reason", "Sin motivo especificado"),
                 "reassigned_at": reassignment.get("reassigned_at")
             })
@@ -1696,30 +1837,21 @@ async def get_reassignment_history(user: dict = Depends(get_current_user)):
     return reassignments
 
 @api_router.patch("/tasks/{task_id}/status")
-async def update_task_status(task_id: str, status: str, user: dict = Depends(get_current_user)):
+async def update_task_status(task_id: str, status: str, user: dict = Depends(get_current_user), access: TaskAccess = Depends(get_task_access)):
     """Update task status (for Kanban drag & drop)"""
-    task = await db.tasks.find_one({"id": task_id})
-    if not task:
-        raise HTTPException(status_code=404, detail="Tarea no encontrada")
-    
-    # Verify access
-    project = await db.projects.find_one({"id": task["project_id"]})
-    if not project:
-        raise HTTPException(status_code=404, detail="Proyecto no encontrado")
-    
-    if user["role"] == "USER":
-        if user["id"] not in project.get("assigned_users", []):
-            raise HTTPException(status_code=403, detail="No tienes acceso a este proyecto")
-    elif project.get("company_id") != user["company_id"]:
-        raise HTTPException(status_code=403, detail="Acceso denegado")
+    task, project = access
     
     # Store old progress before update
     old_progress = project.get("progress_percentage", 0)
     
-    await db.tasks.update_one(
-        {"id": task_id}, 
-        {"$set": {"status": status, "updated_at": datetime.now(timezone.utc).isoformat()}}
-    )
+    status_update = {"status": status, "updated_at": datetime.now(timezone.utc).isoformat()}
+    tracked = await update_task_tracked(db, task_id, status_update)
+    if tracked is None:
+        raise HTTPException(status_code=404, detail="Tarea no encontrada")
+    changes = [tracked]
+    await apply_task_changes(db, changes)
+    workload_reports.apply(project.get("company_id"), changes)
+    await caches_changed(project.get("company_id"), WORKLOAD)
     await log_activity("task", task_id, "status_changed", user, user["company_id"], {"status": status})
     
     # Recalculate project progress
@@ -1729,47 +1861,51 @@ async def update_task_status(task_id: str, status: str, user: dict = Depends(get
         {"$set": {"progress_percentage": new_progress, "updated_at": datetime.now(timezone.utc).isoformat()}}
     )
     
-    # Send milestone notification if applicable
-    await send_milestone_notification(task["project_id"], old_progress, new_progress)
+    await kanban_boards.update_task(db, task["project_id"], task_id, status_update, {"progress_percentage": new_progress})
+    
+    # Milestone notification is resolved and stored in the background
+    milestone_notifier.publish(task["project_id"], old_progress, new_progress)
     
-    print(f"📊 Progreso del proyecto actualizado: {old_progress}% -> {new_progress}%")
+    logger.debug("Project progress updated", extra={"project_id": task["project_id"], "old_progress": old_progress, "new_progress": new_progress})
     
     return {"message": "Estado actualizado"}
 
 # ===================== TASKS EXCEL IMPORT/EXPORT =====================
 
+# pandas (+ numpy, openpyxl) agrega ~270 ms y decenas de MB a cada worker y solo
+# se usa aquí, así que se carga con el primer export/import
+EXCEL_COLUMNS = ["title", "description", "status", "priority", "estimated_hours", "actual_hours", "due_date", "assigned_to", "tags"]
+
+def load_pandas():
+    import pandas
+    return pandas
+
+def tasks_to_excel(tasks: List[dict]) -> io.BytesIO:
+    pd = load_pandas()
+    df = pd.DataFrame(tasks)
+    df = df[[col for col in EXCEL_COLUMNS if col in df.columns]]
+    output = io.BytesIO()
+    with pd.ExcelWriter(output, engine='openpyxl') as writer:
+        df.to_excel(writer, index=False, sheet_name='Tareas')
+    output.seek(0)
+    return output
+
+def read_excel(contents: bytes):
+    return load_pandas().read_excel(io.BytesIO(contents))
+
 @api_router.get("/tasks/export")
-async def export_tasks_excel(project_id: Optional[str] = None, user: dict = Depends(get_current_user)):
+async def export_tasks_excel(project_id: Optional[str] = None, user: dict = Depends(get_current_user), scope: ProjectScope = Depends(get_project_scope)):
     """Export tasks to Excel file"""
     try:
-        query = {}
-        
-        if user["role"] == "USER":
-            user_projects = await db.projects.find({"assigned_users": user["id"]}, {"_id": 0, "id": 1}).to_list(100)
-            project_ids = [p["id"] for p in user_projects]
-            query["project_id"] = {"$in": project_ids}
-        else:
-            company_projects = await db.projects.find({"company_id": user["company_id"]}, {"_id": 0, "id": 1}).to_list(100)
-            project_ids = [p["id"] for p in company_projects]
-            query["project_id"] = {"$in": project_ids}
+        query = {"project_id": {"$in": await scope.visible_ids()}}
         
         if project_id:
             query["project_id"] = project_id
         
-        tasks = await db.tasks.find(query, {"_id": 0}).to_list(1000)
-        
-        # Convert to DataFrame
-        df = pd.DataFrame(tasks)
-        
-        # Select and order columns
-        columns = ["title", "description", "status", "priority", "estimated_hours", "actual_hours", "due_date", "assigned_to", "tags"]
-        df = df[[col for col in columns if col in df.columns]]
+        tasks = await analytics_db.tasks.find(query, {"_id": 0}).to_list(1000)
         
-        # Create Excel file in memory
-        output = io.BytesIO()
-        with pd.ExcelWriter(output, engine='openpyxl') as writer:
-            df.to_excel(writer, index=False, sheet_name='Tareas')
-        output.seek(0)
+        # pandas se importa y trabaja en un thread: no frena el event loop
+        output = await asyncio.to_thread(tasks_to_excel, tasks)
         
         # Return as streaming response
         return StreamingResponse(
@@ -1801,7 +1937,8 @@ async def import_tasks_excel(
         
         # Read Excel file
         contents = await file.read()
-        df = pd.read_excel(io.BytesIO(contents))
+        df = await asyncio.to_thread(read_excel, contents)
+        pd = load_pandas()
         
         # Validate required columns
         required_columns = ["title"]
@@ -1837,6 +1974,10 @@ async def import_tasks_excel(
             except Exception as e:
                 errors.append(f"Fila {index + 2}: {str(e)}")
         
+        if imported_count:
+            await kanban_boards.invalidate(db, project_id)
+            workload_reports.invalidate(project.get("company_id"))
+            await caches_changed(project.get("company_id"), WORKLOAD)
         await log_activity("tasks", project_id, "imported", user, user["company_id"], {"count": imported_count})
         
         return {
@@ -1849,6 +1990,36 @@ async def import_tasks_excel(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error al importar tareas: {str(e)}")
 
+# ===================== REPORTS =====================
+
+@api_router.get("/reports/workload")
+@query_budget(6)
+async def get_workload_report(
+    project_id: Optional[str] = None,
+    user_id: Optional[str] = None,
+    capacity_hours: float = Query(40, gt=0, description="Horas disponibles por persona y semana"),
+    user: dict = Depends(get_current_user),
+    scope: ProjectScope = Depends(get_project_scope)
+):
+    """Estimated/actual hours per assignee, status and due-date week across the company's projects"""
+    # Solo los administradores ven la carga de otras personas
+    if user["role"] not in ["COMPANY_ADMIN", "SUPER_ADMIN"]:
+        user_id = user["id"]
+    
+    project_ids = await scope.company_ids()
+    if project_id and project_id not in project_ids:
+        raise HTTPException(status_code=403, detail="Acceso denegado")
+    
+    generated_at, buckets = await workload_reports.buckets(db, user["company_id"], project_ids)
+    assignee_ids = list({bucket[1] for bucket in buckets if bucket[1]})
+    users = await db.users.find(
+        {"id": {"$in": assignee_ids}}, {"_id": 0, "id": 1, "name": 1}
+    ).to_list(None) if assignee_ids else []
+    
+    report = workload_reports.report(buckets, {u["id"]: u.get("name") for u in users}, capacity_hours, project_id, user_id)
+    report["generated_at"] = generated_at
+    return report
+
 # ===================== FINANCIAL MANAGEMENT =====================
 
 @api_router.get("/financial/report")
@@ -2022,7 +2193,7 @@ async def get_unread_count(user: dict = Depends(get_current_user)):
 # ===================== PAYMENTS MANAGEMENT =====================
 
 @api_router.get("/payments")
-async def get_payments(project_id: Optional[str] = None, user: dict = Depends(get_current_user)):
+async def get_payments(project_id: Optional[str] = None, user: dict = Depends(get_current_user), scope: ProjectScope = Depends(get_project_scope)):
     """Get payments for user's projects"""
     query = {}
     
@@ -2030,14 +2201,7 @@ async def get_payments(project_id: Optional[str] = None, user: dict = Depends(ge
     if project_id:
         query["project_id"] = project_id
     else:
-        if user["role"] == "USER":
-            user_projects = await db.projects.find({"assigned_users": user["id"]}, {"_id": 0, "id": 1}).to_list(100)
-            project_ids = [p["id"] for p in user_projects]
-            query["project_id"] = {"$in": project_ids}
-        else:
-            company_projects = await db.projects.find({"company_id": user["company_id"]}, {"_id": 0, "id": 1}).to_list(100)
-            project_ids = [p["id"] for p in company_projects]
-            query["project_id"] = {"$in": project_ids}
+        query["project_id"] = {"$in": await scope.visible_ids()}
     
     payments = await db.payments.find(query, {"_id": 0}).sort("payment_number", 1).to_list(100)
     return payments
@@ -2101,7 +2265,7 @@ async def update_payment(payment_id: str, data: PaymentUpdate, user: dict = Depe
 # ===================== PHASES MANAGEMENT =====================
 
 @api_router.get("/phases")
-async def get_phases(project_id: Optional[str] = None, user: dict = Depends(get_current_user)):
+async def get_phases(project_id: Optional[str] = None, user: dict = Depends(get_current_user), scope: ProjectScope = Depends(get_project_scope)):
     """Get phases for user's projects"""
     query = {}
     
@@ -2109,14 +2273,7 @@ async def get_phases(project_id: Optional[str] = None, user: dict = Depends(get_
     if project_id:
         query["project_id"] = project_id
     else:
-        if user["role"] == "USER":
-            user_projects = await db.projects.find({"assigned_users": user["id"]}, {"_id": 0, "id": 1}).to_list(100)
-            project_ids = [p["id"] for p in user_projects]
-            query["project_id"] = {"$in": project_ids}
-        else:
-            company_projects = await db.projects.find({"company_id": user["company_id"]}, {"_id": 0, "id": 1}).to_list(100)
-            project_ids = [p["id"] for p in company_projects]
-            query["project_id"] = {"$in": project_ids}
+        query["project_id"] = {"$in": await scope.visible_ids()}
     
     phases = await db.phases.find(query, {"_id": 0}).sort("order", 1).to_list(100)
     return phases
@@ -2275,8 +2432,10 @@ async def get_accounts_receivable_stats(user: dict = Depends(get_current_user)):
     """Get accounts receivable statistics"""
     query = {"company_id": user["company_id"]}
     
-    accounts = await db.accounts_receivable.find(query, {"_id": 0}).to_list(1000)
-    
+    accounts = await analytics_db.accounts_receivable.find(query, {"_id": 0}).to_list(1000)
+    return summarize_accounts_receivable(accounts)
+
+def summarize_accounts_receivable(accounts: List[dict]) -> dict:
     total_amount = sum(acc["amount"] for acc in accounts)
     total_paid = sum(acc.get("paid_amount", 0) for acc in accounts)
     total_pending = total_amount - total_paid
@@ -2318,6 +2477,45 @@ async def get_users(user: dict = Depends(get_current_user)):
     
     return users
 
+# ===================== AUTOCOMPLETE =====================
+
+@api_router.get("/autocomplete")
+async def autocomplete(
+    q: str = Query(..., min_length=1),
+    types: str = Query(",".join(ENTITY_TYPES)),
+    limit: int = Query(10, ge=1, le=50),
+    company_id: Optional[str] = Query(None),
+    user: dict = Depends(get_current_user)
+):
+    """Typeahead over users, clients and projects of the company"""
+    if user["role"] == "SUPER_ADMIN":
+        if not company_id:
+            raise HTTPException(status_code=400, detail="SUPER_ADMIN debe especificar company_id")
+    else:
+        company_id = user.get("company_id")
+        if not company_id:
+            raise HTTPException(status_code=400, detail="Usuario no pertenece a ninguna empresa")
+    
+    kinds = [k.strip() for k in types.split(",") if k.strip() in ENTITY_TYPES]
+    await autocomplete_index.ensure_loaded(db, company_id)
+    
+    allow = None
+    # TEAM_MEMBER y USER solo ven proyectos asignados y sus clientes (igual que GET /projects y GET /clients)
+    if user["role"] not in ["SUPER_ADMIN", "COMPANY_ADMIN"]:
+        assigned_client_ids = {
+            p.get("client_id") for p in autocomplete_index.entries(company_id, "projects")
+            if user["id"] in (p.get("assigned_users") or [])
+        }
+        
+        def allow(kind, doc):
+            if kind == "projects":
+                return user["id"] in (doc.get("assigned_users") or [])
+            if kind == "clients":
+                return doc["id"] in assigned_client_ids
+            return True
+    
+    return autocomplete_index.search(company_id, q, kinds, limit, allow)
+
 # ===================== COMPANY - USER MANAGEMENT =====================
 
 @api_router.get("/company/users")
@@ -2345,6 +2543,9 @@ async def create_company_user(data: UserCreate, user: dict = Depends(require_com
         "created_at": datetime.now(timezone.utc).isoformat()
     }
     await db.users.insert_one(user_doc)
+    autocomplete_index.upsert(user["company_id"], "users", user_doc)
+    milestone_notifier.invalidate()
+    await caches_changed(user["company_id"], AUTOCOMPLETE, RECIPIENTS)
     await log_activity("user", user_id, "created", user, user["company_id"], {"name": data.name})
     
     return {"id": user_id, "message": "Usuario creado"}
@@ -2377,6 +2578,12 @@ async def update_company_user(user_id: str, data: UserUpdate, user: dict = Depen
     update_data["updated_at"] = datetime.now(timezone.utc).isoformat()
     
     await db.users.update_one({"id": user_id}, {"$set": update_data})
+    autocomplete_index.upsert(target_user["company_id"], "users", {**target_user, **update_data})
+    if "email" in update_data:
+        milestone_notifier.invalidate()
+    await caches_changed(target_user["company_id"], AUTOCOMPLETE, *((RECIPIENTS,) if "email" in update_data else ()))
+    if "name" in update_data:
+        await kanban_boards.rename_user(db, target_user["company_id"], user_id, update_data["name"])
     await log_activity("user", user_id, "updated", user, user["company_id"], update_data)
     
     return {"message": "Usuario actualizado"}
@@ -2395,6 +2602,8 @@ async def delete_company_user(user_id: str, user: dict = Depends(require_company
         raise HTTPException(status_code=400, detail="No puedes eliminarte a ti mismo")
     
     await db.users.delete_one({"id": user_id})
+    autocomplete_index.remove(target_user["company_id"], "users", user_id)
+    await caches_changed(target_user["company_id"], AUTOCOMPLETE)
     await log_activity("user", user_id, "deleted", user, user["company_id"], {"name": target_user.get("name")})
     
     return {"message": "Usuario eliminado"}
@@ -2418,7 +2627,7 @@ async def get_available_modules():
 # ===================== DASHBOARD STATS =====================
 
 @api_router.get("/dashboard/stats")
-async def get_dashboard_stats(user: dict = Depends(get_current_user), company: dict = Depends(get_user_company)):
+async def get_dashboard_stats(user: dict = Depends(get_current_user), company: dict = Depends(get_user_company), scope: ProjectScope = Depends(get_project_scope)):
     """Get dashboard statistics for the company - OPTIMIZADO"""
     if user.get("role") == "SUPER_ADMIN":
         return await get_global_metrics(user)
@@ -2427,23 +2636,18 @@ async def get_dashboard_stats(user: dict = Depends(get_current_user), company: d
     
     # OPTIMIZACIÓN: Para USER/TEAM_MEMBER, filtrar por proyectos asignados
     if user["role"] in ["USER", "TEAM_MEMBER"]:
-        # Obtener proyectos asignados
-        user_projects = await db.projects.find(
-            {"assigned_users": user["id"]},
-            {"_id": 0, "id": 1, "client_id": 1}
-        ).to_list(100)
-        
-        project_ids = [p["id"] for p in user_projects]
-        client_ids = [p.get("client_id") for p in user_projects if p.get("client_id")]
+        # Proyectos asignados (cacheados)
+        project_ids = await scope.assigned_ids()
+        client_ids = await scope.assigned_client_ids()
         
         # Stats filtradas por proyectos asignados
         total_clients = len(client_ids)
-        active_clients = await db.clients.count_documents({"id": {"$in": client_ids}, "status": "active"}) if client_ids else 0
+        active_clients = await analytics_db.clients.count_documents({"id": {"$in": client_ids}, "status": "active"}) if client_ids else 0
         
         # Tareas del usuario
-        total_tasks = await db.tasks.count_documents({"project_id": {"$in": project_ids}}) if project_ids else 0
-        pending_tasks = await db.tasks.count_documents({"project_id": {"$in": project_ids}, "status": "Por Hacer"}) if project_ids else 0
-        completed_tasks = await db.tasks.count_documents({"project_id": {"$in": project_ids}, "status": "Completada"}) if project_ids else 0
+        total_tasks = await analytics_db.tasks.count_documents({"project_id": {"$in": project_ids}}) if project_ids else 0
+        pending_tasks = await analytics_db.tasks.count_documents({"project_id": {"$in": project_ids}, "status": "Por Hacer"}) if project_ids else 0
+        completed_tasks = await analytics_db.tasks.count_documents({"project_id": {"$in": project_ids}, "status": "Completada"}) if project_ids else 0
         
         return {
             "total_clients": total_clients,
@@ -2457,17 +2661,15 @@ async def get_dashboard_stats(user: dict = Depends(get_current_user), company: d
         }
     
     # COMPANY_ADMIN: Stats de toda la empresa (ejecutar queries en paralelo con asyncio.gather)
-    import asyncio
-    
     results = await asyncio.gather(
-        db.clients.count_documents({"company_id": company_id}),
-        db.clients.count_documents({"company_id": company_id, "status": "active"}),
-        db.activities.count_documents({"company_id": company_id}),
-        db.activities.count_documents({"company_id": company_id, "status": "pendiente"}),
-        db.activities.count_documents({"company_id": company_id, "completed": True}),
-        db.users.count_documents({"company_id": company_id}),
-        db.activities.find({"company_id": company_id}, {"_id": 0}).sort("created_at", -1).limit(10).to_list(10),
-        db.clients.find({"company_id": company_id}, {"_id": 0}).sort("created_at", -1).limit(10).to_list(10)
+        analytics_db.clients.count_documents({"company_id": company_id}),
+        analytics_db.clients.count_documents({"company_id": company_id, "status": "active"}),
+        analytics_db.activities.count_documents({"company_id": company_id}),
+        analytics_db.activities.count_documents({"company_id": company_id, "status": "pendiente"}),
+        analytics_db.activities.count_documents({"company_id": company_id, "completed": True}),
+        analytics_db.users.count_documents({"company_id": company_id}),
+        analytics_db.activities.find({"company_id": company_id}, {"_id": 0}).sort("created_at", -1).limit(10).to_list(10),
+        analytics_db.clients.find({"company_id": company_id}, {"_id": 0}).sort("created_at", -1).limit(10).to_list(10)
     )
     
     return {
@@ -2499,7 +2701,7 @@ async def get_activity_logs(
     if entity_type:
         query["entity_type"] = entity_type
     
-    logs = await db.activity_logs.find(query, {"_id": 0}).sort("timestamp", -1).limit(limit).to_list(limit)
+    logs = await analytics_db.activity_logs.find(query, {"_id": 0}).sort("timestamp", -1).limit(limit).to_list(limit)
     return logs
 
 # ===================== SEED DATA =====================
@@ -2677,6 +2879,64 @@ app.add_middleware(
     expose_headers=["*"],
 )
 
+# Compresión gzip/Brotli de respuestas JSON/texto (ver compression.py)
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=int(os.environ.get('COMPRESSION_MIN_SIZE', '1024')),
+    gzip_level=int(os.environ.get('COMPRESSION_GZIP_LEVEL', '6')),
+    brotli_quality=int(os.environ.get('COMPRESSION_BROTLI_QUALITY', '4')),
+    thread_min_size=int(os.environ.get('COMPRESSION_THREAD_MIN_SIZE', '65536'))
+)
+
+# Presupuesto de consultas por ruta: QUERY_BUDGET_MODE=off|warn|strict (strict en tests)
+app.add_middleware(QueryBudgetMiddleware, mode=os.environ.get('QUERY_BUDGET_MODE', 'warn'))
+
+# Métricas por ruta
+app.add_middleware(MetricsMiddleware)
+
+# X-Request-ID para correlacionar logs (middleware más externo)
+app.add_middleware(RequestIdMiddleware)
+
+# Recalcula los totales de los grupos de tareas (repara diferencias de scripts o
+# escrituras fuera de la API); STATS_RECONCILE_INTERVAL_MINUTES=0 lo desactiva
+STATS_RECONCILE_INTERVAL_SECONDS = float(os.environ.get('STATS_RECONCILE_INTERVAL_MINUTES', '60')) * 60
+
+async def reconcile_task_group_stats_job():
+    # Un solo proceso por intervalo, aunque haya varios workers o máquinas
+    if not await acquire_lease(db, "reconcile_task_group_stats", STATS_RECONCILE_INTERVAL_SECONDS):
+        return
+    corrected = await reconcile_stats(db)
+    if corrected:
+        logger.warning("Totales de grupos corregidos", extra={"groups": corrected})
+
+async def ensure_indexes():
+    await kanban_boards.ensure_indexes(db)
+
+background_jobs = BackgroundJobs()
+background_jobs.once("ensure_indexes", ensure_indexes, required=True)
+if STATS_RECONCILE_INTERVAL_SECONDS > 0:
+    background_jobs.every("reconcile_task_group_stats", reconcile_task_group_stats_job,
+                          interval=STATS_RECONCILE_INTERVAL_SECONDS, initial_delay=STATS_RECONCILE_INTERVAL_SECONDS)
+
+@app.on_event("startup")
+async def startup_event():
+    query_tracer.configure(db, asyncio.get_running_loop())
+    milestone_notifier.start(db)
+    background_jobs.start()
+    metrics_exporter.start()
+    if loop_monitor:
+        loop_monitor.start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await background_jobs.stop()
+    await milestone_notifier.stop()
+    await metrics_exporter.stop()
+    if loop_monitor:
+        await loop_monitor.stop()
+    # Después de que terminaron las requests en curso: libera las conexiones del pool
+    client.close()
+
 app.include_router(api_router)
 
 # ===================== TEMPORARY FIX ENDPOINT =====================
@@ -3170,6 +3430,12 @@ async def root():
 async def health():
     return {"status": "healthy"}
 
+@app.get("/metrics")
+async def metrics():
+    """Prometheus text exposition for this worker, or for every worker with a `worker` label"""
+    return Response(content=await metrics_exporter.render(), media_type=METRICS_CONTENT_TYPE)
+
 if __name__ == "__main__":
+    # Desarrollo: un solo proceso. En producción usar run_production.py (varios workers)
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,153 @@
+"""
+Tareas de arranque y periódicas que corren en segundo plano.
+
+El startup de la app ya no espera a que termine el seed de datos demo ni la
+limpieza de logs: cada tarea se registra aquí y corre como una tarea de
+asyncio supervisada. Una tarea de arranque que falla se reintenta con espera
+exponencial hasta `max_attempts`; una periódica se vuelve a ejecutar cada
+`interval` segundos, falle o no.
+
+`/health` solo indica que el proceso responde (liveness). `/ready` indica si
+las tareas marcadas `required` ya terminaron bien (readiness): el balanceador
+no debería mandar tráfico antes de eso.
+
+Con varios workers (o varias máquinas) cada proceso tiene su propio
+BackgroundJobs. Las tareas periódicas que deben correr en un solo proceso
+toman antes un lease en `job_leases` con `acquire_lease`: un documento por
+tarea con el dueño y el vencimiento. Si el dueño muere, otro proceso lo toma
+cuando vence.
+"""
+import asyncio
+import logging
+import os
+import socket
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from pymongo.errors import DuplicateKeyError
+
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+LEASES = "job_leases"
+# Identifica a este proceso como dueño de un lease
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+JOB_RUNS = REGISTRY.counter("background_job_runs_total", "Background job executions by result", ("job", "result"))
+JOB_SECONDS = REGISTRY.histogram("background_job_seconds", "Background job duration", ("job",))
+
+
+async def acquire_lease(db, name: str, ttl_seconds: float, owner: Optional[str] = None) -> bool:
+    """Take or renew the lease for `name`; False while another process holds an unexpired one"""
+    owner = owner or WORKER_ID
+    now = datetime.now(timezone.utc)
+    try:
+        await db[LEASES].find_one_and_update(
+            {"_id": name, "$or": [{"owner": owner}, {"expires_at": {"$lte": now}}]},
+            {"$set": {"owner": owner, "expires_at": now + timedelta(seconds=ttl_seconds), "acquired_at": now}},
+            upsert=True
+        )
+    except DuplicateKeyError:
+        # El documento existe con otro dueño vigente: el filtro no matcheó y el upsert chocó con _id
+        return False
+    return True
+
+
+class _Job:
+    def __init__(self, name: str, func: Callable[[], Awaitable[None]], interval: Optional[float],
+                 initial_delay: float, required: bool, max_attempts: int):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.initial_delay = initial_delay
+        self.required = required
+        self.max_attempts = max_attempts
+        self.state = "pending"
+        self.attempts = 0
+        self.last_error: Optional[str] = None
+        self.last_run: Optional[str] = None
+
+    def status(self) -> dict:
+        return {
+            "state": self.state,
+            "attempts": self.attempts,
+            "last_run": self.last_run,
+            "last_error": self.last_error,
+        }
+
+
+class BackgroundJobs:
+    def __init__(self, retry_base_seconds: float = 1.0, retry_max_seconds: float = 60.0):
+        self.retry_base_seconds = retry_base_seconds
+        self.retry_max_seconds = retry_max_seconds
+        self._jobs: Dict[str, _Job] = {}
+        self._tasks: List[asyncio.Task] = []
+
+    def once(self, name: str, func: Callable[[], Awaitable[None]], required: bool = False, max_attempts: int = 5):
+        """Run func once after startup, retrying on failure; required jobs gate readiness"""
+        self._jobs[name] = _Job(name, func, None, 0.0, required, max_attempts)
+
+    def every(self, name: str, func: Callable[[], Awaitable[None]], interval: float, initial_delay: float = 0.0):
+        self._jobs[name] = _Job(name, func, interval, initial_delay, False, 1)
+
+    @property
+    def ready(self) -> bool:
+        return all(job.state == "done" for job in self._jobs.values() if job.required)
+
+    def status(self) -> Dict[str, dict]:
+        return {name: job.status() for name, job in self._jobs.items()}
+
+    def start(self):
+        """Must be called from the event loop (e.g. a startup handler)"""
+        if self._tasks:
+            return
+        self._tasks = [asyncio.create_task(self._supervise(job), name=f"job-{job.name}") for job in self._jobs.values()]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _run(self, job: _Job) -> bool:
+        job.state = "running"
+        job.attempts += 1
+        started = time.perf_counter()
+        try:
+            await job.func()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            job.last_error = f"{type(e).__name__}: {e}"
+            JOB_RUNS.inc(job=job.name, result="error")
+            logger.exception("Error en tarea en segundo plano", extra={"job": job.name, "attempt": job.attempts})
+            return False
+        finally:
+            JOB_SECONDS.observe(time.perf_counter() - started, job=job.name)
+            job.last_run = datetime.now(timezone.utc).isoformat()
+        job.last_error = None
+        JOB_RUNS.inc(job=job.name, result="ok")
+        return True
+
+    async def _supervise(self, job: _Job):
+        if job.initial_delay:
+            await asyncio.sleep(job.initial_delay)
+
+        if job.interval is not None:
+            while True:
+                ok = await self._run(job)
+                job.state = "scheduled" if ok else "failed"
+                await asyncio.sleep(job.interval)
+
+        while True:
+            if await self._run(job):
+                job.state = "done"
+                return
+            if job.attempts >= job.max_attempts:
+                job.state = "failed"
+                logger.error("Tarea en segundo plano agotó sus reintentos", extra={"job": job.name, "attempts": job.attempts})
+                return
+            job.state = "retrying"
+            await asyncio.sleep(min(self.retry_base_seconds * 2 ** (job.attempts - 1), self.retry_max_seconds))
@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+"""
+Perfil de arranque de un worker: tiempo de import y memoria en reposo.
+
+Importa el módulo del servidor en un proceso nuevo con `python -X importtime`
+y resume los módulos que más tardan (tiempo acumulado, incluye sus imports),
+el tiempo total de import y el RSS del proceso una vez importado, sin
+requests. También verifica que las dependencias pesadas que solo usan
+endpoints poco frecuentes (pandas, numpy, openpyxl) no se carguen al arrancar.
+
+El tiempo de import varía bastante entre corridas (en la misma máquina se
+vieron de 490 a 770 ms), así que se importa `--runs` veces y se usa la
+mediana. Con `--baseline` los objetivos salen de un baseline medido en la
+misma máquina más `--margin` por ciento, como en benchmarks.py; sin baseline
+se usan los objetivos absolutos, que dejan margen sobre lo medido.
+
+Uso:
+    python startup_profile.py                              # server_multitenant
+    python startup_profile.py --module server --top 30
+    python startup_profile.py --save startup_baseline.json
+    python startup_profile.py --baseline startup_baseline.json --margin 25
+    python startup_profile.py --max-import-ms 1000 --max-rss-mb 80
+
+Sale con código 1 si se supera algún objetivo o se carga un módulo prohibido.
+Como en benchmarks.py, los números solo son comparables en la misma máquina.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Optional
+
+ROOT_DIR = Path(__file__).parent
+
+# Objetivos por defecto para server_multitenant (Python 3.11, sin tráfico): mediana
+# medida ~550 ms y 53 MB, con margen para máquinas más lentas o cargadas
+DEFAULT_MAX_IMPORT_MS = 1000
+DEFAULT_MAX_RSS_MB = 80
+DEFAULT_RUNS = 5
+DEFAULT_MARGIN = 25  # por ciento sobre el baseline
+DEFAULT_FORBIDDEN = ("pandas", "numpy", "openpyxl")
+
+# Se ejecuta en el proceso hijo, después de importar el módulo
+_PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - started
+rss_kb = 0
+try:
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                rss_kb = int(line.split()[1])
+except OSError:
+    import resource
+    rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({{"import_ms": elapsed * 1000, "rss_kb": rss_kb, "modules": sorted(sys.modules)}}))
+"""
+
+
+def parse_importtime(stderr: str) -> List[dict]:
+    """Rows of `-X importtime` output: module, self and cumulative microseconds, depth"""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        try:
+            self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+            self_us, cumulative_us = int(self_us), int(cumulative_us)
+        except ValueError:
+            continue
+        name = name[1:]  # el espacio después de "|"; el resto de la indentación es la profundidad
+        rows.append({
+            "module": name.strip(),
+            "self_us": self_us,
+            "cumulative_us": cumulative_us,
+            "depth": (len(name) - len(name.lstrip())) // 2,
+        })
+    return rows
+
+
+def profile(module: str) -> dict:
+    env = {
+        **os.environ,
+        # Importar el servidor no abre conexiones: Motor conecta de forma perezosa
+        "MONGO_URL": os.environ.get("MONGO_URL", "mongodb://localhost:27017"),
+        "DB_NAME": os.environ.get("DB_NAME", "pactum_startup_profile"),
+        "LOG_LEVEL": "WARNING",
+        "LOOP_MONITOR": "0",
+    }
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", _PROBE.format(module=module)],
+        cwd=ROOT_DIR, env=env, capture_output=True, text=True
+    )
+    if proc.returncode != 0:
+        raise SystemExit(f"No se pudo importar {module}:\n{proc.stderr[-2000:]}")
+    probe = json.loads(proc.stdout.strip().splitlines()[-1])
+    return {**probe, "importtime": parse_importtime(proc.stderr)}
+
+
+def profile_runs(module: str, runs: int) -> dict:
+    """Profile the import `runs` times; the result is the run with the median import time"""
+    results = sorted((profile(module) for _ in range(max(1, runs))), key=lambda r: r["import_ms"])
+    median = results[len(results) // 2]
+    return {
+        **median,
+        "import_ms": statistics.median(r["import_ms"] for r in results),
+        "rss_kb": statistics.median(r["rss_kb"] for r in results),
+        "samples_ms": [round(r["import_ms"], 1) for r in results],
+    }
+
+
+def objectives(args, baseline: Optional[dict]) -> Dict[str, float]:
+    """Explicit limits win; then baseline plus margin; then the absolute defaults"""
+    factor = 1 + args.margin / 100
+    return {
+        "import_ms": args.max_import_ms if args.max_import_ms is not None
+        else baseline["import_ms"] * factor if baseline else DEFAULT_MAX_IMPORT_MS,
+        "rss_mb": args.max_rss_mb if args.max_rss_mb is not None
+        else baseline["rss_mb"] * factor if baseline else DEFAULT_MAX_RSS_MB,
+    }
+
+
+def top_level(rows: List[dict], module: str, top: int) -> List[dict]:
+    """Heaviest direct imports of the profiled module (what a lazy import could save)"""
+    # -X importtime lista los hijos antes que el padre: los directos son los de
+    # profundidad 1 entre el import anterior de nivel 0 y el módulo
+    direct: List[dict] = []
+    for row in rows:
+        if row["depth"] == 0:
+            if row["module"] == module:
+                break
+            direct = []
+        elif row["depth"] == 1:
+            direct.append(row)
+    return sorted(direct, key=lambda r: r["cumulative_us"], reverse=True)[:top]
+
+
+def main(args) -> int:
+    baseline = json.loads(Path(args.baseline).read_text()) if args.baseline else None
+    limits = objectives(args, baseline)
+    result = profile_runs(args.module, args.runs)
+    rows = result["importtime"]
+    import_ms = result["import_ms"]
+    rss_mb = result["rss_kb"] / 1024
+    loaded = set(result["modules"])
+    forbidden = [name for name in args.forbid if name in loaded]
+    source = f" ({args.baseline} + {args.margin:g}%)" if baseline else ""
+
+    print(f"{'import (acumulado)':<48} {'ms':>10} {'self ms':>10}")
+    for row in top_level(rows, args.module, args.top):
+        print(f"{row['module']:<48} {row['cumulative_us'] / 1000:>10.1f} {row['self_us'] / 1000:>10.1f}")
+    print(f"\nimport {args.module}: {import_ms:.0f} ms, mediana de {len(result['samples_ms'])} "
+          f"({', '.join(f'{ms:.0f}' for ms in result['samples_ms'])}) (objetivo {limits['import_ms']:.0f} ms{source})")
+    print(f"RSS en reposo: {rss_mb:.1f} MB (objetivo {limits['rss_mb']:.1f} MB{source})")
+    print(f"Módulos cargados: {len(loaded)}")
+
+    if args.save:
+        Path(args.save).write_text(json.dumps({
+            "meta": {
+                "timestamp": datetime.now(timezone.utc).isoformat(),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "module": args.module,
+            },
+            "import_ms": round(import_ms, 1),
+            "import_samples_ms": result["samples_ms"],
+            "rss_mb": round(rss_mb, 1),
+            "modules_loaded": len(loaded),
+            "top_imports": [
+                {"module": r["module"], "cumulative_ms": round(r["cumulative_us"] / 1000, 1)}
+                for r in top_level(rows, args.module, args.top)
+            ],
+        }, indent=2, ensure_ascii=False))
+        print(f"Resultados guardados en {args.save}")
+
+    failures: Dict[str, str] = {}
+    if import_ms > limits["import_ms"]:
+        failures["import"] = f"{import_ms:.0f} ms > {limits['import_ms']:.0f} ms"
+    if rss_mb > limits["rss_mb"]:
+        failures["rss"] = f"{rss_mb:.1f} MB > {limits['rss_mb']:.1f} MB"
+    if forbidden:
+        failures["forbidden"] = f"cargados al arrancar: {', '.join(forbidden)}"
+    if failures:
+        print("\nObjetivos no cumplidos:")
+        for name, detail in failures.items():
+            print(f"  - {name}: {detail}")
+        return 1
+    return 0
+
+
+def _env_float(name: str) -> Optional[float]:
+    value = os.environ.get(name)
+    return float(value) if value else None
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Tiempo de import y RSS en reposo de un worker")
+    parser.add_argument("--module", default="server_multitenant")
+    parser.add_argument("--top", type=int, default=20, help="Cantidad de imports directos a listar")
+    parser.add_argument("--runs", type=int, default=DEFAULT_RUNS, help="Imports a medir; se usa la mediana")
+    parser.add_argument("--baseline", help="JSON guardado con --save: los objetivos son el baseline más --margin")
+    parser.add_argument("--margin", type=float, default=DEFAULT_MARGIN, help="Por ciento tolerado sobre el baseline")
+    parser.add_argument("--max-import-ms", type=float, default=_env_float("STARTUP_MAX_IMPORT_MS"),
+                        help=f"Objetivo explícito (por defecto baseline + margen, o {DEFAULT_MAX_IMPORT_MS} ms)")
+    parser.add_argument("--max-rss-mb", type=float, default=_env_float("STARTUP_MAX_RSS_MB"),
+                        help=f"Objetivo explícito (por defecto baseline + margen, o {DEFAULT_MAX_RSS_MB} MB)")
+    parser.add_argument("--forbid", action="append", default=None,
+                        help=f"Módulo que no debe cargarse al importar (por defecto: {', '.join(DEFAULT_FORBIDDEN)})")
+    parser.add_argument("--save", help="Guardar resultados como JSON")
+    return parser
+
+
+if __name__ == "__main__":
+    arguments = build_parser().parse_args()
+    arguments.forbid = arguments.forbid or list(DEFAULT_FORBIDDEN)
+    sys.exit(main(arguments))
@@ -0,0 +1,221 @@
+"""
+Totales por grupo de tareas (horas estimadas/reales y cantidad por estado).
+
+Los totales viven en el propio documento del grupo, en el campo `stats`, y se
+mantienen con `$inc` a partir de la diferencia entre la tarea antes y después
+de cada escritura. La pertenencia de una tarea a un grupo es su
+`task_group_id`. Los grupos sin `stats` (creados antes de esto o por scripts)
+se calculan una sola vez con una agregación al leerlos.
+
+El "antes" de cada diferencia tiene que ser el del documento al momento de
+escribir, no una lectura previa: `update_task_tracked` y
+`delete_task_tracked` lo obtienen con find_one_and_update/delete en la misma
+operación, así dos updates concurrentes de la misma tarea no restan el mismo
+estado dos veces. Igual, `reconcile_stats` recalcula los totales con la
+misma agregación del backfill (el servidor lo corre periódicamente, en un
+solo proceso) para reparar lo que escriban scripts o endpoints que no pasan
+por aquí. Solo reemplaza `stats` si sigue igual a lo que leyó antes de
+agregar: un `$inc` concurrente hace que ese grupo se reintente en vez de
+perderse.
+"""
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from pymongo import ReturnDocument, UpdateOne
+
+from kanban_board import estimated_hours
+
+# Campos de la tarea que afectan los totales
+STAT_FIELDS = ("task_group_id", "status", "estimated_hours", "estimated_minutes", "actual_hours")
+# Lo que necesitan los totales por grupo y los buckets del reporte de carga
+CHANGE_PROJECTION = {"_id": 0, "id": 1, "project_id": 1, "assigned_to": 1, "due_date": 1, **{f: 1 for f in STAT_FIELDS}}
+
+
+def _status_key(status) -> str:
+    status = str(status or "backlog")
+    return status if "." not in status and not status.startswith("$") else "other"
+
+
+def _add(incs: Dict[str, Dict[str, float]], task: dict, sign: int):
+    group_id = task.get("task_group_id")
+    if not group_id:
+        return
+    inc = incs[group_id]
+    inc["stats.task_count"] = inc.get("stats.task_count", 0) + sign
+    inc["stats.estimated_hours"] = inc.get("stats.estimated_hours", 0) + sign * estimated_hours(task)
+    inc["stats.actual_hours"] = inc.get("stats.actual_hours", 0) + sign * float(task.get("actual_hours") or 0)
+    key = f"stats.by_status.{_status_key(task.get('status'))}"
+    inc[key] = inc.get(key, 0) + sign
+
+
+def stat_increments(changes: Iterable[tuple]) -> Dict[str, Dict[str, float]]:
+    """$inc documents per group id for a list of (old_task, new_task) pairs; either side may be None"""
+    incs: Dict[str, Dict[str, float]] = defaultdict(dict)
+    for old, new in changes:
+        if old is not None and new is not None and all(old.get(f) == new.get(f) for f in STAT_FIELDS):
+            continue
+        if old is not None:
+            _add(incs, old, -1)
+        if new is not None:
+            _add(incs, new, 1)
+    return {
+        group_id: {k: v for k, v in inc.items() if v}
+        for group_id, inc in incs.items() if any(inc.values())
+    }
+
+
+async def apply_task_changes(db, changes: Iterable[tuple], session=None):
+    """Apply the stat deltas of the given task changes in a single bulk write"""
+    incs = stat_increments(changes)
+    if not incs:
+        return
+    await db.task_groups.bulk_write(
+        [UpdateOne({"id": group_id, "stats": {"$exists": True}}, {"$inc": inc}) for group_id, inc in incs.items()],
+        ordered=False, session=session
+    )
+
+
+async def update_task_tracked(db, task_id: str, fields: dict, session=None) -> Optional[Tuple[dict, dict]]:
+    """$set the fields and return the (before, after) pair taken atomically with the write; None if missing"""
+    before = await db.tasks.find_one_and_update(
+        {"id": task_id}, {"$set": fields}, projection=CHANGE_PROJECTION,
+        return_document=ReturnDocument.BEFORE, session=session
+    )
+    if before is None:
+        return None
+    return before, {**before, **{k: v for k, v in fields.items() if k in CHANGE_PROJECTION}}
+
+
+async def delete_task_tracked(db, task_id: str, session=None) -> Optional[dict]:
+    """Delete the task and return its state at deletion time; None if missing"""
+    return await db.tasks.find_one_and_delete({"id": task_id}, projection=CHANGE_PROJECTION, session=session)
+
+
+def membership_diff(listed_ids: Iterable[str], member_ids: Iterable[str], new_ids: Iterable[str]) -> Tuple[List[str], List[str]]:
+    """(added, removed) task ids to make new_ids the group's members
+
+    listed_ids is the group's task_ids list and member_ids the tasks whose
+    task_group_id points at the group; they can disagree for legacy data, so a
+    task in either one that is not in new_ids is removed, and a task in new_ids
+    that does not point at the group yet is added.
+    """
+    listed, members, new = set(listed_ids), set(member_ids), set(new_ids)
+    return sorted(new - members), sorted((listed | members) - new)
+
+
+async def membership_changes(db, group_id: str, added: Iterable[str], removed: Iterable[str], session=None) -> List[tuple]:
+    """(old, new) task pairs for tasks moving into or out of the group, read before the move is written"""
+    added, removed = set(added), set(removed) - set(added)
+    if not added and not removed:
+        return []
+    tasks = await db.tasks.find(
+        {"id": {"$in": list(added | removed)}}, {"_id": 0, "id": 1, **{f: 1 for f in STAT_FIELDS}}, session=session
+    ).to_list(None)
+    changes = []
+    for task in tasks:
+        if task["id"] in added and task.get("task_group_id") != group_id:
+            changes.append((task, {**task, "task_group_id": group_id}))
+        elif task["id"] in removed and task.get("task_group_id") == group_id:
+            changes.append((task, {**task, "task_group_id": None}))
+    return changes
+
+
+def empty_stats() -> dict:
+    return {"task_count": 0, "estimated_hours": 0.0, "actual_hours": 0.0, "by_status": {}}
+
+
+async def compute_stats(db, group_ids: List[str]) -> Dict[str, dict]:
+    """Stats of the given groups computed from their tasks"""
+    stats = {group_id: empty_stats() for group_id in group_ids}
+    if not group_ids:
+        return stats
+    rows = await db.tasks.aggregate([
+        {"$match": {"task_group_id": {"$in": group_ids}}},
+        {"$group": {
+            "_id": {"group": "$task_group_id", "status": "$status"},
+            "count": {"$sum": 1},
+            "estimated_hours": {"$sum": {"$ifNull": ["$estimated_hours", {"$divide": [{"$ifNull": ["$estimated_minutes", 0]}, 60]}]}},
+            "actual_hours": {"$sum": {"$ifNull": ["$actual_hours", 0]}},
+        }},
+    ]).to_list(None)
+    for row in rows:
+        group = stats[row["_id"]["group"]]
+        group["task_count"] += row["count"]
+        group["estimated_hours"] += row["estimated_hours"]
+        group["actual_hours"] += row["actual_hours"]
+        status = _status_key(row["_id"].get("status"))
+        group["by_status"][status] = group["by_status"].get(status, 0) + row["count"]
+    return stats
+
+
+async def backfill_stats(db, group_ids: List[str]) -> Dict[str, dict]:
+    """Compute stats from scratch for groups that do not have them yet"""
+    if not group_ids:
+        return {}
+    stats = await compute_stats(db, group_ids)
+    await db.task_groups.bulk_write(
+        [UpdateOne({"id": group_id, "stats": {"$exists": False}}, {"$set": {"stats": value}}) for group_id, value in stats.items()],
+        ordered=False
+    )
+    return stats
+
+
+async def reconcile_stats(db, query: Optional[dict] = None, batch_size: int = 500, attempts: int = 3) -> int:
+    """Recompute and overwrite the stats of the matching groups; returns how many were corrected.
+    A group whose stats changed since they were read (a concurrent $inc) is retried, then left
+    for the next run"""
+    corrected = 0
+    cursor = db.task_groups.find(query or {}, {"_id": 0, "id": 1, "stats": 1})
+    while True:
+        groups = await cursor.to_list(batch_size)
+        if not groups:
+            return corrected
+        for _ in range(attempts):
+            corrected += await _reconcile_batch(db, groups)
+            if not groups:
+                break
+            groups = await db.task_groups.find({"id": {"$in": [g["id"] for g in groups]}}, {"_id": 0, "id": 1, "stats": 1}).to_list(None)
+
+
+async def _reconcile_batch(db, groups: List[dict]) -> int:
+    """Correct stale groups only if their stats are still the ones read; the rest stay in `groups`"""
+    stats = await compute_stats(db, [g["id"] for g in groups])
+    stale = [g for g in groups if not _same_stats(g.get("stats"), stats[g["id"]])]
+    groups.clear()
+    corrected = 0
+    for group in stale:
+        # Condicionado a lo leído: un $inc que llegó después de la agregación no se pisa
+        result = await db.task_groups.update_one(
+            {"id": group["id"], "stats": group.get("stats")}, {"$set": {"stats": stats[group["id"]]}}
+        )
+        if result.matched_count:
+            corrected += 1
+        else:
+            groups.append(group)
+    return corrected
+
+
+def _same_stats(stored: Optional[dict], computed: dict) -> bool:
+    if not stored:
+        return False
+    # Los $inc de horas acumulan error de punto flotante
+    return (
+        int(stored.get("task_count") or 0) == computed["task_count"]
+        and abs(float(stored.get("estimated_hours") or 0) - computed["estimated_hours"]) < 1e-6
+        and abs(float(stored.get("actual_hours") or 0) - computed["actual_hours"]) < 1e-6
+        and {k: v for k, v in (stored.get("by_status") or {}).items() if v} == computed["by_status"]
+    )
+
+
+def render_stats(stats: Optional[dict], planned_hours=None) -> dict:
+    stats = stats or empty_stats()
+    estimated = round(float(stats.get("estimated_hours") or 0), 2)
+    actual = round(float(stats.get("actual_hours") or 0), 2)
+    return {
+        "task_count": int(stats.get("task_count") or 0),
+        "estimated_hours": estimated,
+        "actual_hours": actual,
+        "remaining_hours": round(max(estimated - actual, 0), 2),
+        "planned_hours": planned_hours,
+        "by_status": {k: v for k, v in (stats.get("by_status") or {}).items() if v},
+    }
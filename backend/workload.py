@@ -0,0 +1,175 @@
+"""
+Reporte de carga de trabajo y capacidad por persona.
+
+Las horas estimadas/reales de las tareas se agrupan por proyecto, asignado,
+estado y semana ISO de `due_date` con una sola agregación en MongoDB; a
+Python solo llegan los totales por grupo, no las tareas. El resultado se
+guarda por empresa y cada escritura de tareas le aplica su diferencia
+(resta el bucket anterior de la tarea y suma el nuevo), de modo que el cache
+no se recalcula en cada cambio. Como cada worker tiene su propio cache, las
+escrituras suben la versión `workload` de la empresa (ver cache_versions.py)
+y los demás workers lo reconstruyen en su siguiente lectura; además se
+reconstruye completo después de `ttl_seconds`.
+"""
+import time
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from cache_versions import WORKLOAD, CacheVersions, VersionedCompanies
+from kanban_board import estimated_hours
+
+NO_WEEK = "sin_fecha"
+DONE_STATUSES = ("done", "Completada")
+
+# (project_id, assigned_to, status, week) -> [tareas, horas estimadas, horas reales]
+Bucket = Tuple[Optional[str], Optional[str], Optional[str], str]
+
+
+def week_key(due_date) -> str:
+    """ISO week of a YYYY-MM-DD... string, matching the aggregation below"""
+    if not isinstance(due_date, str):
+        return NO_WEEK
+    try:
+        year, week, _ = datetime.strptime(due_date[:10], "%Y-%m-%d").isocalendar()
+    except ValueError:
+        return NO_WEEK
+    return f"{year}-W{week:02d}"
+
+
+def bucket_of(task: dict) -> Bucket:
+    return (task.get("project_id"), task.get("assigned_to"), task.get("status"), week_key(task.get("due_date")))
+
+
+def _due_date_expr():
+    # Misma regla que week_key: solo strings, primeros 10 caracteres, null si no es fecha
+    return {"$cond": [
+        {"$eq": [{"$type": "$due_date"}, "string"]},
+        {"$dateFromString": {"dateString": {"$substrCP": ["$due_date", 0, 10]}, "format": "%Y-%m-%d", "onError": None, "onNull": None}},
+        None
+    ]}
+
+
+def workload_pipeline(project_ids: List[str]) -> List[dict]:
+    return [
+        {"$match": {"project_id": {"$in": project_ids}}},
+        {"$project": {
+            "_id": 0,
+            "project_id": 1,
+            "assigned_to": 1,
+            "status": 1,
+            "estimated": {"$ifNull": ["$estimated_hours", {"$divide": [{"$ifNull": ["$estimated_minutes", 0]}, 60]}]},
+            "actual": {"$ifNull": ["$actual_hours", 0]},
+            "due": _due_date_expr(),
+        }},
+        {"$group": {
+            "_id": {
+                "project_id": "$project_id",
+                "assigned_to": "$assigned_to",
+                "status": "$status",
+                "year": {"$isoWeekYear": "$due"},
+                "week": {"$isoWeek": "$due"},
+            },
+            "count": {"$sum": 1},
+            "estimated": {"$sum": "$estimated"},
+            "actual": {"$sum": "$actual"},
+        }},
+    ]
+
+
+class WorkloadReports:
+    def __init__(self, ttl_seconds: float = 300, versions: Optional[CacheVersions] = None):
+        self.ttl_seconds = ttl_seconds
+        # company_id -> (expira, generado, buckets)
+        self._cache: Dict[str, Tuple[float, str, Dict[Bucket, List[float]]]] = {}
+        self._versions = VersionedCompanies(versions, WORKLOAD)
+
+    async def buckets(self, db, company_id: str, project_ids: List[str]) -> Tuple[str, Dict[Bucket, List[float]]]:
+        if not await self._versions.check(db, company_id):
+            self._cache.pop(company_id, None)
+        cached = self._cache.get(company_id)
+        now = time.monotonic()
+        if cached and cached[0] > now:
+            return cached[1], cached[2]
+
+        rows = await db.tasks.aggregate(workload_pipeline(project_ids)).to_list(None) if project_ids else []
+        buckets: Dict[Bucket, List[float]] = {}
+        for row in rows:
+            key = row["_id"]
+            week = f"{key['year']}-W{key['week']:02d}" if key.get("year") is not None else NO_WEEK
+            bucket = (key.get("project_id"), key.get("assigned_to"), key.get("status"), week)
+            buckets[bucket] = [row["count"], float(row["estimated"] or 0), float(row["actual"] or 0)]
+        generated_at = datetime.now(timezone.utc).isoformat()
+        self._cache[company_id] = (now + self.ttl_seconds, generated_at, buckets)
+        return generated_at, buckets
+
+    def apply(self, company_id: Optional[str], changes: Iterable[tuple]):
+        """Move the given (old_task, new_task) pairs between buckets of a cached report"""
+        cached = self._cache.get(company_id)
+        if cached is None:
+            return
+        buckets = cached[2]
+        for old, new in changes:
+            for task, sign in ((old, -1), (new, 1)):
+                if task is None:
+                    continue
+                values = buckets.setdefault(bucket_of(task), [0, 0.0, 0.0])
+                values[0] += sign
+                values[1] += sign * estimated_hours(task)
+                values[2] += sign * float(task.get("actual_hours") or 0)
+                if values[0] <= 0:
+                    buckets.pop(bucket_of(task), None)
+
+    def invalidate(self, company_id: Optional[str]):
+        self._cache.pop(company_id, None)
+
+    @staticmethod
+    def report(buckets: Dict[Bucket, List[float]], names: Dict[str, str], capacity_hours: float,
+               project_id: Optional[str] = None, user_id: Optional[str] = None) -> dict:
+        def empty():
+            return {"task_count": 0, "estimated_hours": 0.0, "actual_hours": 0.0, "open_estimated_hours": 0.0}
+
+        def add(target, count, estimated, actual, is_open):
+            target["task_count"] += count
+            target["estimated_hours"] += estimated
+            target["actual_hours"] += actual
+            if is_open:
+                target["open_estimated_hours"] += estimated
+
+        users: Dict[Optional[str], dict] = {}
+        totals = empty()
+        for (bucket_project, assignee, status, week), (count, estimated, actual) in buckets.items():
+            if project_id and bucket_project != project_id:
+                continue
+            if user_id and assignee != user_id:
+                continue
+            is_open = status not in DONE_STATUSES
+            entry = users.get(assignee)
+            if entry is None:
+                entry = users[assignee] = {**empty(), "by_status": {}, "weeks": {}}
+            add(entry, count, estimated, actual, is_open)
+            add(totals, count, estimated, actual, is_open)
+            status_key = status or "sin_estado"
+            entry["by_status"][status_key] = entry["by_status"].get(status_key, 0) + count
+            add(entry["weeks"].setdefault(week, empty()), count, estimated, actual, is_open)
+
+        def rounded(values: dict) -> dict:
+            return {k: round(v, 2) if isinstance(v, float) else v for k, v in values.items()}
+
+        result = []
+        for assignee, entry in users.items():
+            weeks = []
+            for week, values in sorted(entry.pop("weeks").items(), key=lambda item: (item[0] == NO_WEEK, item[0])):
+                values = rounded(values)
+                if week != NO_WEEK:
+                    values["capacity_hours"] = capacity_hours
+                    values["utilization"] = round(values["open_estimated_hours"] / capacity_hours, 2)
+                weeks.append({"week": week, **values})
+            result.append({
+                "user_id": assignee,
+                "name": names.get(assignee) if assignee else "Sin asignar",
+                **rounded(entry),
+                "weeks": weeks,
+            })
+        result.sort(key=lambda u: u["open_estimated_hours"], reverse=True)
+
+        return {"capacity_hours_per_week": capacity_hours, "users": result, "totals": rounded(totals)}
@@ -123,7 +123,8 @@ Type=simple
 User=$USER
 WorkingDirectory=$BACKEND_DIR
 Environment="PATH=$BACKEND_DIR/venv/bin"
-ExecStart=$BACKEND_DIR/venv/bin/uvicorn server_multitenant:app --host 0.0.0.0 --port 8000 --workers 4
+ExecStart=$BACKEND_DIR/venv/bin/python run_production.py --port 8000 --workers 4
+TimeoutStopSec=40
 Restart=always
 RestartSec=10
 
@@ -0,0 +1,55 @@
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+
+# Importar los servidores no abre conexiones: Motor conecta de forma perezosa
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "pactum_tests")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+os.environ.setdefault("LOOP_MONITOR", "0")
+
+
+@pytest.fixture
+def db():
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+    return mongomock_motor.AsyncMongoMockClient()["pactum_tests"]
+
+
+@pytest.fixture
+def server(monkeypatch, db):
+    """server_multitenant wired to an in-memory database, with fresh per-worker caches"""
+    import server_multitenant
+    from cache_versions import CacheVersions
+    from project_access import ProjectAccessCache
+    from workload import WorkloadReports
+
+    monkeypatch.setattr(server_multitenant, "client", db.client)
+    monkeypatch.setattr(server_multitenant, "db", db)
+    monkeypatch.setattr(server_multitenant, "analytics_db", db)
+    versions = CacheVersions(check_seconds=0)
+    monkeypatch.setattr(server_multitenant, "cache_versions", versions)
+    monkeypatch.setattr(server_multitenant, "project_access", ProjectAccessCache(ttl_seconds=30, versions=versions))
+    monkeypatch.setattr(server_multitenant, "workload_reports", WorkloadReports(ttl_seconds=300, versions=versions))
+    monkeypatch.setattr(server_multitenant, "_transactions_supported", False)
+    return server_multitenant
+
+
+@pytest.fixture
+def api(server):
+    """Call the API in-process: api(method, path, user=..., **httpx kwargs) -> response"""
+    import httpx
+
+    async def call(method, path, user=None, **kwargs):
+        headers = kwargs.pop("headers", {})
+        if user is not None:
+            token = server.create_token(user["id"], user["email"], user["role"], user.get("company_id"))
+            headers["Authorization"] = f"Bearer {token}"
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+            return await http.request(method, path, headers=headers, **kwargs)
+    return call
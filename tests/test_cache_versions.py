@@ -0,0 +1,66 @@
+import asyncio
+
+from autocomplete import AutocompleteIndex
+from cache_versions import AUTOCOMPLETE, PROJECT_ACCESS, WORKLOAD, CacheVersions
+from project_access import ProjectAccessCache
+
+
+def _workers(cache_class, count=2):
+    """One cache per simulated worker, each with its own version tracker over the same database"""
+    return [cache_class(versions=CacheVersions(check_seconds=0)) for _ in range(count)]
+
+
+def test_project_access_change_in_one_worker_is_seen_by_the_other(db):
+    async def scenario():
+        await db.projects.insert_one({"id": "p1", "company_id": "c1", "assigned_users": ["u1"]})
+        first, second = _workers(ProjectAccessCache)
+        assert [p["id"] for p in await first.company(db, "c1")] == ["p1"]
+        assert [p["id"] for p in await second.assigned(db, "u1", "c1")] == ["p1"]
+
+        await db.projects.insert_one({"id": "p2", "company_id": "c1", "assigned_users": ["u1"]})
+        first.invalidate_project("c1", ["u1"])
+        await first._versions.versions.bump(db, "c1", PROJECT_ACCESS)
+
+        assert {p["id"] for p in await second.company(db, "c1")} == {"p1", "p2"}
+        assert {p["id"] for p in await second.assigned(db, "u1", "c1")} == {"p1", "p2"}
+        assert {p["id"] for p in await first.company(db, "c1")} == {"p1", "p2"}
+    asyncio.run(scenario())
+
+
+def test_bump_only_drops_the_changed_company(db):
+    async def scenario():
+        await db.projects.insert_many([{"id": "p1", "company_id": "c1"}, {"id": "p2", "company_id": "c2"}])
+        first, second = _workers(ProjectAccessCache)
+        await second.company(db, "c1")
+        await second.company(db, "c2")
+        await first._versions.versions.bump(db, "c1", PROJECT_ACCESS)
+        await second.company(db, "c1")
+        assert ("company", "c1") in second._entries
+        assert ("company", "c2") in second._entries
+        # Otro cache de la misma empresa no se entera de una versión que no es la suya
+        await first._versions.versions.bump(db, "c2", WORKLOAD)
+        cached = second._entries[("company", "c2")]
+        await second.company(db, "c2")
+        assert second._entries[("company", "c2")] is cached
+    asyncio.run(scenario())
+
+
+def test_writing_worker_keeps_its_incremental_cache(db):
+    async def scenario():
+        await db.projects.insert_one({"id": "p1", "company_id": "c1", "name": "Obra"})
+        first, second = _workers(AutocompleteIndex)
+        await first.ensure_loaded(db, "c1")
+        await second.ensure_loaded(db, "c1")
+        tenant = first._tenants["c1"]
+
+        await db.projects.insert_one({"id": "p2", "company_id": "c1", "name": "Oficina"})
+        first.upsert("c1", "projects", {"id": "p2", "company_id": "c1", "name": "Oficina"})
+        await first._versions.versions.bump(db, "c1", AUTOCOMPLETE)
+
+        await first.ensure_loaded(db, "c1")
+        assert first._tenants["c1"] is tenant
+        await second.ensure_loaded(db, "c1")
+        assert second._tenants["c1"] is not tenant
+        assert "p2" in {item["id"] for item in second.search("c1", "ofi", ["projects"], 10)["projects"]}
+    asyncio.run(scenario())
+
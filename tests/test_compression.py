@@ -0,0 +1,69 @@
+import asyncio
+import gzip
+import json
+
+import compression
+from compression import CompressionMiddleware
+
+
+def json_app(body: bytes, parts: int = 1):
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": [(b"content-type", b"application/json")]})
+        size = -(-len(body) // parts)
+        for i in range(parts):
+            await send({"type": "http.response.body", "body": body[i * size:(i + 1) * size], "more_body": i < parts - 1})
+    return app
+
+
+def call(middleware):
+    messages = []
+
+    async def receive():
+        return {"type": "http.request"}
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {"type": "http", "method": "GET", "headers": [(b"accept-encoding", b"gzip")]}
+    asyncio.run(middleware(scope, receive, send))
+    start = messages[0]
+    body = b"".join(m.get("body", b"") for m in messages[1:])
+    return dict(start["headers"]), body
+
+
+def track_threads(monkeypatch):
+    sizes = []
+    real_to_thread = asyncio.to_thread
+
+    async def to_thread(func, body, final):
+        sizes.append(len(body))
+        return await real_to_thread(func, body, final)
+
+    monkeypatch.setattr(compression.asyncio, "to_thread", to_thread)
+    return sizes
+
+
+def test_large_bodies_are_compressed_in_a_thread(monkeypatch):
+    sizes = track_threads(monkeypatch)
+    body = json.dumps([{"id": i, "title": f"Tarea {i}"} for i in range(20000)]).encode()
+    headers, out = call(CompressionMiddleware(json_app(body), thread_min_size=64 * 1024))
+    assert headers[b"content-encoding"] == b"gzip"
+    assert gzip.decompress(out) == body
+    assert sizes == [len(body)]
+
+
+def test_small_bodies_and_parts_stay_on_the_loop(monkeypatch):
+    sizes = track_threads(monkeypatch)
+    body = b'{"ok": true, "items": "' + b"x" * 4000 + b'"}'
+    headers, out = call(CompressionMiddleware(json_app(body), thread_min_size=64 * 1024))
+    assert gzip.decompress(out) == body
+    assert sizes == []
+
+
+def test_streamed_parts_use_the_thread_only_when_large(monkeypatch):
+    sizes = track_threads(monkeypatch)
+    body = b"a,b,c\n" * 60000  # 360 KB en 4 partes de 90 KB
+    headers, out = call(CompressionMiddleware(json_app(body, parts=4), thread_min_size=64 * 1024))
+    assert b"content-length" not in headers
+    assert gzip.decompress(out) == body
+    assert len(sizes) == 4
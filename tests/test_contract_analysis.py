@@ -0,0 +1,57 @@
+import asyncio
+
+from contract_analysis import COLLECTION, AnalysisCache, ContractAnalyzer, LocalStubAnalyzer, analyze_cached
+
+CONTRACT = {"id": "k1", "extracted_text": "Cláusula primera: el pago vence a 30 días."}
+
+
+class FakeModelAnalyzer(ContractAnalyzer):
+    name = "fake"
+
+    def __init__(self, model):
+        self.model = model
+        self.calls = 0
+
+    async def analyze(self, contract, question, passages=None):
+        self.calls += 1
+        return f"{self.model}: {question}"
+
+
+def test_stub_results_are_not_persisted(db):
+    async def scenario():
+        analyzer = LocalStubAnalyzer()
+        cache = AnalysisCache()
+        first, source = await analyze_cached(db, analyzer, cache, CONTRACT, "h1", "¿Cuándo vence el pago?")
+        assert source == "llm"
+        again, source = await analyze_cached(db, analyzer, cache, CONTRACT, "h1", "cuando vence el pago")
+        assert source == "memory" and again == first
+        assert await db[COLLECTION].count_documents({}) == 0
+
+    asyncio.run(scenario())
+
+
+def test_model_and_versions_are_part_of_the_key(db):
+    async def scenario():
+        old, new = FakeModelAnalyzer("gemini/a"), FakeModelAnalyzer("gemini/b")
+        result, source = await analyze_cached(db, old, AnalysisCache(), CONTRACT, "h1", "Resumen")
+        assert source == "llm"
+        stored = await db[COLLECTION].find_one({}, {"_id": 0})
+        assert (stored["analyzer"], stored["model"]) == ("fake", "gemini/a")
+
+        # Otro worker con el mismo modelo lee la respuesta guardada
+        _, source = await analyze_cached(db, FakeModelAnalyzer("gemini/a"), AnalysisCache(), CONTRACT, "h1", "Resumen")
+        assert source == "db"
+
+        # Otro modelo u otra selección de pasajes no reutilizan la respuesta vieja
+        result, source = await analyze_cached(db, new, AnalysisCache(), CONTRACT, "h1", "Resumen")
+        assert source == "llm" and result["analysis"] == "gemini/b: Resumen"
+
+        async def passages():
+            return [{"page": 1, "text": CONTRACT["extracted_text"]}]
+
+        _, source = await analyze_cached(db, new, AnalysisCache(), CONTRACT, "h1", "Resumen",
+                                         find_passages=passages, passages_version="bm25-2")
+        assert source == "llm"
+        assert await db[COLLECTION].count_documents({}) == 3
+
+    asyncio.run(scenario())
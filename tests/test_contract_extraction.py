@@ -0,0 +1,76 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import contract_extraction
+import pytest
+
+
+@pytest.fixture
+def pdf(tmp_path):
+    PyPDF2 = pytest.importorskip("PyPDF2")
+    writer = PyPDF2.PdfWriter()
+    for _ in range(25):
+        writer.add_blank_page(width=200, height=200)
+    path = tmp_path / "contrato.pdf"
+    with open(path, "wb") as f:
+        writer.write(f)
+    return str(path)
+
+
+def test_pdf_is_parsed_once_per_process(monkeypatch, pdf):
+    import PyPDF2
+
+    parsed = []
+
+    class CountingReader(PyPDF2.PdfReader):
+        def __init__(self, *args, **kwargs):
+            parsed.append(args[0])
+            super().__init__(*args, **kwargs)
+
+    monkeypatch.setattr(PyPDF2, "PdfReader", CountingReader)
+    monkeypatch.setattr(contract_extraction, "_readers", contract_extraction.OrderedDict())
+
+    assert contract_extraction.count_pages(pdf) == 25
+    texts = [contract_extraction.extract_page_range(pdf, start, start + 10) for start in range(0, 25, 10)]
+    assert [len(chunk) for chunk in texts] == [10, 10, 5]
+    assert parsed == [pdf]
+
+
+def test_reader_cache_is_bounded(monkeypatch, pdf, tmp_path):
+    monkeypatch.setattr(contract_extraction, "_readers", contract_extraction.OrderedDict())
+    paths = []
+    for i in range(contract_extraction.READER_CACHE_SIZE + 2):
+        path = tmp_path / f"copia-{i}.pdf"
+        path.write_bytes(open(pdf, "rb").read())
+        paths.append(str(path))
+        contract_extraction.count_pages(str(path))
+    assert len(contract_extraction._readers) == contract_extraction.READER_CACHE_SIZE
+    assert [key[0] for key in contract_extraction._readers] == paths[2:]
+
+
+def test_failed_extraction_leaves_no_partial_pages(monkeypatch, db):
+    def extract(file_path, start, end):
+        if start:
+            time.sleep(0.05)  # el primer tramo ya se guardó cuando falla el segundo
+            raise RuntimeError("PDF dañado")
+        return [f"página {i + 1}" for i in range(start, end)]
+
+    monkeypatch.setattr(contract_extraction, "count_pages", lambda file_path: 4)
+    monkeypatch.setattr(contract_extraction, "extract_page_range", extract)
+
+    async def scenario():
+        extractor = contract_extraction.ContractExtractor(pages_per_chunk=2)
+        extractor._pool = ThreadPoolExecutor(max_workers=2)
+        await extractor.ensure_indexes(db)
+        await db.contracts.insert_one({"id": "k1"})
+        job = await extractor.submit(db, "k1", "contrato.pdf")
+        await asyncio.gather(*extractor._jobs.values())
+        extractor._pool.shutdown()
+
+        assert await db[contract_extraction.PAGES].count_documents({"contract_id": "k1"}) == 0
+        assert (await db[contract_extraction.JOBS].find_one({"id": job["id"]}))["status"] == "failed"
+        assert (await db.contracts.find_one({"id": "k1"}))["text_status"] == "failed"
+        indexes = await db[contract_extraction.PAGES].index_information()
+        assert [("contract_id", 1), ("page", 1)] in [index["key"] for index in indexes.values()]
+    asyncio.run(scenario())
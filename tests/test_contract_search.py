@@ -0,0 +1,80 @@
+import asyncio
+
+from contract_search import BM25Index, ContractSearch, split_chunks, tokenize
+
+
+def test_tokenize_drops_accents_case_and_stopwords():
+    assert tokenize("La PENALIZACIÓN por atraso de la entrega") == ["penalizacion", "atraso", "entrega"]
+
+
+def test_split_chunks_groups_short_paragraphs():
+    text = "Primera cláusula.\n\nSegunda cláusula.\n\n\nTercera cláusula."
+    assert split_chunks(text, max_chars=40) == ["Primera cláusula.\n\nSegunda cláusula.", "Tercera cláusula."]
+
+
+def test_split_chunks_cuts_long_paragraphs_at_whitespace():
+    long_paragraph = " ".join(["palabra"] * 30)  # 239 caracteres
+    chunks = split_chunks(f"Intro.\n\n{long_paragraph}\n\nCierre.", max_chars=50)
+    assert chunks[0] == "Intro."
+    assert chunks[-1].endswith("Cierre.")
+    assert all(len(chunk) <= 50 for chunk in chunks)
+    assert all(not chunk.startswith(" ") and not chunk.endswith(" ") for chunk in chunks)
+    # No se pierde ni se parte ninguna palabra
+    assert " ".join(chunks).replace("\n\n", " ").split() == ["Intro."] + ["palabra"] * 30 + ["Cierre."]
+
+
+def test_split_chunks_without_whitespace_cuts_at_max_chars():
+    assert split_chunks("x" * 25, max_chars=10) == ["x" * 10, "x" * 10, "x" * 5]
+    assert split_chunks("  \n\n  ") == []
+
+
+def test_bm25_ranks_matching_passages_first():
+    index = BM25Index()
+    index.add("c1", 1, "El pago se realiza mensualmente por transferencia.")
+    index.add("c1", 2, "La penalización por atraso en la entrega es del 5%. La entrega se hace en obra.")
+    index.add("c1", 3, "Las partes fijan domicilio en Managua.")
+    index.add("c2", 1, "Penalización por atraso en la entrega de materiales.")
+
+    results = index.search("penalización por atraso de entrega", limit=5)
+    assert [(r["contract_id"], r["page"]) for r in results][:2] in ([("c1", 2), ("c2", 1)], [("c2", 1), ("c1", 2)])
+    assert all(r["page"] != 3 for r in results)
+    assert results == sorted(results, key=lambda r: r["score"], reverse=True)
+
+    only_c1 = index.search("penalización por atraso de entrega", contract_id="c1")
+    assert [(r["contract_id"], r["page"]) for r in only_c1] == [("c1", 2)]
+
+
+def test_bm25_rare_terms_weigh_more():
+    index = BM25Index()
+    for page in range(1, 6):
+        index.add("c1", page, f"Cláusula {page}: el contratista entrega informes.")
+    index.add("c1", 6, "Cláusula 6: el contratista responde por la garantía.")
+
+    results = index.search("contratista garantía", limit=1)
+    assert results[0]["page"] == 6
+    assert index.search("sin coincidencias") == []
+    assert BM25Index().search("garantía") == []
+
+
+def test_contract_search_indexes_pages_and_legacy_text(db):
+    async def scenario():
+        await db.contracts.insert_many([
+            {"id": "c1", "project_id": "p1", "pages_count": 2},
+            {"id": "c2", "project_id": "p1", "extracted_text": "Contrato viejo con cláusula de garantía."},
+        ])
+        await db.contract_pages.insert_many([
+            {"contract_id": "c1", "page": 1, "text": "Objeto del contrato."},
+            {"contract_id": "c1", "page": 2, "text": "La garantía cubre doce meses."},
+        ])
+        search = ContractSearch()
+        paged = await search.search(db, {"id": "c1", "project_id": "p1"}, "garantía")
+        assert [(r["page"], r["text"]) for r in paged] == [(2, "La garantía cubre doce meses.")]
+        legacy = await search.search(db, {"id": "c2", "project_id": "p1"}, "garantía")
+        assert [r["page"] for r in legacy] == [None]
+
+        await db.contract_pages.insert_one({"contract_id": "c1", "page": 3, "text": "Otra garantía adicional."})
+        assert len(await search.search(db, {"id": "c1", "project_id": "p1"}, "garantía")) == 1
+        search.invalidate("p1")
+        assert len(await search.search(db, {"id": "c1", "project_id": "p1"}, "garantía")) == 2
+
+    asyncio.run(scenario())
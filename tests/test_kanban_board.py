@@ -0,0 +1,93 @@
+import asyncio
+
+from kanban_board import COLLECTION, KanbanBoards
+
+
+async def _seed(db):
+    await db.projects.insert_one({"id": "p1", "name": "P", "company_id": "c1", "assigned_users": [], "status": "active"})
+    await db.tasks.insert_many([
+        {"id": "t1", "project_id": "p1", "title": "Uno", "status": "todo"},
+        {"id": "t2", "project_id": "p1", "title": "Dos", "status": "todo"},
+    ])
+
+
+def test_rebuild_stores_board_with_version(db):
+    async def scenario():
+        await _seed(db)
+        boards = KanbanBoards()
+        board = await boards.get(db, "p1")
+        stored = await db[COLLECTION].find_one({"project_id": "p1"})
+        assert set(board["cards"]) == {"t1", "t2"}
+        assert stored["version"] == 1
+        await boards.update_task(db, "p1", "t1", {"status": "done"})
+        stored = await db[COLLECTION].find_one({"project_id": "p1"})
+        assert stored["version"] == 2
+        assert stored["cards"]["t1"]["status"] == "done"
+    asyncio.run(scenario())
+
+
+def test_rebuild_does_not_overwrite_concurrent_patch(db):
+    async def scenario():
+        await _seed(db)
+        boards = KanbanBoards()
+        await boards.get(db, "p1")
+        snapshot = boards._snapshot
+        calls = []
+
+        async def racing_snapshot(db_, project_id):
+            board = await snapshot(db_, project_id)
+            if not calls:
+                # Una escritura llega después de que el rebuild leyó las tareas
+                await db.tasks.update_one({"id": "t2"}, {"$set": {"status": "review"}})
+                await boards.update_task(db, "p1", "t2", {"status": "review"})
+            calls.append(project_id)
+            return board
+
+        boards._snapshot = racing_snapshot
+        board = await boards.rebuild(db, "p1")
+        stored = await db[COLLECTION].find_one({"project_id": "p1"})
+        assert len(calls) == 2
+        assert board["cards"]["t2"]["status"] == "review"
+        assert stored["cards"]["t2"]["status"] == "review"
+    asyncio.run(scenario())
+
+
+def test_missing_project_removes_board(db):
+    async def scenario():
+        assert await KanbanBoards().rebuild(db, "nope") is None
+        assert await db[COLLECTION].count_documents({}) == 0
+    asyncio.run(scenario())
+
+
+def test_unique_index_and_concurrent_first_reads(db):
+    async def scenario():
+        await _seed(db)
+        # Duplicados que dejaban versiones anteriores
+        await db[COLLECTION].insert_many([{"project_id": "p1", "version": 3}, {"project_id": "p1", "version": 5}])
+        boards = KanbanBoards()
+        await boards.ensure_indexes(db)
+        assert await db[COLLECTION].count_documents({}) == 0
+
+        results = await asyncio.gather(*(boards.get(db, "p1") for _ in range(5)))
+        assert all(set(board["cards"]) == {"t1", "t2"} for board in results)
+        assert await db[COLLECTION].count_documents({"project_id": "p1"}) == 1
+    asyncio.run(scenario())
+
+
+def test_board_endpoint_checks_access_before_building(db, api):
+    async def scenario():
+        await _seed(db)
+        await db.projects.insert_one({"id": "p2", "name": "Otra", "company_id": "c2", "assigned_users": [], "status": "active"})
+        admin = {"id": "u1", "email": "a@example.com", "role": "COMPANY_ADMIN", "company_id": "c1"}
+        member = {"id": "u2", "email": "b@example.com", "role": "USER", "company_id": "c1"}
+        await db.users.insert_many([dict(admin), dict(member)])
+
+        assert (await api("GET", "/api/projects/p2/board", user=admin)).status_code == 404
+        assert (await api("GET", "/api/projects/nope/board", user=admin)).status_code == 404
+        assert (await api("GET", "/api/projects/p1/board", user=member)).status_code == 403
+        assert await db[COLLECTION].count_documents({}) == 0
+
+        response = await api("GET", "/api/projects/p1/board", user=admin)
+        assert response.status_code == 200
+        assert await db[COLLECTION].count_documents({}) == 1
+    asyncio.run(scenario())
@@ -0,0 +1,57 @@
+import asyncio
+import json
+import os
+import subprocess
+import sys
+
+from metrics import MetricsExporter, Registry, render_snapshots
+
+
+def _registry(requests, wait):
+    registry = Registry()
+    registry.counter("http_requests_total", "HTTP requests", ("route",)).inc(requests, route="/api/tasks")
+    registry.histogram("mongo_pool_wait_seconds", "Pool wait", buckets=(0.01, 0.1)).observe(wait)
+    return registry
+
+
+def test_render_snapshots_labels_each_worker():
+    text = render_snapshots({"101": _registry(3, 0.005).snapshot(), "202": _registry(5, 0.05).snapshot()})
+    assert text.count("# TYPE http_requests_total counter") == 1
+    assert 'http_requests_total{worker="101",route="/api/tasks"} 3' in text
+    assert 'http_requests_total{worker="202",route="/api/tasks"} 5' in text
+    assert 'mongo_pool_wait_seconds_bucket{worker="101",le="0.01"} 1' in text
+    assert 'mongo_pool_wait_seconds_bucket{worker="202",le="0.01"} 0' in text
+    assert 'mongo_pool_wait_seconds_count{worker="202"} 1' in text
+
+
+def test_exporter_merges_live_workers_and_drops_dead_ones(tmp_path):
+    dead = subprocess.Popen([sys.executable, "-c", "pass"])
+    dead.wait()
+    live = os.getppid()
+    (tmp_path / f"{live}.json").write_text(json.dumps(_registry(7, 0.5).snapshot()))
+    (tmp_path / f"{dead.pid}.json").write_text(json.dumps(_registry(9, 0.5).snapshot()))
+
+    exporter = MetricsExporter(_registry(2, 0.001), str(tmp_path))
+    text = asyncio.run(exporter.render())
+    assert f'http_requests_total{{worker="{os.getpid()}",route="/api/tasks"}} 2' in text
+    assert f'http_requests_total{{worker="{live}",route="/api/tasks"}} 7' in text
+    assert f'worker="{dead.pid}"' not in text
+    assert not (tmp_path / f"{dead.pid}.json").exists()
+
+
+def test_exporter_flushes_and_removes_its_file(tmp_path):
+    async def scenario():
+        exporter = MetricsExporter(_registry(1, 0.001), str(tmp_path), flush_seconds=60)
+        exporter.start()
+        await asyncio.sleep(0.05)
+        path = tmp_path / f"{os.getpid()}.json"
+        assert json.loads(path.read_text())["http_requests_total"]["values"] == [[["/api/tasks"], 1.0]]
+        await exporter.stop()
+        assert not path.exists()
+
+    asyncio.run(scenario())
+
+
+def test_single_worker_output_is_unchanged():
+    registry = _registry(4, 0.02)
+    assert asyncio.run(MetricsExporter(registry).render()) == registry.render()
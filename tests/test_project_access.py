@@ -0,0 +1,65 @@
+import asyncio
+
+from project_access import ProjectAccessCache, ProjectScope
+
+
+async def _seed(db):
+    await db.projects.insert_many([
+        {"id": "p1", "company_id": "c1", "assigned_users": ["u1"], "client_id": "cl1"},
+        {"id": "p2", "company_id": "c1", "assigned_users": []},
+        {"id": "p3", "company_id": "c2", "assigned_users": ["u1"]},
+    ])
+
+
+def _user(role, company_id="c1"):
+    return {"id": "u1", "role": role, "company_id": company_id}
+
+
+def test_visible_ids_by_role(db):
+    async def scenario():
+        await _seed(db)
+        cache = ProjectAccessCache()
+        assert sorted(await ProjectScope(db, _user("USER"), cache).visible_ids()) == ["p1", "p3"]
+        for role in ("TEAM_MEMBER", "COMPANY_ADMIN"):
+            assert sorted(await ProjectScope(db, _user(role), cache).visible_ids()) == ["p1", "p2"]
+        assert await ProjectScope(db, _user("USER"), cache).assigned_client_ids() == ["cl1"]
+    asyncio.run(scenario())
+
+
+def test_cached_sets_until_invalidated(db):
+    async def scenario():
+        await _seed(db)
+        cache = ProjectAccessCache(ttl_seconds=300)
+        scope = ProjectScope(db, _user("COMPANY_ADMIN"), cache)
+        assert sorted(await scope.company_ids()) == ["p1", "p2"]
+        assert await scope.assigned_ids() == ["p1", "p3"]
+
+        await db.projects.insert_one({"id": "p4", "company_id": "c1", "assigned_users": ["u1"]})
+        assert sorted(await scope.company_ids()) == ["p1", "p2"]
+
+        cache.invalidate_project("c1", ["u1"])
+        assert sorted(await scope.company_ids()) == ["p1", "p2", "p4"]
+        assert sorted(await scope.assigned_ids()) == ["p1", "p3", "p4"]
+    asyncio.run(scenario())
+
+
+def test_expired_entries_are_reloaded(db):
+    async def scenario():
+        await _seed(db)
+        scope = ProjectScope(db, _user("COMPANY_ADMIN"), ProjectAccessCache(ttl_seconds=0))
+        assert len(await scope.company_ids()) == 2
+        await db.projects.delete_one({"id": "p2"})
+        assert await scope.company_ids() == ["p1"]
+    asyncio.run(scenario())
+
+
+def test_entries_are_capped_least_recently_used_first(db):
+    async def scenario():
+        await _seed(db)
+        cache = ProjectAccessCache(max_entries=2)
+        await cache.assigned(db, "u1", "c1")
+        await cache.company(db, "c1")
+        await cache.assigned(db, "u1", "c1")
+        await cache.company(db, "c2")
+        assert list(cache._entries) == [("assigned", "u1"), ("company", "c2")]
+    asyncio.run(scenario())
@@ -0,0 +1,85 @@
+import asyncio
+
+import pytest
+
+from repositories import ProjectRepository, TaskRepository
+
+ADMIN = {"id": "a1", "role": "COMPANY_ADMIN", "company_id": "c1"}
+
+
+async def _seed_projects(db):
+    await db.projects.insert_many([
+        {"id": "p1", "company_id": "c1", "name": "Propio"},
+        {"id": "p2", "company_id": "c2", "name": "Ajeno"},
+        {"id": "p3", "name": "Sin empresa"},
+    ])
+
+
+def test_project_of_another_company_is_not_found(db):
+    async def scenario():
+        await _seed_projects(db)
+        repo = ProjectRepository.for_user(db, ADMIN)
+        assert (await repo.get({"id": "p1"}, "access"))["id"] == "p1"
+        assert await repo.get({"id": "p2"}, "access") is None
+        assert [p["id"] for p in await repo.list(None, "access")] == ["p1"]
+        assert await repo.count() == 1
+    asyncio.run(scenario())
+
+
+def test_handler_filter_cannot_override_the_tenant_filter(db):
+    async def scenario():
+        await _seed_projects(db)
+        repo = ProjectRepository.for_user(db, ADMIN)
+        query = {"id": "p2", "company_id": "c2"}
+        assert repo._filter(query) == {"$and": [{"company_id": "c1"}, query]}
+        assert await repo.get(query, "access") is None
+        assert await repo.get({"$or": [{"company_id": "c2"}, {"id": "p2"}]}, "access") is None
+        await repo.update(query, {"$set": {"name": "Pisado"}})
+        assert (await db.projects.find_one({"id": "p2"}))["name"] == "Ajeno"
+        await repo.delete(query)
+        assert await db.projects.count_documents({}) == 3
+    asyncio.run(scenario())
+
+
+def test_user_without_company_sees_nothing_unless_the_route_allows_every_company(db):
+    async def scenario():
+        await _seed_projects(db)
+        super_admin = {"id": "s1", "role": "SUPER_ADMIN", "company_id": None}
+        repo = ProjectRepository.for_user(db, super_admin)
+        assert await repo.get({"id": "p3"}, "access") is None
+        assert await repo.list(None, "access") == []
+        with pytest.raises(ValueError):
+            await repo.insert({"id": "p4"})
+        everything = ProjectRepository.for_user(db, super_admin, allow_all_companies=True)
+        assert await everything.count() == 3
+        # allow_all_companies solo aplica a SUPER_ADMIN
+        assert await ProjectRepository.for_user(db, ADMIN, allow_all_companies=True).count() == 1
+    asyncio.run(scenario())
+
+
+def test_reads_require_an_explicit_projection(db):
+    async def scenario():
+        await _seed_projects(db)
+        repo = ProjectRepository.for_user(db, ADMIN)
+        for projection in (None, {}, "desconocida"):
+            with pytest.raises(ValueError):
+                await repo.get({"id": "p1"}, projection)
+            with pytest.raises(ValueError):
+                await repo.list(None, projection)
+        assert "_id" not in await repo.get({"id": "p1"}, {"name": 1})
+    asyncio.run(scenario())
+
+
+def test_status_counts_are_scoped_to_the_authorized_projects(db):
+    async def scenario():
+        await db.tasks.insert_many([
+            {"id": "t1", "project_id": "p1", "status": "done"},
+            {"id": "t2", "project_id": "p1", "status": "todo"},
+            {"id": "t3", "project_id": "p1", "status": "done"},
+            {"id": "t4", "project_id": "p2", "status": "done"},
+        ])
+        assert await TaskRepository(db, ["p1"]).status_counts() == {"total": 3, "done": 2}
+        assert await TaskRepository(db, ["p1", "p2"]).status_counts() == {"total": 4, "done": 3}
+        assert await TaskRepository(db, ["p1"]).status_counts("todo") == {"total": 3, "done": 1}
+        assert await TaskRepository(db, ["p9"]).status_counts() == {"total": 0, "done": 0}
+    asyncio.run(scenario())
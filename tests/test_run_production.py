@@ -0,0 +1,21 @@
+import run_production
+from mongo_pool import MONITOR_CONNECTIONS_PER_WORKER, pool_size
+
+
+def test_budget_split_leaves_room_for_monitoring_connections(monkeypatch):
+    monkeypatch.delenv("MONGO_MAX_POOL_SIZE", raising=False)
+    monkeypatch.setenv("MONGO_CONNECTION_BUDGET", "100")
+    for workers in (1, 2, 3, 4, 7):
+        plan = run_production.connection_plan(workers)
+        assert plan["max_connections"] <= plan["budget"]
+        assert plan["max_connections"] == workers * (plan["options"]["maxPoolSize"] + MONITOR_CONNECTIONS_PER_WORKER)
+    assert pool_size({"MONGO_CONNECTION_BUDGET": "100", "WEB_CONCURRENCY": "2"}) == 48
+
+
+def test_check_fails_when_pool_plus_monitoring_exceeds_budget(monkeypatch):
+    monkeypatch.setenv("MONGO_CONNECTION_BUDGET", "100")
+    monkeypatch.setenv("MONGO_MAX_POOL_SIZE", "50")
+    args = run_production.build_parser().parse_args(["--workers", "2", "--check"])
+    assert run_production.main(args) == 1
+    args = run_production.build_parser().parse_args(["--workers", "1", "--check"])
+    assert run_production.main(args) == 0
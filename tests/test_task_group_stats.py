@@ -0,0 +1,118 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+from task_group_stats import (
+    apply_task_changes, compute_stats, delete_task_tracked, empty_stats, reconcile_stats, stat_increments,
+    update_task_tracked,
+)
+
+
+def test_stat_increments_moves_task_between_groups():
+    old = {"id": "t1", "task_group_id": "g1", "status": "todo", "estimated_hours": 3, "actual_hours": 1}
+    new = {**old, "task_group_id": "g2", "status": "done"}
+    incs = stat_increments([(old, new)])
+    assert incs["g1"] == {"stats.task_count": -1, "stats.estimated_hours": -3, "stats.actual_hours": -1, "stats.by_status.todo": -1}
+    assert incs["g2"] == {"stats.task_count": 1, "stats.estimated_hours": 3, "stats.actual_hours": 1, "stats.by_status.done": 1}
+
+
+def test_stat_increments_ignores_unrelated_changes_and_ungrouped_tasks():
+    task = {"id": "t1", "task_group_id": "g1", "status": "todo", "estimated_minutes": 90}
+    assert stat_increments([(task, {**task, "title": "Otro"})]) == {}
+    assert stat_increments([(None, {"id": "t2", "status": "todo"})]) == {}
+    assert stat_increments([(None, task)])["g1"]["stats.estimated_hours"] == 1.5
+
+
+def test_stat_increments_sanitizes_status_keys():
+    incs = stat_increments([(None, {"id": "t1", "task_group_id": "g1", "status": "$bad.key"})])
+    assert "stats.by_status.other" in incs["g1"]
+
+
+async def _seed(db):
+    await db.task_groups.insert_one({"id": "g1", "project_id": "p1", "task_ids": ["t1"], "stats": empty_stats()})
+    task = {"id": "t1", "project_id": "p1", "task_group_id": "g1", "status": "todo", "estimated_hours": 2.0}
+    await db.tasks.insert_one(dict(task))
+    await apply_task_changes(db, [(None, task)])
+    return task
+
+
+def test_concurrent_updates_take_before_state_from_the_write(db):
+    async def scenario():
+        await _seed(db)
+        # Dos requests que leyeron la tarea en "todo" antes de escribir
+        results = await asyncio.gather(
+            update_task_tracked(db, "t1", {"status": "in_progress"}),
+            update_task_tracked(db, "t1", {"status": "done"}),
+        )
+        for changes in results:
+            await apply_task_changes(db, [changes])
+        stored = (await db.task_groups.find_one({"id": "g1"}))["stats"]
+        expected = (await compute_stats(db, ["g1"]))["g1"]
+        assert stored["task_count"] == expected["task_count"] == 1
+        assert {k: v for k, v in stored["by_status"].items() if v} == expected["by_status"]
+    asyncio.run(scenario())
+
+
+def test_delete_tracked_returns_state_at_deletion(db):
+    async def scenario():
+        await _seed(db)
+        await db.tasks.update_one({"id": "t1"}, {"$set": {"estimated_hours": 5.0}})
+        deleted = await delete_task_tracked(db, "t1")
+        assert deleted["estimated_hours"] == 5.0
+        assert await delete_task_tracked(db, "t1") is None
+        assert await update_task_tracked(db, "t1", {"status": "done"}) is None
+    asyncio.run(scenario())
+
+
+def test_reconcile_repairs_drifted_stats(db):
+    async def scenario():
+        await _seed(db)
+        await db.task_groups.insert_one({"id": "g2", "project_id": "p1", "task_ids": []})
+        await db.task_groups.update_one({"id": "g1"}, {"$inc": {"stats.task_count": 3, "stats.by_status.todo": -1}})
+        assert await reconcile_stats(db) == 2
+        stored = (await db.task_groups.find_one({"id": "g1"}))["stats"]
+        assert stored["task_count"] == 1 and stored["by_status"] == {"todo": 1}
+        assert (await db.task_groups.find_one({"id": "g2"}))["stats"]["task_count"] == 0
+        assert await reconcile_stats(db) == 0
+    asyncio.run(scenario())
+
+
+def test_reconcile_does_not_overwrite_concurrent_increments(db, monkeypatch):
+    import task_group_stats
+
+    async def scenario():
+        await _seed(db)
+        await db.task_groups.update_one({"id": "g1"}, {"$inc": {"stats.task_count": 5}})
+        compute = task_group_stats.compute_stats
+        calls = []
+
+        async def racing_compute(db_, group_ids):
+            stats = await compute(db_, group_ids)
+            if not calls:
+                # Una tarea nueva llega entre la agregación y la escritura del reconciliador
+                task = {"id": "t9", "project_id": "p1", "task_group_id": "g1", "status": "todo", "estimated_hours": 2}
+                await db.tasks.insert_one(dict(task))
+                await apply_task_changes(db, [(None, task)])
+            calls.append(group_ids)
+            return stats
+
+        monkeypatch.setattr(task_group_stats, "compute_stats", racing_compute)
+        assert await reconcile_stats(db) == 1
+        assert len(calls) == 2
+        stored = (await db.task_groups.find_one({"id": "g1"}))["stats"]
+        assert stored == (await compute(db, ["g1"]))["g1"]
+        assert stored["task_count"] == 2
+    asyncio.run(scenario())
+
+
+def test_job_lease_is_held_by_one_process(db):
+    from startup_jobs import LEASES, acquire_lease
+
+    async def scenario():
+        assert await acquire_lease(db, "reconcile", 60, owner="a")
+        assert not await acquire_lease(db, "reconcile", 60, owner="b")
+        assert await acquire_lease(db, "reconcile", 60, owner="a")  # el dueño renueva
+        # Vencido: otro proceso lo toma
+        await db[LEASES].update_one({"_id": "reconcile"}, {"$set": {"expires_at": datetime.now(timezone.utc) - timedelta(seconds=1)}})
+        assert await acquire_lease(db, "reconcile", 60, owner="b")
+        assert not await acquire_lease(db, "reconcile", 60, owner="a")
+    asyncio.run(scenario())
@@ -0,0 +1,77 @@
+import asyncio
+
+from task_group_stats import apply_task_changes, empty_stats, membership_diff
+
+ADMIN = {"id": "u1", "email": "admin@example.com", "name": "Admin", "role": "COMPANY_ADMIN", "company_id": "c1"}
+
+
+def test_membership_diff_only_touches_changed_tasks():
+    assert membership_diff(["t1", "t2"], ["t1", "t2"], ["t2", "t3"]) == (["t3"], ["t1"])
+    assert membership_diff(["t1"], ["t1"], ["t1"]) == ([], [])
+
+
+def test_membership_diff_uses_tasks_pointing_at_the_group():
+    # t2 apunta al grupo pero no está en task_ids; t3 está listada pero apunta a otro grupo
+    added, removed = membership_diff(["t1", "t3"], ["t1", "t2"], ["t1", "t3"])
+    assert added == ["t3"]
+    assert removed == ["t2"]
+
+
+async def _seed(db, groups):
+    await db.users.insert_one(dict(ADMIN))
+    await db.companies.insert_one({"id": "c1", "name": "C", "status": "active"})
+    await db.projects.insert_one({"id": "p1", "name": "P", "company_id": "c1", "assigned_users": ["u1"], "status": "active"})
+    for group_id, listed in groups.items():
+        await db.task_groups.insert_one({"id": group_id, "project_id": "p1", "name": group_id, "task_ids": listed, "stats": empty_stats()})
+
+
+async def _add_task(db, task_id, group_id=None):
+    task = {"id": task_id, "project_id": "p1", "title": task_id, "status": "todo", "estimated_hours": 1.0}
+    if group_id:
+        task["task_group_id"] = group_id
+    await db.tasks.insert_one(dict(task))
+    await apply_task_changes(db, [(None, task)])
+
+
+def test_update_group_unlinks_legacy_members_missing_from_task_ids(db, api):
+    async def scenario():
+        await _seed(db, {"g1": ["t1"]})
+        await _add_task(db, "t1", "g1")
+        await _add_task(db, "t2", "g1")  # fuera de sincronía: no figura en task_ids
+
+        response = await api("PUT", "/api/task-groups/g1", user=ADMIN, json={"task_ids": ["t1"]})
+        assert response.status_code == 200
+        assert "task_group_id" not in await db.tasks.find_one({"id": "t2"})
+        stats = (await db.task_groups.find_one({"id": "g1"}))["stats"]
+        assert stats["task_count"] == 1 and stats["by_status"]["todo"] == 1
+    asyncio.run(scenario())
+
+
+def test_update_group_links_listed_tasks_that_point_elsewhere(db, api):
+    async def scenario():
+        await _seed(db, {"g1": ["t1"], "g2": ["t1"]})
+        await _add_task(db, "t1", "g2")
+
+        await api("PUT", "/api/task-groups/g1", user=ADMIN, json={"task_ids": ["t1"]})
+        assert (await db.tasks.find_one({"id": "t1"}))["task_group_id"] == "g1"
+        g1, g2 = [await db.task_groups.find_one({"id": g}) for g in ("g1", "g2")]
+        assert g2["task_ids"] == [] and g2["stats"]["task_count"] == 0
+        assert g1["stats"]["task_count"] == 1
+    asyncio.run(scenario())
+
+
+def test_create_group_pulls_tasks_from_previous_group(db, api):
+    async def scenario():
+        await _seed(db, {"g1": ["t1", "t2"]})
+        await _add_task(db, "t1", "g1")
+        await _add_task(db, "t2", "g1")
+
+        response = await api("POST", "/api/task-groups", user=ADMIN, json={
+            "name": "Nuevo", "project_id": "p1", "task_ids": ["t1"], "total_estimated_hours": 5,
+        })
+        new_id = response.json()["id"]
+        g1, new = [await db.task_groups.find_one({"id": g}) for g in ("g1", new_id)]
+        assert g1["task_ids"] == ["t2"] and g1["stats"]["task_count"] == 1
+        assert new["stats"]["task_count"] == 1
+        assert (await db.tasks.find_one({"id": "t1"}))["task_group_id"] == new_id
+    asyncio.run(scenario())